@@ -1,30 +1,72 @@
 from __future__ import absolute_import
 
 from cobra.exc import CobraApiError, CobraCliError, HookError
-import cobra.google_drive
 from cobra.aux_stuff import rand_str, print_json
 from cobra.hooks import default_hooks_dir
+from cobra.compression import (DEFAULT_COMPRESSION, get_engine, engine_by_filename, engine_by_magic,
+    detect_engine, archive_basename, compress, compress_frames, decompress, check_program, pipe)
+from cobra.archive import (tar_member, add_bytes, extract_command, read_member, next_members, 
+    open_member_tar, read_members, host_tar, Selection, MEMBERS_INDEX_FN)
+from cobra.stream import produce, tee, hashing, IterReader, chunks_of, fan_out, RateLimit, throttle
+import cobra.manifest
+from cobra.manifest import MANIFEST_FN
+import cobra.dedup
+from cobra.catalog import Catalog, CATALOG_FN
+from cobra.cache import CacheManager
+import cobra.catalog
+from cobra.dedup import ChunkStore, CHUNKS_DIR, is_index, index_basename
+from cobra.helpers import HelperPool, HELPER_IMAGE, HELPER_MOUNT_DIR, block_device, container_limits
+from cobra.storage import open_storage, is_drive, destinations
+from cobra.retention import Policy
 
 import copy
+import hashlib
 import logging
 import asyncio
 import inspect
+import io
 import docker
 import json
 import os
 import subprocess
-from os.path import join, exists, realpath, abspath, basename, dirname, splitext
+import tarfile
+import shutil
+import sqlite3
+import tempfile
+from os.path import join, exists, realpath, abspath, basename, dirname, isfile, isdir
 from urllib.parse import urljoin
 from rich.console import Console
 from rich.table import Table, Column
 from rich import box
 from rich.progress import Progress
 from datetime import datetime, timezone
+from itertools import chain
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 DEFAULT_BASE_URL = 'unix:///var/run/docker.sock'
+# the base urls docker sdk sets for the daemon listening to the local unix socket
+LOCAL_BASE_URLS = ('http+docker://localhost', 'http+docker://localunixsocket')
 API_VERSION = '1.0'
 METADATA_FN = '...'
+# volume names can't contain '@' and dir names contain '/' so this key never clashes
+METADATA_INFO_KEY = '@cobra'
+COPY_BUFSIZE = 1024*1024
+# the directory within backup dir to keep the backups related state in
+STATE_DIR = '.cobra'
+MANIFEST_EXT = '.manifest.json'
+CHECKSUM_EXT = '.md5.json'
+# the blocks of the remote files read by ranges
+BLOCKS_DIR = 'blocks'
+# the sessions of the resumable uploads
+UPLOADS_DIR = 'uploads'
+# the remote folder catalogs
+REMOTE_DIR = 'remote'
+# the remote sub folder of the backup manifests
+MANIFESTS_DIR = 'manifests'
+# the filter prefix to exclude the names matching
+NOT_PREFIX = 'not '
 
 
 def purge(obj):
@@ -35,6 +77,19 @@ def purge(obj):
         return obj
 
 
+def _padded(size):
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def mimetype(fn):
+    if is_index(fn):
+        return 'application/json'
+
+    engine = engine_by_filename(fn)
+    # files of unknown type are pushed as gzip as before
+    return engine.mimetype if engine is not None else get_engine(DEFAULT_COMPRESSION).mimetype
+
+
 def default_backup_dir():
     fallback = join(os.getenv('HOME'), '.local/share')
     return join(os.getenv('XDG_DATA_HOME', fallback), 'cobra/backup')
@@ -45,6 +100,33 @@ def default_config_dir():
     return join(os.getenv('XDG_CONFIG_HOME', fallback), 'cobra')
 
 
+def name_matches(name, filtr):
+    '''
+    Returns whether the name includes the filter pattern or doesn't if the pattern is prepended with 'not'.
+    '''
+    if not filtr:
+        return True
+
+    if filtr.startswith(NOT_PREFIX):
+        return filtr[len(NOT_PREFIX):] not in name
+
+    return filtr in name
+
+
+def created_within(f, after=None, before=None):
+    created = datetime.fromisoformat(f['createdTime'].replace('Z', '+00:00'))
+    return (after is None or created > after.astimezone(timezone.utc)) and \
+           (before is None or created < before.astimezone(timezone.utc))
+
+
+def local_daemon(client):
+    '''
+    Returns whether the docker daemon is reached by the local unix socket, so it shares the filesystem with us.
+    '''
+    base_url = getattr(getattr(client, 'api', None), 'base_url', None)
+    return isinstance(base_url, str) and base_url in LOCAL_BASE_URLS
+
+
 def default_cache_dir():
     fallback = join(os.getenv('HOME'), '.cache')
     return join(os.getenv('XDG_CACHE_HOME', fallback), 'cobra')
@@ -64,14 +146,30 @@ class Api:
         self.__logger = logging.getLogger(__name__)
         self.__docker = gateway if gateway else docker.DockerClient(base_url=DEFAULT_BASE_URL)
         self.__hooks = hooks
+        self.__helpers = HelperPool(self.__docker)
 
 # BACKUP        
 
     def backup_build(self, include_volumes=None, exclude_volumes=None, dir_names=None, 
                      backup_basename='backup', host_backup_dir=default_backup_dir(), **kwargs):
+        '''
+        Builds the backup. Returns the full file name of the archive whichever way it's built, 
+        the streaming build returns it even if no local file is kept. The gzip build in the helper 
+        container used to return the verbose output of tar instead.
+        '''
         upload = kwargs.get('push', False)
+        stream = kwargs.get('stream', False)
+        if stream:
+            if not upload:
+                raise CobraCliError('Streaming build uploads the backup while building: --push option missing')
+            kwargs['backends'] = self.__storages(**kwargs)
+
+        dedup = kwargs.get('dedup', False)
+        seekable = kwargs.get('seekable', False)
+        if dedup and (stream or kwargs.get('parallel') or seekable):
+            raise CobraCliError('Deduplicated build can not be combined with --stream, --parallel or --seekable')
+
         volumes = self.volumes_list(include_volumes, exclude_volumes)
-        docker = self.__docker
         
         utcnow = datetime.now(timezone.utc)
         backup_name = f'{backup_basename}@{utcnow:%Y%m%d.%H%M%S}'
@@ -99,39 +197,89 @@ class Api:
             metadata |= copy.deepcopy(extra_vopts)
 
         volume_opts |= extra_vopts
-        backup_archive_fn = f'{backup_name}.tar.gz'
+        compression = kwargs.get('compression') or DEFAULT_COMPRESSION
+        level = kwargs.get('compress_level')
+        engine = get_engine(compression)
+        # seekable archive is made of the parts built by frames
+        parallel = kwargs.get('parallel') or (1 if seekable else None)
+        # parallel build produces plain tar of separately compressed parts
+        backup_archive_fn = f'{backup_name}{get_engine("none").ext if parallel else engine.ext}'
+        if dedup:
+            backup_archive_fn = f'{backup_name}{cobra.dedup.INDEX_EXT}'
         os.makedirs(host_backup_dir, exist_ok=True)
         for v in volumes:
             metadata[v.name]['driver'] = v.attrs['Driver']
             metadata[v.name]['options'] = v.attrs['Options']
             metadata[v.name]['labels'] = v.attrs['Labels']
 
-        metadata_fn = join(host_backup_dir, METADATA_FN)
-        with open(metadata_fn, 'w') as mdf:
-            json.dump(metadata, mdf)
-
+        metadata[METADATA_INFO_KEY] = dict(version=API_VERSION, compression=compression, level=level)
+        if dedup:
+            # the chunks are compressed separately by zlib
+            metadata[METADATA_INFO_KEY].update(format='dedup', compression='zlib')
+        if seekable:
+            metadata[METADATA_INFO_KEY]['seekable'] = True
+        incremental = kwargs.get('incremental', False) or kwargs.get('base') is not None
+        base_files = None
+        if incremental:
+            base_fn, base_files = self.__base_manifest(host_backup_dir, backup_basename, kwargs.get('base'))
+            if base_fn:
+                metadata[METADATA_INFO_KEY]['base'] = base_fn
+
+        host_paths = self.__host_paths(volumes, extra_vopts, **kwargs)
+        # nothing to start the container for if all the sources are read on the host
+        host_read = len(host_paths) == len(volumes) + len(extra_vopts) and \
+            (engine.program is None or shutil.which(engine.program) is not None)
+        # the warm helpers are only read, the compression is done on the host
+        warm = kwargs.get('warm_helpers', False)
+        limits = self.__helper_limits([v.attrs.get('Mountpoint') for v in volumes] + list(extra_vopts), **kwargs)
+        read_limit = RateLimit(kwargs['max_read_rate']) if kwargs.get('max_read_rate') else None
+        kwargs['upload_limit'] = self.__upload_limit(**kwargs)
         self.__call_hook('before_build', backup_dir=host_backup_dir, 
                          filename=backup_archive_fn, docker=self.__docker)
 
-        container_backup_archive_fn = join('/backup', backup_archive_fn)
-        command=['sh', '-c', f'mv /backup/{METADATA_FN} {container_backup_dir} && tar -czvf {container_backup_archive_fn} {container_backup_dir}']
-        rv = docker.containers.run('busybox', remove=True, volumes=volume_opts, command=command)
+        if compression == 'gzip' and not parallel and not stream and not incremental and not dedup \
+                and not host_read and not warm:
+            with self.__helpers.limited(limits):
+                rv = self.__build_in_container(host_backup_dir, backup_archive_fn, container_backup_dir, 
+                                               volume_opts, metadata, level)
+        else:
+            del volume_opts[host_backup_dir]
+            files = dict()
+            offsets = dict()
+            with self.__helpers.limited(limits):
+                chunks = self.__archive_chunks(host_backup_dir, container_backup_dir, volume_opts, metadata, 
+                                               'none' if dedup else compression, None if dedup else level, 
+                                               parallel, files, base_files, offsets, host_paths, warm, read_limit)
+                if dedup:
+                    rv = self.__write_index(chunks, host_backup_dir, backup_archive_fn, level)
+                elif stream:
+                    rv = self.__push_stream(chunks, host_backup_dir, backup_archive_fn, **kwargs)
+                else:
+                    rv = self.__write_archive(chunks, join(host_backup_dir, backup_archive_fn))
+
+            manifest = dict(files=files, deleted=cobra.manifest.deleted(files, base_files))
+            if metadata[METADATA_INFO_KEY].get('base'):
+                manifest['base'] = metadata[METADATA_INFO_KEY]['base']
+            if offsets:
+                manifest['offsets'] = offsets
+            cobra.manifest.save(join(host_backup_dir, STATE_DIR, f'{backup_archive_fn}{MANIFEST_EXT}'), manifest)
+            self.__catalog_add(host_backup_dir, backup_archive_fn, manifest)
 
         self.__call_hook('after_build', backup_dir=host_backup_dir, 
                          filename=backup_archive_fn, docker=self.__docker)
 
-        if upload:
+        if upload and not stream:
             self.__backup_push(host_backup_dir, backup_archive_fn, **kwargs)
 
-        return str(rv, encoding='utf-8')
+        return rv
 
 
     def backup_push(self, files, creds, folder_id, backup_dir=default_backup_dir(), **kwargs):
-        self.__check_remote_args(creds, folder_id)
+        backends = self.__storages(creds, folder_id, **kwargs)
 
         backup_dir = realpath(abspath(backup_dir))
         if not files:
-            files = [join(backup_dir, fn) for fn in os.listdir(backup_dir)]
+            files = [join(backup_dir, fn) for fn in os.listdir(backup_dir) if not fn.startswith('.')]
         else:
             tmp = list()
             for fn in files:
@@ -141,60 +289,94 @@ class Api:
                     tmp.append(join(backup_dir, fn))
             files = tmp
 
-        for fn in files:
-            self.__backup_push(dirname(fn), basename(fn), creds=creds, folder_id=folder_id, **kwargs)
+        if not kwargs.get('force', False):
+            # listed once for all the files
+            kwargs['remote_files'] = { backend: backend.list(backend.folder) for backend in backends }
+
+        kwargs['backends'] = backends
+        # shared by all the files pushed at a time
+        kwargs['upload_limit'] = self.__upload_limit(**kwargs)
+        jobs = kwargs.get('jobs')
+        if not jobs or jobs == 1:
+            for fn in files:
+                self.__backup_push(dirname(fn), basename(fn), creds=creds, folder_id=folder_id, **kwargs)
+            return
+
+        self.__push_concurrently(files, creds=creds, folder_id=folder_id, **kwargs)
 
 
     def backup_pull(self, creds, file_id, latest=False, folder_id=None,
                     restore=False, cache_dir=default_cache_dir(), **kwargs):
         if latest:
-            self.__check_remote_args(creds, folder_id)
-            files = cobra.google_drive.folder_list(creds, folder_id)
+            backend = self.__storage(creds, folder_id, **kwargs)
+            files = self.__remote_list(backend, latest=True, cache_dir=cache_dir, **kwargs)
             if not files:
                 print('No files found')
                 return
 
             file_id = files[-1]['id']
-
-        self.__check_remote_args1(creds, file_id)
+        else:
+            if is_drive(kwargs.get('storage')):
+                self.__check_remote_args1(creds, file_id)
+            elif not file_id:
+                raise CobraCliError('File id must be specified: --file-id option missing')
+            backend = open_storage(kwargs.get('storage'), creds, folder_id, kwargs.get('endpoint_url'))
+
+        kwargs['backend'] = backend
+        if folder_id:
+            folder_id = backend.folder
         
         cache_dir = realpath(abspath(cache_dir))
         os.makedirs(cache_dir, exist_ok=True)
-        use_cache = not kwargs.get('no_cache', False)
-        gen = cobra.google_drive.download_file(creds, file_id, cache_dir, use_cache=use_cache)
-        fn = next(gen)
-        self.__call_hook('before_pull', cache_dir=cache_dir, filename=file_id, docker=self.__docker)
-        with Progress() as p:
-            task = p.add_task(f'[white]{fn}', total=100)
-            try:
-                while True:
-                    status = next(gen)
-                    if kwargs.get('print', False):
-                        p.update(task, completed=status.progress() * 100)
-            except StopIteration as e:
-                fn = e.value
-
-            p.update(task, completed=100)
-    
-        self.__call_hook('after_pull', cache_dir=cache_dir, filename=fn, docker=self.__docker)
+        with CacheManager(cache_dir, kwargs.get('cache_size')) as cache, \
+                self.__helpers.limited(self.__helper_limits([cache_dir], **kwargs) if restore else None):
+            rv = self.__backup_pull(creds, file_id, folder_id, restore, cache_dir, cache=cache, **kwargs)
+            cache.evict()
+            return rv
+
+
+    def __backup_pull(self, creds, file_id, folder_id, restore, cache_dir, **kwargs):
+        selection = Selection(kwargs.get('only_volume'), kwargs.get('path'))
+        backend = kwargs['backend']
+        if restore and kwargs.get('stream'):
+            fn = backend.file_name(file_id)
+            # the index is small and the chunks are cached anyway
+            if not is_index(fn):
+                chunks = backend.download_stream(file_id)
+                return self.__restore_stream(self.__decompress_stream(chunks, fn), fn, cache_dir, selection)
+        elif restore and selection:
+            remote = backend.open(file_id, join(cache_dir, STATE_DIR, BLOCKS_DIR))
+            # only the plain tar is read by ranges, the compressed one is read from the start anyway
+            if engine_by_filename(remote.name) is get_engine('none'):
+                self.__backup_restore(remote.name, cache_dir, fileobj=remote, folder_id=folder_id, creds=creds, **kwargs)
+                self.__logger.info(f'Fetched [{remote.fetched}] bytes of [{remote.name}]')
+                return join(cache_dir, remote.name)
+
+        fn = self.__pull(file_id, cache_dir, folder_id=folder_id, **kwargs)
 
         if restore:
             assert fn is not None
-            self.__backup_restore(fn, cache_dir, **kwargs)
+            self.__backup_restore(fn, cache_dir, folder_id=folder_id, creds=creds, **kwargs)
 
         return fn
 
 
     def backup_restore(self, file, cache_dir=default_cache_dir(), **kwargs):
-        return self.__backup_restore(file, cache_dir, **kwargs)
+        # the helpers read the backup extracted next to the file
+        backup_dir = dirname(realpath(abspath(file))) if file.find('/') != -1 else cache_dir
+        with CacheManager(realpath(abspath(cache_dir)), kwargs.get('cache_size')) as cache, \
+                self.__helpers.limited(self.__helper_limits([backup_dir], **kwargs)):
+            rv = self.__backup_restore(file, cache_dir, cache=cache, **kwargs)
+            cache.evict()
+            return rv
 
 
     def backup_list(self, creds, folder_id, remote, backup_dir, **kwargs):
-        # filtr = kwargs.get('filter')
         if remote:
-            self.__check_remote_args(creds, folder_id)
-
-        files = cobra.google_drive.folder_list(creds, folder_id) if remote else sorted(os.listdir(backup_dir))
+            files = self.__remote_list(self.__storage(creds, folder_id, **kwargs), **kwargs)
+        else:
+            files = sorted(fn for fn in os.listdir(backup_dir) 
+                           if not fn.startswith('.') and name_matches(fn, kwargs.get('filter')))
 
         if kwargs.get('print', False):
             self.__print_backups(files, remote, **kwargs)
@@ -202,6 +384,129 @@ class Api:
         return files
 
 
+    def backup_find(self, pattern, backup_dir=default_backup_dir(), **kwargs):
+        '''
+        Returns the files matching the glob pattern along with the backups holding them as recorded in the catalog.
+        '''
+        files = Catalog(join(abspath(backup_dir), STATE_DIR, CATALOG_FN)).find(pattern)
+        if kwargs.get('print', False):
+            self.__print_found(files, **kwargs)
+
+        return files
+
+
+    def backup_diff(self, backup_a, backup_b, backup_dir=default_backup_dir(), **kwargs):
+        '''
+        Returns the files added, removed and changed in backup_b compared to backup_a as recorded in the catalog.
+        '''
+        catalog = Catalog(join(abspath(backup_dir), STATE_DIR, CATALOG_FN))
+        files = list()
+        for name in (basename(backup_a), basename(backup_b)):
+            backup_files = catalog.files(name)
+            if backup_files is None:
+                raise CobraApiError(f'Backup not found in the catalog [{name}]. Try backup reindex')
+            files.append(backup_files)
+
+        rv = cobra.catalog.diff(*files)
+        if kwargs.get('print', False):
+            if kwargs.get('json', False):
+                print_json(rv)
+            else:
+                lines = chain((f'+ {k}' for k in rv['added']), (f'- {k}' for k in rv['removed']), 
+                              (f'~ {k}' for k in rv['changed']))
+                print('\n'.join(sorted(lines, key=lambda l: l[2:])))
+
+        return rv
+
+
+    def backup_reindex(self, backup_dir=default_backup_dir(), remote=False, creds=None, folder_id=None, **kwargs):
+        '''
+        Rebuilds the catalog from the manifests kept in the backup dir. If remote is given the manifests 
+        pushed along with the backups are pulled first. Returns the list of the backups cataloged.
+        '''
+        state_dir = join(abspath(backup_dir), STATE_DIR)
+        if remote:
+            backend = self.__storage(creds, folder_id, **kwargs)
+            manifests_folder_id = backend.ensure_folder(backend.folder, MANIFESTS_DIR)
+            os.makedirs(state_dir, exist_ok=True)
+            for fn, file_id in backend.names_list(manifests_folder_id).items():
+                if fn.endswith(MANIFEST_EXT) and not exists(join(state_dir, fn)):
+                    with open(join(state_dir, fn), 'wb') as f:
+                        f.write(backend.download_bytes(file_id))
+
+        catalog = Catalog(join(state_dir, CATALOG_FN))
+        catalog.clear()
+        manifests = sorted(fn for fn in os.listdir(state_dir) if fn.endswith(MANIFEST_EXT)) if exists(state_dir) else list()
+        for fn in manifests:
+            manifest = cobra.manifest.load(join(state_dir, fn))
+            catalog.add(fn[:-len(MANIFEST_EXT)], manifest, manifest.get('base'), manifest.get('offsets'))
+
+        self.__logger.info(f'Cataloged [{len(manifests)}] backups')
+        return catalog.backups()
+
+
+    def backup_prune(self, backup_dir=default_backup_dir(), cache_dir=default_cache_dir(), remote=False, local=False, 
+                     cache=False, creds=None, folder_id=None, **kwargs):
+        '''
+        Removes the backups the retention policy doesn't keep from the remote folder, the backup directory
+        and the cache directory. The manifests of the backups removed go too and the catalog is updated.
+        The incremental chains are known from the catalog, so the base backups of the ones kept are kept.
+        Returns the dict of the locations to the backups removed. Nothing is removed if dry_run is given.
+        '''
+        policy = Policy(kwargs.get('keep_last'), kwargs.get('keep_daily'), kwargs.get('keep_weekly'), 
+                        kwargs.get('keep_monthly'), kwargs.get('max_total_size'))
+        if not policy:
+            raise CobraCliError('Retention policy must be specified: --keep-last, --keep-daily, --keep-weekly, '
+                                '--keep-monthly or --max-total-size option missing')
+
+        if not (remote or local or cache):
+            raise CobraCliError('Nothing to prune: --remote, --local or --cache option missing')
+
+        dry_run = kwargs.get('dry_run', False)
+        backup_dir = realpath(abspath(backup_dir))
+        catalog_fn = join(backup_dir, STATE_DIR, CATALOG_FN)
+        bases = Catalog(catalog_fn).bases() if exists(catalog_fn) else dict()
+        rv = dict()
+        if remote:
+            backend = self.__storage(creds, folder_id, **kwargs)
+            _, removed = policy.plan(backend.list(backend.folder), bases)
+            if removed and not dry_run:
+                self.__remote_prune(backend, removed)
+            rv[str(backend)] = removed
+
+        if local:
+            _, removed = policy.plan(self.__local_backups(backup_dir), bases)
+            if not dry_run:
+                for f in removed:
+                    full_fn = join(backup_dir, f['name'])
+                    for fn in (full_fn, self.__checksum_fn(full_fn), 
+                               join(backup_dir, STATE_DIR, f'{f["name"]}{MANIFEST_EXT}')):
+                        if exists(fn):
+                            os.remove(fn)
+                    if exists(catalog_fn):
+                        Catalog(catalog_fn).remove(f['name'])
+            rv[backup_dir] = removed
+
+        if cache:
+            cache_dir = realpath(abspath(cache_dir))
+            manager = CacheManager(cache_dir)
+            pinned = manager.pinned()
+            _, removed = policy.plan(self.__local_backups(cache_dir), bases)
+            # the backups being restored are left alone
+            removed = [f for f in removed if f['name'] not in pinned]
+            if not dry_run:
+                removed = [f for f in removed if manager.remove(f['name'])]
+            rv[cache_dir] = removed
+
+        for location, removed in rv.items():
+            self.__logger.info(f'{"Would remove" if dry_run else "Removed"} [{len(removed)}] backups from [{location}]')
+
+        if kwargs.get('print', False):
+            self.__print_pruned(rv, **kwargs)
+
+        return rv
+
+
     def volumes_list(self, include_volumes=None, exclude_volumes=None, json=False, **kwargs):
         include_volumes = set(include_volumes) if include_volumes is not None else set()
         exclude_volumes = set(exclude_volumes) if exclude_volumes is not None else set()
@@ -222,6 +527,30 @@ class Api:
         return volumes
 
 
+    def helpers_list(self, **kwargs):
+        '''
+        Returns the warm helper containers kept running by the runs with --warm-helpers.
+        '''
+        helpers = self.__helpers.helpers()
+        if kwargs.get('print', False):
+            for container in helpers:
+                print(f'{container.name}\t{container.status}')
+
+        return helpers
+
+
+    def helpers_prune(self, **kwargs):
+        '''
+        Removes the warm helper containers releasing the volumes they have mounted.
+        '''
+        names = self.__helpers.prune()
+        if kwargs.get('print', False):
+            for name in names:
+                print(name)
+
+        return names
+
+
     def init_hooks(self, hooks_dir=default_hooks_dir(), **kwargs):
         if not self.__hooks:
             return
@@ -244,7 +573,441 @@ class Api:
         return self.__hooks(hook_name, **kwargs)
 
 
-    def __backup_restore(self, file_name, cache_dir, **kwargs):
+    def __remote_list(self, backend, latest=False, **kwargs):
+        '''
+        Returns the remote files matching the filter, after and before options ordered by creation time.
+        The catalog kept in the cache directory is used unless no_cache is given, 
+        otherwise the folder is listed filtering on the server side as much as possible.
+        '''
+        filtr = kwargs.get('filter')
+        after, before = kwargs.get('after'), kwargs.get('before')
+        cache_dir = kwargs.get('cache_dir')
+        if cache_dir and not kwargs.get('no_cache', False):
+            files = backend.files(backend.folder, join(cache_dir, STATE_DIR, REMOTE_DIR))
+        else:
+            exclude = filtr[len(NOT_PREFIX):] if filtr and filtr.startswith(NOT_PREFIX) else None
+            files = backend.list(backend.folder, exclude=exclude, after=after, before=before, 
+                                 latest=latest and not filtr)
+
+        if filtr or after or before:
+            files = [f for f in files if name_matches(f['name'], filtr) and created_within(f, after, before)]
+
+        return files[-1:] if latest else files
+
+
+    def __remote_prune(self, backend, removed):
+        '''
+        Deletes the backups from the storage along with their manifests by as few requests as the storage allows.
+        '''
+        manifests = backend.names_list(backend.ensure_folder(backend.folder, MANIFESTS_DIR))
+        file_ids = [f['id'] for f in removed]
+        file_ids.extend(manifests[n] for n in (f'{f["name"]}{MANIFEST_EXT}' for f in removed) if n in manifests)
+        backend.delete(file_ids)
+
+
+    def __local_backups(self, local_dir):
+        if not exists(local_dir):
+            return list()
+
+        return [dict(name=fn, size=os.stat(join(local_dir, fn)).st_size) for fn in sorted(os.listdir(local_dir)) 
+                if not fn.startswith('.') and isfile(join(local_dir, fn))]
+
+
+    def __pull(self, file_id, cache_dir, folder_id=None, **kwargs):
+        backend = kwargs['backend']
+        use_cache = not kwargs.get('no_cache', False)
+        cache = kwargs.get('cache')
+        gen = backend.download_file(file_id, cache_dir, use_cache=use_cache, connections=kwargs.get('connections'), 
+                                    reserve=cache.reserve if cache else None)
+        fn = next(gen)
+        self.__call_hook('before_pull', cache_dir=cache_dir, filename=file_id, docker=self.__docker)
+        with Progress() as p:
+            task = p.add_task(f'[white]{fn}', total=100)
+            try:
+                while True:
+                    status = next(gen)
+                    if kwargs.get('print', False):
+                        p.update(task, completed=status.progress() * 100)
+            except StopIteration as e:
+                fn = e.value
+
+            p.update(task, completed=100)
+
+        if cache:
+            cache.pin(fn)
+            cache.touch(fn)
+
+        if is_index(fn):
+            self.__pull_chunks(backend, file_id, fn, cache_dir, folder_id)
+    
+        self.__call_hook('after_pull', cache_dir=cache_dir, filename=fn, docker=self.__docker)
+        return fn
+
+
+    def __pull_chunks(self, backend, file_id, fn, cache_dir, folder_id):
+        '''
+        Downloads the chunks referenced by the index that are not in the cache yet.
+        '''
+        if not folder_id:
+            folder_id = backend.parent(file_id)
+
+        chunk_store = ChunkStore(join(cache_dir, STATE_DIR, CHUNKS_DIR))
+        index = cobra.dedup.read_index(fn)['chunks']
+        digests = cobra.dedup.missing([chunk_store], index)
+        if not digests:
+            return
+
+        chunks_folder_id = backend.ensure_folder(folder_id, CHUNKS_DIR)
+        remote = backend.names_list(chunks_folder_id)
+        for d in digests:
+            if d not in remote:
+                raise CobraApiError(f'Chunk not found in the remote folder [{d}]')
+
+            chunk_store.put_compressed(d, backend.download_bytes(remote[d]))
+
+        self.__logger.info(f'Downloaded {len(digests)} of {len(set(d for d, _ in index))} chunks')
+
+
+    def __build_in_container(self, host_backup_dir, backup_archive_fn, container_backup_dir, 
+                             volume_opts, metadata, level):
+        metadata_fn = join(host_backup_dir, METADATA_FN)
+        with open(metadata_fn, 'w') as mdf:
+            json.dump(metadata, mdf)
+
+        container_backup_archive_fn = join('/backup', backup_archive_fn)
+        if level is None:
+            tar = f'tar -czvf {container_backup_archive_fn} {container_backup_dir}'
+        else:
+            tar = f'tar -cvf - {container_backup_dir} | gzip -{level} > {container_backup_archive_fn}'
+
+        command=['sh', '-c', f'mv /backup/{METADATA_FN} {container_backup_dir} && {tar}']
+        rv = self.__helpers.run(volume_opts, command)
+        self.__logger.debug(str(rv, encoding='utf-8'))
+        return join(host_backup_dir, backup_archive_fn)
+
+
+    def __archive_chunks(self, host_backup_dir, container_backup_dir, volume_opts, 
+                         metadata, compression, level, parallel, files, base_files, offsets=None, host_paths=None, 
+                         warm=False, read_limit=None):
+        engine = get_engine(compression)
+        if engine.program:
+            check_program(engine.program)
+
+        host_paths = host_paths if host_paths else dict()
+        if parallel:
+            return produce(lambda f: self.__write_parts(f, host_backup_dir, container_backup_dir, volume_opts, 
+                                                        metadata, compression, level, parallel, files, base_files, 
+                                                        offsets, host_paths, warm, read_limit))
+
+        return self.__host_chunks(container_backup_dir, volume_opts, metadata, compression, level, 
+                                  files, base_files, host_paths, warm, read_limit)
+
+
+    def __host_paths(self, volumes, dir_opts, **kwargs):
+        '''
+        Returns the dict of the volume names and the directories to their paths this process is able to read 
+        straight from the host filesystem. Those are the directories and the mount points of the local driver 
+        volumes without options as the ones with options e.g. nfs are mounted only while some container uses them.
+        Nothing is read on the host if the docker daemon is remote or --no-host-read is given.
+        '''
+        if kwargs.get('no_host_read') or not local_daemon(self.__docker):
+            return dict()
+
+        paths = { v.name: v.attrs.get('Mountpoint') for v in volumes 
+                  if v.attrs.get('Driver') == 'local' and not v.attrs.get('Options') }
+        paths |= { full_dir: full_dir for full_dir in dir_opts }
+        return { key: path for key, path in paths.items() 
+                 if path and isdir(path) and os.access(path, os.R_OK | os.X_OK) }
+
+
+    def __host_chunks(self, container_backup_dir, volume_opts, metadata, compression, level, files, base_files, 
+                      host_paths=None, warm=False, read_limit=None):
+        '''
+        Streams the tar of the mounted volumes out of the helper container and compresses it 
+        on the host with the program that is able to utilize all the cores. If all the volumes and the directories 
+        are readable on the host the tar is made right here without the container.
+        The metadata is always the first archive member and the manifest is the last one.
+        '''
+        root = basename(container_backup_dir)
+        metadata_member = tar_member(join(root, METADATA_FN), json.dumps(metadata).encode('utf-8'))
+        host_paths = host_paths if host_paths else dict()
+        host_read = all(key in host_paths for key in volume_opts)
+        helper_dir = HELPER_MOUNT_DIR if warm else container_backup_dir
+        helper = nullcontext() if host_read else \
+            self.__helpers.acquire(self.__helper_volumes(volume_opts, helper_dir), warm)
+        with helper as container:
+            if container is None:
+                self.__logger.info(f'Reading {sorted(volume_opts)} on the host')
+                sources = { basename(opts['bind']): host_paths[key] for key, opts in volume_opts.items() }
+                bits = produce(lambda f: host_tar(f, sources, root, COPY_BUFSIZE))
+            else:
+                bits = self.__helpers.archive(container, helper_dir, warm)
+            bits = throttle(bits, read_limit)
+            # the warm helper mount dir is the root of its tar
+            scanned = produce(lambda f: cobra.manifest.scan(bits, f, files, base_files, strip=True, 
+                                                            manifest_name=join(root, MANIFEST_FN), root=root))
+            yield from compress(chain((metadata_member,), scanned), compression, level)
+
+
+    def __helper_limits(self, paths, **kwargs):
+        '''
+        Returns the container options limiting the helpers by --cpu-quota, --io-weight and --max-read-rate.
+        The read rate applies to the block devices of the paths the helpers read, they are only known 
+        if the docker daemon is local.
+        '''
+        io_weight = kwargs.get('io_weight')
+        if io_weight is not None and not 10 <= io_weight <= 1000:
+            raise CobraCliError(f'IO weight must be from 10 to 1000: [{io_weight}]')
+
+        read_rate = kwargs.get('max_read_rate')
+        devices = list()
+        if read_rate:
+            if local_daemon(self.__docker):
+                devices = sorted(set(d for d in (block_device(p) for p in paths if p) if d))
+            if not devices:
+                self.__logger.warning('The block devices read are unknown, the read rate is only limited on the host')
+
+        return container_limits(kwargs.get('cpu_quota'), io_weight, read_rate, devices)
+
+
+    def __upload_limit(self, **kwargs):
+        rate = kwargs.get('max_upload_rate')
+        return RateLimit(rate) if rate else None
+
+
+    def __helper_volumes(self, volume_opts, mount_dir):
+        '''
+        Returns the volume options with the volumes and the directories mounted under mount_dir by their bind basenames.
+        '''
+        return { key: dict(opts, bind=join(mount_dir, basename(opts['bind']))) for key, opts in volume_opts.items() }
+
+
+    def __write_parts(self, fileobj, host_backup_dir, container_backup_dir, volume_opts, 
+                      metadata, compression, level, parallel, files, base_files, offsets=None, host_paths=None, 
+                      warm=False, read_limit=None):
+        '''
+        Archives every volume and directory by its own helper container at most parallel ones at a time.
+        The ones readable on the host are archived without the container.
+        The parts are compressed separately into the temporary files and then packed into plain tar 
+        with the metadata being the first member.
+
+        @param offsets If given the members offsets in the uncompressed parts of the seekable backup are put into it
+        '''
+        engine = get_engine(compression)
+        root = basename(container_backup_dir)
+        parts = { key: f'{basename(opts["bind"])}{engine.ext}' for key, opts in volume_opts.items() }
+        metadata[METADATA_INFO_KEY].update(format='parts', parts=parts)
+        parts_dir = join(host_backup_dir, f'.{root}.parts')
+        os.makedirs(parts_dir, exist_ok=True)
+        seekable = metadata[METADATA_INFO_KEY].get('seekable', False)
+        members_index = dict()
+        errors = dict()
+        try:
+            with tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.GNU_FORMAT, bufsize=COPY_BUFSIZE) as tar:
+                add_bytes(tar, join(root, METADATA_FN), json.dumps(metadata).encode('utf-8'))
+
+                with ThreadPoolExecutor(max_workers=parallel) as executor:
+                    futures = { 
+                        executor.submit(self.__build_part, key, opts, join(parts_dir, parts[key]), 
+                                        compression, level, base_files, seekable, 
+                                        host_paths.get(key) if host_paths else None, warm, read_limit): key 
+                        for key, opts in volume_opts.items() 
+                    }
+                    for future in as_completed(futures):
+                        key = futures[future]
+                        try:
+                            part_fn, part_files, part_index = future.result()
+                        except Exception as e:
+                            self.__logger.error(f'Failed to archive [{key}]: {repr(e)}')
+                            errors[key] = e
+                            continue
+
+                        tar.add(part_fn, arcname=join(root, parts[key]))
+                        if part_index is not None:
+                            # the part data is the last one written
+                            part_index['offset'] = tar.offset - _padded(part_index['size'])
+                            members_index[parts[key]] = part_index
+                            if offsets is not None:
+                                offsets |= { k: r[0] for k, r in part_index['members'].items() }
+                        os.remove(part_fn)
+                        files |= part_files
+                        self.__logger.info(f'Archived [{key}]')
+
+                if seekable and not errors:
+                    add_bytes(tar, join(root, MEMBERS_INDEX_FN), json.dumps(members_index).encode('utf-8'))
+
+                if not errors:
+                    add_bytes(tar, join(root, MANIFEST_FN), 
+                              cobra.manifest.dumps(files, cobra.manifest.deleted(files, base_files)))
+
+            if errors:
+                raise CobraApiError(f'Failed to archive {sorted(errors)}', errors)
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+    def __write_index(self, chunks, host_backup_dir, backup_index_fn, level):
+        '''
+        Puts the content defined chunks of the tar stream into the chunk store kept in the backup dir 
+        and writes the index listing them in order. Only the chunks not stored yet take space.
+        '''
+        chunk_store = ChunkStore(join(host_backup_dir, STATE_DIR, CHUNKS_DIR))
+        index = cobra.dedup.store(chunks, chunk_store, level if level is not None else cobra.dedup.DEFAULT_LEVEL)
+        backup_index_full_fn = join(host_backup_dir, backup_index_fn)
+        cobra.dedup.write_index(backup_index_full_fn, index, name=index_basename(backup_index_fn), 
+                                version=API_VERSION, compression='zlib')
+        return backup_index_full_fn
+
+
+    def __write_archive(self, chunks, backup_archive_full_fn):
+        '''
+        Writes the archive computing its md5 on the way, so push doesn't have to read the file to compare it 
+        with the remote ones.
+        '''
+        digest = hashlib.md5()
+        try:
+            with open(backup_archive_full_fn, 'wb') as f:
+                for chunk in hashing(chunks, digest):
+                    f.write(chunk)
+        except BaseException:
+            if exists(backup_archive_full_fn):
+                os.remove(backup_archive_full_fn)
+            raise
+
+        self.__save_checksum(backup_archive_full_fn, digest.hexdigest())
+        return backup_archive_full_fn
+
+
+    def __checksum_fn(self, full_fn):
+        return join(dirname(full_fn), STATE_DIR, f'{basename(full_fn)}{CHECKSUM_EXT}')
+
+
+    def __save_checksum(self, full_fn, md5):
+        st = os.stat(full_fn)
+        checksum_fn = self.__checksum_fn(full_fn)
+        os.makedirs(dirname(checksum_fn), exist_ok=True)
+        with open(checksum_fn, 'w') as f:
+            json.dump(dict(md5=md5, size=st.st_size, mtime=st.st_mtime_ns), f)
+
+
+    def __saved_checksum(self, full_fn):
+        '''
+        Returns the md5 saved by the build if the file is the same since, otherwise None.
+        '''
+        checksum_fn = self.__checksum_fn(full_fn)
+        if not isfile(checksum_fn):
+            return None
+
+        st = os.stat(full_fn)
+        with open(checksum_fn) as f:
+            saved = json.load(f)
+        if saved.get('size') == st.st_size and saved.get('mtime') == st.st_mtime_ns:
+            return saved['md5']
+        return None
+
+
+    def __checksum(self, full_fn):
+        '''
+        Returns the md5 and the size of the file. The md5 saved by the build is taken if the file is the same since, 
+        otherwise it's computed and saved e.g. for the backup built in container.
+        '''
+        st = os.stat(full_fn)
+        md5 = self.__saved_checksum(full_fn)
+        if md5 is not None:
+            return md5, st.st_size
+
+        digest = hashlib.md5()
+        with open(full_fn, 'rb') as f:
+            for chunk in chunks_of(f):
+                digest.update(chunk)
+        self.__save_checksum(full_fn, digest.hexdigest())
+        return digest.hexdigest(), st.st_size
+
+
+    def __pushed(self, full_fn, remote_files, backend):
+        '''
+        Returns whether the same file is in the remote folder already judging by the name, the size and md5.
+        The storage is asked for md5 of the files it's not listed for e.g. S3 multipart uploads.
+        '''
+        same_name = [f if f.get('md5Checksum') else backend.stat(f['id'])
+                     for f in remote_files if f.get('name') == basename(full_fn)]
+        if not same_name:
+            return False
+
+        md5, size = self.__checksum(full_fn)
+        return any(f.get('md5Checksum') == md5 and int(f.get('size', -1)) == size for f in same_name)
+
+
+    def __build_part(self, key, opts, part_fn, compression, level, base_files, seekable=False, host_path=None, 
+                     warm=False, read_limit=None):
+        '''
+        Archives the volume or the directory into part_fn. The seekable part is compressed by independent frames, 
+        its index of the frames and the members offsets is returned along with the manifest files, otherwise None.
+
+        @param host_path If given the volume or the directory is read from this host path rather than by the container
+        @param warm Whether to read by the warm helper
+        @param read_limit The RateLimit the tar stream is read at, shared by the parts archived at a time
+        '''
+        files = dict()
+        offsets = dict() if seekable else None
+        frames = list()
+        helper_opts = self.__helper_volumes({ key: opts }, HELPER_MOUNT_DIR if warm else dirname(opts['bind']))
+        helper = nullcontext() if host_path else self.__helpers.acquire(helper_opts, warm)
+        with helper as container:
+            if container is None:
+                bits = produce(lambda f: host_tar(f, { basename(opts['bind']): host_path }, bufsize=COPY_BUFSIZE))
+            else:
+                bits = self.__helpers.archive(container, helper_opts[key]['bind'], warm)
+            bits = throttle(bits, read_limit)
+            scanned = produce(lambda f: cobra.manifest.scan(bits, f, files, base_files, offsets=offsets))
+            if seekable:
+                chunks = compress_frames(scanned, frames, compression, level)
+            else:
+                chunks = compress(scanned, compression, level)
+            with open(part_fn, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                size = f.tell()
+
+        part_index = dict(size=size, frames=frames, members=offsets) if seekable else None
+        return part_fn, files, part_index
+
+
+    def __base_manifest(self, host_backup_dir, backup_basename, base):
+        '''
+        Returns the base backup file name and its manifest files. If base is not given 
+        the latest backup with the same basename is taken, (None, None) if there is no such one.
+        '''
+        state_dir = join(host_backup_dir, STATE_DIR)
+        if base is None:
+            prefix = f'{backup_basename}@'
+            candidates = sorted(fn for fn in os.listdir(state_dir) 
+                                if fn.startswith(prefix) and fn.endswith(MANIFEST_EXT)) if exists(state_dir) else list()
+            if not candidates:
+                self.__logger.info('No base backup found, building full one')
+                return None, None
+
+            base_fn = candidates[-1][:-len(MANIFEST_EXT)]
+            return base_fn, cobra.manifest.load(join(state_dir, candidates[-1]))['files']
+
+        base_full_fn = realpath(abspath(base)) if base.find('/') != -1 else join(host_backup_dir, base)
+        base_fn = basename(base_full_fn)
+        manifest_fn = join(dirname(base_full_fn), STATE_DIR, f'{base_fn}{MANIFEST_EXT}')
+        if exists(manifest_fn):
+            return base_fn, cobra.manifest.load(manifest_fn)['files']
+
+        if exists(base_full_fn) and not is_index(base_fn):
+            data = read_member(base_full_fn, join(archive_basename(base_fn), MANIFEST_FN))
+            if data is not None:
+                return base_fn, cobra.manifest.loads(data)['files']
+
+        raise CobraApiError(f'Manifest of the base backup not found [{base}]')
+
+
+    def __backup_restore(self, file_name, cache_dir, fileobj=None, **kwargs):
+        '''
+        Restores the backup file. If fileobj is given the backup is read from it rather than from the file.
+        '''
         if file_name.find('/') != -1:
             file_name = realpath(abspath(file_name))
         else:
@@ -252,18 +1015,67 @@ class Api:
 
         host_backup_dir = dirname(file_name)
         basename_fn = basename(file_name)
+        cache = kwargs.get('cache')
+        if cache:
+            cache.pin(basename_fn)
+            cache.touch(basename_fn)
+
+        parallel = kwargs.get('parallel')
+        selection = Selection(kwargs.get('only_volume'), kwargs.get('path'))
+        if kwargs.get('stream'):
+            if parallel:
+                raise CobraCliError('Streaming restore can not be combined with --parallel')
+            return self.__restore_stream(self.__file_stream(file_name, cache_dir), basename_fn, 
+                                         host_backup_dir, selection)
 
         self.__call_hook('before_restore', cache_dir=host_backup_dir, 
                           filename=basename_fn, docker=self.__docker)
 
-        rv = subprocess.check_output(['tar', 'xvf', file_name, '-C', host_backup_dir])
-        backup_name, _ = splitext(splitext(basename_fn)[0])
+        rv = self.__extract(file_name, host_backup_dir, cache_dir, selection, fileobj)
+        backup_name = self.__backup_name(basename_fn)
         container_volumes_mount_dir = f'/{backup_name}'
         full_backup_archive_dir = join(host_backup_dir, backup_name)
         metadata_fn = join(full_backup_archive_dir, METADATA_FN)
         with open(metadata_fn) as f:
             metadata = json.load(f)
-        
+
+        info = metadata.pop(METADATA_INFO_KEY, dict())
+        # the selected members of the parts are extracted along with the archive
+        if info.get('format') == 'parts' and not selection:
+            self.__extract_parts(full_backup_archive_dir, info['parts'], parallel)
+
+        if info.get('base'):
+            self.__restore_base(full_backup_archive_dir, info['base'], [host_backup_dir, cache_dir], **kwargs)
+
+        if selection:
+            metadata = self.__selected_volumes(metadata, selection)
+
+        self.__create_volumes(metadata)
+        warm = kwargs.get('warm_helpers', False)
+        if parallel:
+            self.__copy_volumes(metadata, host_backup_dir, backup_name, parallel, warm)
+        else:
+            mount_dir = HELPER_MOUNT_DIR if warm else container_volumes_mount_dir
+            # the one-shot helper mounts the volumes where the metadata tells
+            volume_opts = self.__helper_volumes(metadata, mount_dir) if warm else metadata
+            volume_opts[host_backup_dir] = dict(bind='/backup', mode='ro')
+            container_backup_archive_dir = join('/backup', backup_name, '*')
+            command=['sh', '-c', f'cp -rf {container_backup_archive_dir} {mount_dir}']
+            self.__helpers.run(volume_opts, command, warm)
+
+        self.__call_hook('after_restore', cache_dir=host_backup_dir, 
+                         filename=basename_fn, docker=self.__docker)
+
+        if not kwargs.get('keep_extracted', False):
+            shutil.rmtree(full_backup_archive_dir, ignore_errors=True)
+
+        return rv
+
+
+    def __create_volumes(self, metadata):
+        '''
+        Creates the volumes and the directories listed in metadata turning it into the volume options to restore with.
+        '''
         for vol_name, meta in metadata.items():
             if vol_name.find('/') != -1:
                 os.makedirs(vol_name, exist_ok=True)
@@ -274,15 +1086,294 @@ class Api:
                                              labels=meta['labels'], driver_opts=meta['options'])
                 del meta['driver'], meta['labels'], meta['options']
 
-        metadata[host_backup_dir] = dict(bind='/backup', mode='ro')
-        container_backup_archive_dir = join('/backup', backup_name, '*')
-        command=['sh', '-c', f'cp -rf {container_backup_archive_dir} {container_volumes_mount_dir}']
-        self.__docker.containers.run('busybox', remove=True, volumes=metadata, command=command)
 
-        self.__call_hook('after_restore', cache_dir=host_backup_dir, 
+    def __copy_volumes(self, metadata, host_backup_dir, backup_name, parallel, warm=False):
+        '''
+        Copies every volume and directory by its own helper container at most parallel ones at a time.
+        '''
+        errors = dict()
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = { 
+                executor.submit(self.__copy_volume, key, opts, host_backup_dir, backup_name, warm): key 
+                for key, opts in metadata.items() 
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    self.__logger.error(f'Failed to restore [{key}]: {repr(e)}')
+                    errors[key] = e
+                    continue
+
+                self.__logger.info(f'Restored [{key}]')
+
+        if errors:
+            raise CobraApiError(f'Failed to restore {sorted(errors)}', errors)
+
+
+    def __copy_volume(self, key, opts, host_backup_dir, backup_name, warm=False):
+        mount_dir = HELPER_MOUNT_DIR if warm else f'/{backup_name}'
+        volume_opts = self.__helper_volumes({ key: opts }, mount_dir) if warm else { key: opts }
+        volume_opts[host_backup_dir] = dict(bind='/backup', mode='ro')
+        src = join('/backup', backup_name, basename(opts['bind']))
+        command=['sh', '-c', f'cp -rf {src} {mount_dir}']
+        self.__helpers.run(volume_opts, command, warm)
+
+
+    def __restore_stream(self, chunks, basename_fn, hook_dir, selection):
+        '''
+        Restores the uncompressed tar stream right into the volumes without writing it to disk.
+        The metadata member is read first to create the volumes, then the rest of the members are 
+        passed to the helper container having all the volumes mounted.
+        '''
+        self.__call_hook('before_restore', cache_dir=hook_dir, 
+                          filename=basename_fn, docker=self.__docker)
+
+        backup_name = self.__backup_name(basename_fn)
+        with tarfile.open(fileobj=IterReader(chunks), mode='r|') as tar:
+            metadata, leading = self.__stream_metadata(tar, backup_name)
+            info = metadata[METADATA_INFO_KEY] if METADATA_INFO_KEY in metadata else dict()
+            if info.get('base'):
+                raise CobraApiError('Incremental backup can not be restored in streaming mode, restore it without --stream')
+
+            volumes = self.__selected_volumes(metadata, selection)
+            self.__create_volumes(volumes)
+            with self.__helpers.acquire(volumes) as container:
+                container.put_archive('/', produce(lambda f: self.__copy_members(tar, f, backup_name, selection, 
+                                                                                 leading, metadata)))
+
+        self.__call_hook('after_restore', cache_dir=hook_dir, 
                          filename=basename_fn, docker=self.__docker)
 
-        return rv
+        return volumes
+
+
+    def __selected_volumes(self, metadata, selection):
+        '''
+        Returns the metadata of the volumes and the directories to restore without the backup info.
+        '''
+        selection.bind(metadata)
+        volumes = { key: opts for key, opts in metadata.items() 
+                    if key != METADATA_INFO_KEY and selection.match_volume(basename(opts['bind'])) }
+        if not volumes:
+            raise CobraApiError('Nothing to restore, check --only-volume and --path options')
+
+        return volumes
+
+
+    def __stream_metadata(self, tar, backup_name):
+        '''
+        Returns the metadata and the directory members preceding it.
+        '''
+        metadata_name = join(backup_name, METADATA_FN)
+        leading = list()
+        for member in next_members(tar):
+            if member.name == metadata_name:
+                return json.load(tar.extractfile(member)), leading
+
+            if not member.isdir():
+                raise CobraApiError(f'Metadata must precede the data in streaming mode [{member.name}], '
+                                    'restore without --stream')
+            leading.append(member)
+
+        raise CobraApiError(f'Metadata not found [{metadata_name}]')
+
+
+    def __copy_members(self, tar, fileobj, backup_name, selection, leading=(), metadata=None, 
+                       members=None, members_index=None):
+        '''
+        Copies the selected members of the backup archive to the tar written into fileobj. 
+        The members of the parts are copied in place of the parts, the parts not selected aren't even decompressed.
+        If metadata is not given the metadata and the manifest are copied too and the metadata is read when met, 
+        otherwise they are skipped. Given the members index of the seekable archive only the frames holding 
+        the selected members of the parts are read, the tar must be opened in random access mode then.
+        '''
+        metadata_name = join(backup_name, METADATA_FN)
+        manifest_name = join(backup_name, MANIFEST_FN)
+        with_metadata = metadata is None
+        prefix = f'{backup_name}/'
+        with tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.GNU_FORMAT, bufsize=COPY_BUFSIZE) as out:
+            for member in leading:
+                out.addfile(member)
+
+            for member in members if members is not None else next_members(tar):
+                if member.name == metadata_name and with_metadata:
+                    data = tar.extractfile(member).read()
+                    metadata = json.loads(data)
+                    selection.bind(metadata)
+                    out.addfile(member, io.BytesIO(data))
+                    continue
+
+                if member.name in (metadata_name, manifest_name, join(backup_name, MEMBERS_INDEX_FN)):
+                    if with_metadata and member.name != join(backup_name, MEMBERS_INDEX_FN):
+                        out.addfile(member, tar.extractfile(member))
+                    continue
+
+                key = member.name[len(prefix):] if member.name.startswith(prefix) else ''
+                info = metadata.get(METADATA_INFO_KEY, dict()) if metadata else dict()
+                parts = { part: basename(metadata[k]['bind']) for k, part in info.get('parts', dict()).items() }
+                if key in parts:
+                    if not selection.match_volume(parts[key]):
+                        continue
+
+                    if members_index and key in members_index:
+                        part_members = read_members(tar.fileobj, member.offset_data, members_index[key], 
+                                                    info['compression'], selection.match)
+                        self.__copy_part_members(part_members, out, backup_name)
+                    else:
+                        self.__copy_part(tar, member, out, backup_name, info['compression'], selection)
+                    continue
+
+                if not key or selection.match(key):
+                    out.addfile(member, tar.extractfile(member) if member.isreg() else None)
+
+
+    def __copy_part(self, tar, member, out, backup_name, compression, selection):
+        with open_member_tar(tar, member, compression) as part:
+            part_members = ((m, part.extractfile(m) if m.isreg() else None) 
+                            for m in next_members(part) if selection.match(m.name))
+            self.__copy_part_members(part_members, out, backup_name)
+
+
+    def __copy_part_members(self, part_members, out, backup_name):
+        for part_member, fileobj in part_members:
+            part_member.name = join(backup_name, part_member.name)
+            if part_member.islnk():
+                part_member.linkname = join(backup_name, part_member.linkname)
+            out.addfile(part_member, fileobj)
+
+
+    def __file_stream(self, file_name, cache_dir):
+        if is_index(file_name):
+            stores = [ChunkStore(join(d, STATE_DIR, CHUNKS_DIR)) for d in (dirname(file_name), cache_dir)]
+            yield from cobra.dedup.load(stores, cobra.dedup.read_index(file_name)['chunks'])
+            return
+
+        with open(file_name, 'rb') as f:
+            yield from decompress(chunks_of(f), detect_engine(file_name).name)
+
+
+    def __decompress_stream(self, chunks, fn):
+        engine = engine_by_filename(fn)
+        if engine is None:
+            chunks = iter(chunks)
+            head = next(chunks, b'')
+            engine = engine_by_magic(head)
+            chunks = chain((head,), chunks)
+
+        return decompress(chunks, engine.name)
+
+
+    def __extract(self, file_name, dest_dir, cache_dir, selection=None, fileobj=None):
+        if selection:
+            return self.__extract_selected(file_name, dest_dir, cache_dir, selection, fileobj)
+
+        if not is_index(file_name):
+            return subprocess.check_output(extract_command(file_name, dest_dir))
+
+        # the chunks are looked up in the store next to the index and in the cache one
+        stores = [ChunkStore(join(d, STATE_DIR, CHUNKS_DIR)) for d in (dirname(file_name), cache_dir)]
+        index = cobra.dedup.read_index(file_name)['chunks']
+        return b''.join(pipe(['tar', 'xvf', '-', '-C', dest_dir], cobra.dedup.load(stores, index)))
+
+
+    def __extract_selected(self, file_name, dest_dir, cache_dir, selection, fileobj=None):
+        backup_name = self.__backup_name(basename(file_name))
+        if fileobj is None and (is_index(file_name) or detect_engine(file_name).program is not None):
+            with tarfile.open(fileobj=IterReader(self.__file_stream(file_name, cache_dir)), mode='r|') as tar:
+                chunks = produce(lambda f: self.__copy_members(tar, f, backup_name, selection))
+                return b''.join(pipe(['tar', 'xvf', '-', '-C', dest_dir], chunks))
+
+        # plain tar is read in random access mode so the skipped members are not even read
+        with tarfile.open(file_name, 'r:', fileobj=fileobj) as tar:
+            members = tar.getmembers()
+            try:
+                members_index = json.load(tar.extractfile(join(backup_name, MEMBERS_INDEX_FN)))
+            except KeyError:
+                members_index = None
+            chunks = produce(lambda f: self.__copy_members(tar, f, backup_name, selection, 
+                                                           members=members, members_index=members_index))
+            return b''.join(pipe(['tar', 'xvf', '-', '-C', dest_dir], chunks))
+
+
+    def __backup_name(self, fn):
+        return index_basename(fn) if is_index(fn) else archive_basename(fn)
+
+
+    def __extract_parts(self, full_backup_archive_dir, parts, parallel=None):
+        def extract(part):
+            part_fn = join(full_backup_archive_dir, part)
+            subprocess.check_output(extract_command(part_fn, full_backup_archive_dir))
+            os.remove(part_fn)
+
+        with ThreadPoolExecutor(max_workers=parallel if parallel else 1) as executor:
+            list(executor.map(extract, parts.values()))
+
+
+    def __restore_base(self, full_backup_archive_dir, base_fn, search_dirs, **kwargs):
+        '''
+        Lays the base backups chain underneath the extracted incremental backup. 
+        The base is searched for locally first and then in the remote folder if it's given.
+        '''
+        base_full_fn = self.__locate_base(base_fn, search_dirs, **kwargs)
+        selection = Selection(kwargs.get('only_volume'), kwargs.get('path'))
+        with tempfile.TemporaryDirectory(dir=dirname(full_backup_archive_dir)) as temp_dir:
+            self.__extract(base_full_fn, temp_dir, search_dirs[-1], selection)
+            base_dir = join(temp_dir, self.__backup_name(base_fn))
+            with open(join(base_dir, METADATA_FN)) as f:
+                base_info = json.load(f).get(METADATA_INFO_KEY, dict())
+
+            if base_info.get('format') == 'parts' and not selection:
+                self.__extract_parts(base_dir, base_info['parts'], kwargs.get('parallel'))
+
+            if base_info.get('base'):
+                self.__restore_base(base_dir, base_info['base'], search_dirs, **kwargs)
+
+            manifest = cobra.manifest.load(join(full_backup_archive_dir, MANIFEST_FN))
+            cobra.manifest.merge(full_backup_archive_dir, base_dir, manifest)
+            shutil.rmtree(full_backup_archive_dir)
+            os.rename(base_dir, full_backup_archive_dir)
+
+
+    def __locate_base(self, base_fn, search_dirs, **kwargs):
+        for d in search_dirs:
+            if exists(join(d, base_fn)):
+                return join(d, base_fn)
+
+        if kwargs.get('creds') and kwargs.get('folder_id') or not is_drive(kwargs.get('storage')):
+            kwargs['backend'] = backend = self.__storage(**kwargs)
+            files = [f for f in backend.list(backend.folder) if f['name'] == base_fn]
+            if files:
+                return self.__pull(files[-1]['id'], search_dirs[-1], **kwargs)
+
+        raise CobraApiError(f'Base backup not found [{base_fn}]. Put it into {search_dirs} or specify --folder-id')
+
+
+    def __storage(self, creds=None, folder_id=None, **kwargs):
+        '''
+        Returns the storage given by the storage option, Google Drive by default. 
+        The one opened already is passed along as backend.
+        '''
+        if kwargs.get('backend') is not None:
+            return kwargs['backend']
+
+        if is_drive(kwargs.get('storage')):
+            self.__check_remote_args(creds, folder_id)
+
+        return open_storage(kwargs.get('storage'), creds, folder_id, kwargs.get('endpoint_url'))
+
+
+    def __storages(self, creds=None, folder_id=None, **kwargs):
+        '''
+        Returns the storages to push to given by the repeated storage and folder id options.
+        The ones opened already are passed along as backends.
+        '''
+        if kwargs.get('backends'):
+            return kwargs['backends']
+
+        return [self.__storage(creds, folder, **dict(kwargs, storage=storage)) 
+                for storage, folder in destinations(kwargs.get('storage'), folder_id)]
 
 
     def __check_remote_args(self, creds_fn, folder_id):
@@ -307,32 +1398,277 @@ class Api:
             raise FileNotFoundError(f'File not found [{creds_fn}]')
 
 
-    def __backup_push(self, host_backup_dir, backup_archive_fn, **kwargs):
+    def __push_concurrently(self, files, **kwargs):
+        '''
+        Pushes the files by the given number of jobs at a time. A failed file doesn't stop the others,
+        the failures are reported once all the files are done.
+        '''
+        failed = dict()
+        with Progress() as p:
+            task = p.add_task('[white]Total', total=len(files))
+            with ThreadPoolExecutor(max_workers=kwargs.get('jobs')) as executor:
+                futures = { executor.submit(self.__backup_push, dirname(fn), basename(fn), progress=p, **kwargs): fn 
+                            for fn in files }
+                for future in as_completed(futures):
+                    fn = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.__logger.error(f'Failed to push [{fn}]: {e}')
+                        failed[fn] = e
+
+                    if kwargs.get('print', False):
+                        p.advance(task)
+
+        if failed:
+            raise CobraApiError(f'Failed to push [{len(failed)}] of [{len(files)}] files: '
+                                f'{", ".join(basename(fn) for fn in sorted(failed))}')
+
+
+    def __backup_push(self, host_backup_dir, backup_archive_fn, progress=None, **kwargs):
+        '''
+        Uploads the file with its hooks to all the storages given. The file is read once for all the storages 
+        it's not in yet. A failed storage doesn't stop the others, the failures are reported once all are done.
+
+        @param progress The progress to add the file task to. If not given the own one is shown.
+        '''
         self.__call_hook('before_push', backup_dir=host_backup_dir, 
                          filename=backup_archive_fn, docker=self.__docker)
 
         rm = kwargs.get('rm', False)
-        creds_fn = kwargs.get('creds', None)
-        folder_id = kwargs.get('folder_id', None)
+        backends = self.__storages(**kwargs)
+        backup_archive_full_fn = join(host_backup_dir, backup_archive_fn)
+        pending = list()
+        failed = dict()
+        for backend in backends:
+            try:
+                if self.__prepare_push(backup_archive_full_fn, backend, progress, **kwargs):
+                    pending.append(backend)
+                else:
+                    self.__logger.info(f'The same file is in [{backend}] already, skipping [{backup_archive_fn}]')
+            except Exception as e:
+                if len(backends) == 1:
+                    raise
+                self.__logger.error(f'Failed to push [{backup_archive_fn}] to [{backend}]: {e}')
+                failed[backend] = e
+
+        if len(pending) == 1:
+            try:
+                self.__upload(backup_archive_full_fn, pending[0], progress, **kwargs)
+            except Exception as e:
+                if len(backends) == 1:
+                    raise
+                self.__logger.error(f'Failed to push [{backup_archive_fn}] to [{pending[0]}]: {e}')
+                failed[pending[0]] = e
+        elif pending:
+            with open(backup_archive_full_fn, 'rb') as f:
+                failed.update(self.__replicate(chunks_of(f), pending, backup_archive_fn, progress, 
+                                               total=os.stat(backup_archive_full_fn).st_size, **kwargs))
+        self.__check_replicated(backup_archive_fn, backends, failed)
 
-        self.__check_remote_args(creds_fn, folder_id)
+        self.__call_hook('after_push', backup_dir=host_backup_dir, 
+                         filename=backup_archive_fn, docker=self.__docker)
 
-        backup_archive_full_fn = join(host_backup_dir, backup_archive_fn)
-        with Progress() as p:
+        if rm and exists(backup_archive_full_fn):
+            os.remove(backup_archive_full_fn)
+
+
+    def __prepare_push(self, backup_archive_full_fn, backend, progress=None, **kwargs):
+        '''
+        Pushes the chunks and the manifest of the backup to the storage. 
+        Returns whether the backup itself is to be uploaded there.
+        '''
+        host_backup_dir, backup_archive_fn = dirname(backup_archive_full_fn), basename(backup_archive_full_fn)
+        if is_index(backup_archive_fn):
+            self.__push_chunks(backup_archive_full_fn, backend, progress=progress, **kwargs)
+
+        manifest_full_fn = join(host_backup_dir, STATE_DIR, f'{backup_archive_fn}{MANIFEST_EXT}')
+        if isfile(manifest_full_fn):
+            self.__push_manifest(manifest_full_fn, backend)
+
+        remote_files = (kwargs.get('remote_files') or dict()).get(backend)
+        if remote_files is None and not kwargs.get('force', False):
+            remote_files = backend.list(backend.folder, name=backup_archive_fn)
+
+        return not remote_files or not self.__pushed(backup_archive_full_fn, remote_files, backend)
+
+
+    def __replicate(self, chunks, storages, backup_archive_fn, progress=None, total=None, **kwargs):
+        '''
+        Uploads the chunks read once to all the storages at a time. The slowest storage holds the reading back,
+        so only a few chunks are kept in memory. Returns the storages failed along with the errors.
+        '''
+        chunks = throttle(chunks, kwargs.get('upload_limit'))
+        with nullcontext(progress) if progress else Progress() as p:
+            def upload(backend):
+                task = p.add_task(f'[white]{backup_archive_fn} -> {backend}', total=total)
+
+                def consume(chunks):
+                    for status in backend.upload_stream(chunks, mimetype(backup_archive_fn), backup_archive_fn, 
+                                                        backend.folder):
+                        if kwargs.get('print', False):
+                            p.update(task, completed=status.resumable_progress)
+                return consume
+
+            results = fan_out(chunks, [upload(backend) for backend in storages])
+
+        failed = dict()
+        for backend, (_, e) in zip(storages, results):
+            if e is None:
+                self.__logger.info(f'Pushed [{backup_archive_fn}] to [{backend}]')
+            else:
+                self.__logger.error(f'Failed to push [{backup_archive_fn}] to [{backend}]: {e}')
+                failed[backend] = e
+        return failed
+
+
+    def __check_replicated(self, backup_archive_fn, backends, failed):
+        if failed:
+            raise CobraApiError(f'Failed to push [{backup_archive_fn}] to [{len(failed)}] of [{len(backends)}] '
+                                f'destinations: {", ".join(str(backend) for backend in failed)}')
+
+
+    def __upload(self, backup_archive_full_fn, backend, progress=None, **kwargs):
+        folder_id = backend.folder
+        backup_archive_fn = basename(backup_archive_full_fn)
+        # only one live progress may be shown at once
+        with nullcontext(progress) if progress else Progress() as p:
             task = p.add_task(f'[white]{backup_archive_fn}', total=100)
-            for status in cobra.google_drive.upload_file(
-                creds_fn, backup_archive_full_fn, 'application/gzip', backup_archive_fn, folder_id):
+            state_fn = self.__upload_state_fn(backup_archive_full_fn, folder_id, kwargs.get('cache_dir'))
+            limit = kwargs.get('upload_limit')
+            uploaded = None
+            for status in backend.upload_file(
+                backup_archive_full_fn, mimetype(backup_archive_fn), backup_archive_fn, folder_id, state_fn=state_fn, 
+                md5=self.__saved_checksum(backup_archive_full_fn)):
+                # the upload resumed starts from the offset confirmed before, so the first chunk isn't paced
+                if limit is not None:
+                    if uploaded is not None:
+                        limit.consume(status.resumable_progress - uploaded)
+                    uploaded = status.resumable_progress
                 if kwargs.get('print', False):
                     p.update(task, completed=status.progress() * 100)
             p.update(task, completed=100)
 
+
+    def __push_manifest(self, manifest_full_fn, backend):
+        '''
+        Uploads the manifest into the manifests sub folder unless it's there already. 
+        It lets the catalog be rebuilt without reading the archives.
+        '''
+        manifests_folder_id = backend.ensure_folder(backend.folder, MANIFESTS_DIR)
+        manifest_fn = basename(manifest_full_fn)
+        if backend.find_file(manifests_folder_id, manifest_fn) is None:
+            with open(manifest_full_fn, 'rb') as f:
+                backend.upload_bytes(f.read(), manifest_fn, manifests_folder_id, mimetype='application/json')
+
+
+    def __catalog_add(self, host_backup_dir, backup_archive_fn, manifest):
+        try:
+            Catalog(join(host_backup_dir, STATE_DIR, CATALOG_FN)).add(
+                backup_archive_fn, manifest, manifest.get('base'), manifest.get('offsets'))
+        except sqlite3.Error as e:
+            # the backup is fine anyway, the catalog is to be rebuilt by reindex
+            self.__logger.error(f'Failed to add [{backup_archive_fn}] to the catalog: {e}')
+
+
+    def __upload_state_fn(self, full_fn, folder_id, cache_dir=None):
+        '''
+        Returns the file name to keep the upload session of the file into the folder in.
+        '''
+        key = hashlib.sha1(f'{full_fn}:{folder_id}'.encode('utf-8')).hexdigest()
+        return join(cache_dir if cache_dir else default_cache_dir(), STATE_DIR, UPLOADS_DIR, f'{key}.json')
+
+
+    def __push_chunks(self, backup_index_full_fn, backend, progress=None, **kwargs):
+        '''
+        Uploads the chunks referenced by the index into the chunks sub folder skipping the ones already there.
+        '''
+        chunk_store = ChunkStore(join(dirname(backup_index_full_fn), STATE_DIR, CHUNKS_DIR))
+        index = cobra.dedup.read_index(backup_index_full_fn)['chunks']
+        chunks_folder_id = backend.ensure_folder(backend.folder, CHUNKS_DIR)
+        remote = backend.names_list(chunks_folder_id)
+        digests = sorted(set(d for d, _ in index) - set(remote))
+        with nullcontext(progress) if progress else Progress() as p:
+            task = p.add_task(f'[white]{CHUNKS_DIR}', total=len(digests))
+            for d in digests:
+                with open(chunk_store.path(d), 'rb') as f:
+                    data = f.read()
+                backend.upload_bytes(data, d, chunks_folder_id)
+                if kwargs.get('upload_limit') is not None:
+                    kwargs['upload_limit'].consume(len(data))
+                if kwargs.get('print', False):
+                    p.advance(task)
+
+        self.__logger.info(f'Uploaded {len(digests)} of {len(set(d for d, _ in index))} chunks')
+
+    
+    def __push_stream(self, chunks, host_backup_dir, backup_archive_fn, **kwargs):
+        '''
+        Uploads the archive while it's being built to all the storages at a time. 
+        No local file is written unless keep_local is given.
+        '''
+        self.__call_hook('before_push', backup_dir=host_backup_dir, 
+                         filename=backup_archive_fn, docker=self.__docker)
+
+        backends = kwargs['backends']
+        failed = dict()
+        backup_archive_full_fn = join(host_backup_dir, backup_archive_fn)
+        keep_local = kwargs.get('keep_local', False)
+        try:
+            digest = hashlib.md5()
+            with open(backup_archive_full_fn, 'wb') if keep_local else nullcontext() as f:
+                if keep_local:
+                    chunks = tee(hashing(chunks, digest), f)
+
+                if len(backends) > 1:
+                    failed = self.__replicate(chunks, backends, backup_archive_fn, **kwargs)
+                    if len(failed) == len(backends):
+                        self.__check_replicated(backup_archive_fn, backends, failed)
+                else:
+                    backend = backends[0]
+                    with Progress() as p:
+                        task = p.add_task(f'[white]{backup_archive_fn}', total=None)
+                        for status in backend.upload_stream(
+                            throttle(chunks, kwargs.get('upload_limit')), mimetype(backup_archive_fn), backup_archive_fn, backend.folder):
+                            if kwargs.get('print', False):
+                                p.update(task, completed=status.resumable_progress)
+        except BaseException:
+            if keep_local and exists(backup_archive_full_fn):
+                os.remove(backup_archive_full_fn)
+            raise
+
+        if keep_local:
+            self.__save_checksum(backup_archive_full_fn, digest.hexdigest())
+        self.__check_replicated(backup_archive_fn, backends, failed)
+
         self.__call_hook('after_push', backup_dir=host_backup_dir, 
                          filename=backup_archive_fn, docker=self.__docker)
 
-        if rm and exists(backup_archive_full_fn):
-            os.remove(backup_archive_full_fn)
+        return backup_archive_full_fn
+
+
+    def __print_found(self, files, **kwargs):
+        if kwargs.get('json', False):
+            print_json(files)
+            return
+
+        table = Table(Column(header='Backup', header_style='bold blue', style='white'),
+                      Column(header='Volume', header_style='bold blue', style='white'), 
+                      Column(header='Path', header_style='bold blue', style='white'), 
+                      Column(header='Type', header_style='bold blue', style='white'), 
+                      Column(header='Size', justify='right', header_style='bold blue', style='white'), 
+                      Column(header='Modified at', header_style='bold blue', style='white'), 
+                      Column(header='SHA256', header_style='bold blue', style='white'), 
+                      box=box.ASCII)
+
+        for f in files:
+            mtime = datetime.fromtimestamp(f['mtime'], timezone.utc).isoformat() if f.get('mtime') is not None else 'n/a'
+            table.add_row(f['backup'], f['volume'], f['path'], f['type'], str(f.get('size', 'n/a')), 
+                          mtime, f.get('hash') or 'n/a')
+
+        Console().print(table)
+
 
-    
     def __print_backups(self, files, remote, **kwargs):
         json = kwargs.get('json', False)
         plain = kwargs.get('plain', False)
@@ -366,6 +1702,23 @@ class Api:
                 print('\n'.join(files))
 
 
+    def __print_pruned(self, locations, **kwargs):
+        if kwargs.get('json', False):
+            print_json(locations)
+            return
+
+        table = Table(Column(header='Location', header_style='bold blue', style='white'),
+                      Column(header='Name', header_style='bold blue', style='white'), 
+                      Column(header='Size', justify='right', header_style='bold blue', style='white'), 
+                      box=box.ASCII, title='Would remove' if kwargs.get('dry_run', False) else 'Removed')
+
+        for location, removed in locations.items():
+            for f in removed:
+                table.add_row(location, f['name'], str(f.get('size', 'n/a')))
+
+        Console().print(table)
+
+
     def __print_volumes(self, volumes, is_json=False):
         if is_json:
             for v in volumes:
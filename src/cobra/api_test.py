@@ -1,19 +1,28 @@
-from cobra.api import (Api, CobraApiError, DEFAULT_BASE_URL, 
-    default_backup_dir, default_cache_dir, METADATA_FN)
+from cobra.api import (Api, CobraApiError, DEFAULT_BASE_URL, API_VERSION,
+    default_backup_dir, default_cache_dir, local_daemon, METADATA_FN, METADATA_INFO_KEY, HELPER_IMAGE)
 from cobra.hooks import Hooks
 from cobra.exc import CobraCliError
 
 import pytest
-from unittest.mock import patch, AsyncMock, create_autospec, MagicMock, call
+from types import SimpleNamespace
+import os
+import threading
+from unittest.mock import patch, AsyncMock, create_autospec, MagicMock, call, ANY
 
 # from aiohttp import ClientResponse, ClientConnectionError, FormData
 from io import IOBase
 from docker import DockerClient
 from docker.models.volumes import Volume
-from datetime import datetime
+from datetime import datetime, timezone
 from freezegun import freeze_time
 from os.path import join, abspath, realpath, basename, dirname, splitext
-import json, copy
+from cobra.manifest import MANIFEST_FN
+from cobra.catalog import Catalog
+from cobra.dedup import ChunkStore, write_index
+from cobra.compression import decompress_range
+from cobra.google_drive_test import make_drive_service
+from os import listdir
+import json, copy, tarfile, io, hashlib, random
 
 
 VOLUMES = [
@@ -230,12 +239,12 @@ def test_backend_build_must_call_docker_run_with_correct_params(sut, scratch_dat
     host_backup_dir=default_backup_dir()
     with freeze_time(scratch_datetime) as ft:
         rv = sut.backup_build(dir_names=dir_names, host_backup_dir=host_backup_dir)
-        assert rv == str(DOCKER_RUN_RV, encoding='utf-8')
         container_backup_dir = f'/{backup_name}'
         backup_archive_fn = f'{backup_name}.tar.gz'
+        assert rv == join(host_backup_dir, backup_archive_fn)
         container_backup_archive_fn = join('/backup', backup_archive_fn)
         command=['sh', '-c', f'mv /backup/... {container_backup_dir} && tar -czvf {container_backup_archive_fn} {container_backup_dir}']
-        docker_client_mock.containers.run.assert_called_with('busybox', remove=True, 
+        docker_client_mock.containers.run.assert_called_with(HELPER_IMAGE, remove=True, 
                                                               volumes=expected_volume_opts, command=command)
         exptected_metadata = copy.deepcopy(expected_volume_opts)                                                              
         del exptected_metadata[host_backup_dir]
@@ -245,11 +254,263 @@ def test_backend_build_must_call_docker_run_with_correct_params(sut, scratch_dat
             exptected_metadata[v.name]['options'] = v.attrs['Options']
             exptected_metadata[v.name]['labels'] = v.attrs['Labels']
 
+        exptected_metadata[METADATA_INFO_KEY] = dict(version=API_VERSION, compression='gzip', level=None)
         metadata_fn = join(host_backup_dir, '...')
         open_mock.assert_called_with(metadata_fn, 'w')
         json_dump_mock.assert_called_with(exptected_metadata, open_mock.return_value.__enter__.return_value)
 
 
+@pytest.fixture
+def compress_mock():
+    with patch('cobra.api.compress') as mock:
+        mock.return_value = [b'compressed']
+        yield mock
+
+
+@pytest.fixture
+def check_program_mock():
+    with patch('cobra.api.check_program') as mock:
+        yield mock
+
+
+def make_tar(files, mtime=1000000000):
+    '''
+    Returns tar data of the given files dict, where the value is either file content or None for directory.
+    '''
+    f = io.BytesIO()
+    with tarfile.open(fileobj=f, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.mtime = mtime
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    return f.getvalue()
+
+
+def test_backup_build_must_compress_on_host_if_engine_is_not_gzip(sut, scratch_datetime, docker_client_mock, backup_name, 
+                                                                  volume_opts, open_mock, makedirs_mock, compress_mock, 
+                                                                  check_program_mock):
+    host_backup_dir = abspath(default_backup_dir())
+    container = docker_client_mock.containers.create.return_value
+    container.get_archive.return_value = (iter([make_tar({ backup_name: None, f'{backup_name}/volume1/file': b'data' })]), dict())
+    # the file is never written since open is mocked
+    with freeze_time(scratch_datetime), patch('os.stat', return_value=SimpleNamespace(st_size=0, st_mtime_ns=0)):
+        rv = sut.backup_build(host_backup_dir=host_backup_dir, compression='zstd', compress_level=3)
+
+    assert rv == join(host_backup_dir, f'{backup_name}.tar.zst')
+    del volume_opts[host_backup_dir]
+    docker_client_mock.containers.create.assert_called_with(HELPER_IMAGE, volumes=volume_opts)
+    container.get_archive.assert_called_with(f'/{backup_name}')
+    container.remove.assert_called_with(force=True)
+    docker_client_mock.containers.run.assert_not_called()
+    check_program_mock.assert_called_with('zstd')
+
+    chunks, compression, level = compress_mock.call_args.args
+    assert (compression, level) == ('zstd', 3)
+    with tarfile.open(fileobj=io.BytesIO(b''.join(chunks))) as tar:
+        assert tar.getnames() == [join(backup_name, METADATA_FN), backup_name, 
+                                  f'{backup_name}/volume1/file', join(backup_name, MANIFEST_FN)]
+        metadata = json.load(tar.extractfile(join(backup_name, METADATA_FN)))
+        assert metadata[METADATA_INFO_KEY] == dict(version=API_VERSION, compression='zstd', level=3)
+        manifest = json.load(tar.extractfile(join(backup_name, MANIFEST_FN)))
+        assert manifest['files']['volume1/file']['hash'] == hashlib.sha256(b'data').hexdigest()
+
+    open_mock.return_value.__enter__.return_value.write.assert_any_call(b'compressed')
+    open_mock.assert_called_with(join(host_backup_dir, '.cobra', f'{backup_name}.tar.zst.manifest.json'), 'w')
+
+
+def make_helper_containers(docker_client_mock, fail=None, files=None):
+    def create(image, volumes):
+        (name, opts), = volumes.items()
+        container = MagicMock()
+        if name == fail:
+            container.get_archive.side_effect = RuntimeError('archive failed')
+        elif files is not None:
+            container.get_archive.return_value = (iter([make_tar(files)]), dict())
+        else:
+            part = basename(opts['bind'])
+            container.get_archive.return_value = (iter([make_tar({ part: None, f'{part}/file': part.encode() })]), dict())
+        return container
+
+    docker_client_mock.containers.create.side_effect = create
+
+
+def test_parallel_build_must_pack_separately_compressed_parts(sut, scratch_datetime, docker_client_mock, 
+                                                              backup_name, tmp_path, dirs):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(scratch_datetime), patch('cobra.api.realpath', side_effect=lambda x: x):
+        rv = sut.backup_build(host_backup_dir=tmp_path, dir_names=dirs, compression='none', parallel=2)
+
+    assert rv == join(tmp_path, f'{backup_name}.tar')
+    assert docker_client_mock.containers.create.call_count == len(VOLUMES) + len(dirs)
+    with tarfile.open(rv) as tar:
+        names = tar.getnames()
+        assert names[0] == join(backup_name, METADATA_FN)
+        assert names[-1] == join(backup_name, MANIFEST_FN)
+        metadata = json.load(tar.extractfile(names[0]))
+        info = metadata[METADATA_INFO_KEY]
+        assert info['format'] == 'parts'
+        assert info['parts'] == { 'volume1': 'volume1.tar', 'volume2': 'volume2.tar', 'volume3': 'volume3.tar', 
+                                  dirs[0]: 'dir1.tar', dirs[1]: 'dir2.tar' }
+        for key, part in info['parts'].items():
+            with tarfile.open(fileobj=tar.extractfile(join(backup_name, part))) as part_tar:
+                name = splitext(part)[0]
+                assert part_tar.extractfile(f'{name}/file').read() == name.encode()
+
+        manifest = json.load(tar.extractfile(names[-1]))
+        assert sorted(manifest['files']) == sorted(f'{p}{s}' for p in ('volume1', 'volume2', 'volume3', 'dir1', 'dir2') 
+                                                   for s in ('', '/file'))
+
+    assert sorted(listdir(tmp_path)) == ['.cobra', basename(rv)]
+    assert sorted(listdir(tmp_path / '.cobra')) == [f'{basename(rv)}.manifest.json', f'{basename(rv)}.md5.json', 'catalog.db']
+    found = sut.backup_find('volume2/file', backup_dir=str(tmp_path))
+    assert [(f['backup'], f['volume'], f['path'], f['type']) for f in found] == [(basename(rv), 'volume2', 'file', 'file')]
+
+
+def test_parallel_build_must_report_failed_parts_and_cleanup(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock, fail='volume2')
+    with pytest.raises(CobraApiError) as e:
+        sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=3)
+
+    assert list(e.value.args[1]) == ['volume2']
+    assert listdir(tmp_path) == []
+
+
+def test_local_daemon_must_be_told_by_base_url():
+    assert local_daemon(SimpleNamespace(api=SimpleNamespace(base_url='http+docker://localhost')))
+    assert not local_daemon(SimpleNamespace(api=SimpleNamespace(base_url='https://docker.example.com:2376')))
+    assert not local_daemon(SimpleNamespace(api=SimpleNamespace(base_url='http+docker://ssh')))
+    assert not local_daemon(object())
+
+
+@pytest.fixture
+def host_volumes(docker_client_mock, tmp_path):
+    """
+    Makes the volumes the local driver keeps in tmp_path, volume3 has options so it's mounted only by containers.
+    """
+    volumes = list()
+    for attrs in VOLUMES:
+        mountpoint = tmp_path / 'volumes' / attrs['Name'] / '_data'
+        (mountpoint / 'dir').mkdir(parents=True)
+        (mountpoint / 'dir' / 'file').write_bytes(attrs['Name'].encode())
+        options = dict(type='nfs') if attrs['Name'] == 'volume3' else None
+        volumes.append(Volume(attrs | dict(Mountpoint=str(mountpoint), Options=options)))
+    docker_client_mock.volumes.list.return_value = volumes
+    with patch('cobra.api.local_daemon', return_value=True):
+        yield volumes
+
+
+def test_backup_build_must_read_on_host_without_container(sut, scratch_datetime, docker_client_mock, backup_name, 
+                                                          host_volumes, tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'file').write_bytes(b'dir')
+    os.symlink('file', src / 'link')
+    backup_dir = tmp_path / 'backup'
+    with freeze_time(scratch_datetime):
+        rv = sut.backup_build(include_volumes=['volume1', 'volume2'], dir_names=[str(src)], host_backup_dir=backup_dir)
+
+    assert rv == str(backup_dir / f'{backup_name}.tar.gz')
+    docker_client_mock.containers.create.assert_not_called()
+    docker_client_mock.containers.run.assert_not_called()
+    with tarfile.open(rv) as tar:
+        names = tar.getnames()
+        assert names[:2] == [join(backup_name, METADATA_FN), backup_name]
+        assert names[-1] == join(backup_name, MANIFEST_FN)
+        assert tar.extractfile(f'{backup_name}/volume2/dir/file').read() == b'volume2'
+        assert tar.extractfile(f'{backup_name}/src/file').read() == b'dir'
+        assert tar.getmember(f'{backup_name}/src/link').linkname == 'file'
+
+    manifest = json.loads((backup_dir / '.cobra' / f'{basename(rv)}.manifest.json').read_text())
+    assert sorted(manifest['files']) == ['src', 'src/file', 'src/link', 'volume1', 'volume1/dir', 'volume1/dir/file', 
+                                         'volume2', 'volume2/dir', 'volume2/dir/file']
+
+
+def test_backup_build_must_fall_back_to_container_unless_all_read_on_host(sut, scratch_datetime, docker_client_mock, 
+                                                                          backup_name, host_volumes, tmp_path):
+    with freeze_time(scratch_datetime):
+        sut.backup_build(host_backup_dir=tmp_path / 'backup')
+
+    docker_client_mock.containers.run.assert_called_once()
+    docker_client_mock.containers.run.reset_mock()
+    with freeze_time(scratch_datetime):
+        sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path / 'backup', no_host_read=True)
+
+    docker_client_mock.containers.run.assert_called_once()
+
+
+def test_parallel_build_must_use_container_only_for_sources_not_read_on_host(sut, scratch_datetime, docker_client_mock, 
+                                                                            backup_name, host_volumes, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(scratch_datetime):
+        rv = sut.backup_build(host_backup_dir=tmp_path / 'backup', compression='none', parallel=3)
+
+    assert docker_client_mock.containers.create.call_count == 1
+    assert list(docker_client_mock.containers.create.call_args.kwargs['volumes']) == ['volume3']
+    with tarfile.open(rv) as tar:
+        for name in ('volume1', 'volume2', 'volume3'):
+            with tarfile.open(fileobj=tar.extractfile(f'{backup_name}/{name}.tar')) as part:
+                file = f'{name}/dir/file' if name != 'volume3' else f'{name}/file'
+                assert part.extractfile(file).read() == name.encode()
+
+
+@pytest.fixture
+def upload_stream_mock():
+    uploaded = list()
+
+    def upload_stream(creds, chunks, mimetype, name, folder_id):
+        for chunk in chunks:
+            uploaded.append(chunk)
+            yield Status()
+
+    with patch('cobra.google_drive.upload_stream') as mock:
+        mock.side_effect = upload_stream
+        mock.uploaded = uploaded
+        yield mock
+
+
+@pytest.mark.parametrize('keep_local', [False, True])
+def test_streaming_build_must_upload_without_local_file(sut, scratch_datetime, docker_client_mock, backup_name, tmp_path,
+                                                        upload_stream_mock, hooks_mock, keep_local):
+    container = docker_client_mock.containers.create.return_value
+    container.get_archive.return_value = (iter([make_tar({ f'{backup_name}/volume1/file': b'data' })]), dict())
+    creds = tmp_path / 'creds.json'
+    creds.write_text('{}')
+    backup_dir = tmp_path / 'backup'
+    with freeze_time(scratch_datetime):
+        rv = sut.backup_build(host_backup_dir=backup_dir, compression='none', push=True, stream=True, 
+                              keep_local=keep_local, creds=str(creds), folder_id='folder-id')
+
+    backup_archive_fn = f'{backup_name}.tar'
+    assert rv == str(backup_dir / backup_archive_fn)
+    upload_stream_mock.assert_called_once()
+    assert upload_stream_mock.call_args.args[2:] == ('application/x-tar', backup_archive_fn, 'folder-id')
+    uploaded = b''.join(upload_stream_mock.uploaded)
+    with tarfile.open(fileobj=io.BytesIO(uploaded)) as tar:
+        assert tar.extractfile(f'{backup_name}/volume1/file').read() == b'data'
+
+    local_files = sorted(fn for fn in listdir(backup_dir) if not fn.startswith('.'))
+    if keep_local:
+        assert local_files == [backup_archive_fn]
+        assert (backup_dir / backup_archive_fn).read_bytes() == uploaded
+    else:
+        assert local_files == []
+
+    hooks = [c.args[0] for c in hooks_mock.call_args_list]
+    assert hooks == ['before_build', 'before_push', 'after_push', 'after_build']
+
+
+def test_streaming_build_must_require_push(sut):
+    with pytest.raises(CobraCliError):
+        sut.backup_build(stream=True)
+
+
 @pytest.mark.parametrize('creds, folder_id, file_exists, expected_exc', 
                         [(None, None, True, CobraCliError), 
                         (None, 'folder-id', True, CobraCliError), 
@@ -265,14 +526,65 @@ def test_backup_push_must_check_args(sut, exists_mock, creds, folder_id, file_ex
         ([], [join(default_backup_dir(), fn) for fn in files_list()]),
         (['some_file1', './some_file2', '/some_dir/some_file3'], 
          [join(default_backup_dir(), 'some_file1'), realpath(abspath('./some_file2')), '/some_dir/some_file3'])])
-def test_push_must_list_backup_dir_if_no_files_list_given(sut, files, expected_files, exists_mock, listdir_mock, upload_file_mock):
+def test_push_must_list_backup_dir_if_no_files_list_given(sut, files, expected_files, exists_mock, listdir_mock, upload_file_mock, 
+                                                          folder_list_mock):
     creds, folder_id = 'creds', 'folder_id'
     sut.backup_push(files, creds, folder_id)
 
-    calls = [call(creds, fn, 'application/gzip', basename(fn), folder_id) for fn in expected_files]
+    calls = [call(creds, fn, 'application/gzip', basename(fn), folder_id, state_fn=ANY) for fn in expected_files]
     upload_file_mock.assert_has_calls(calls)
 
 
+def test_push_must_upload_files_concurrently_and_report_failed_ones(sut, tmp_path, hooks_mock, folder_list_mock):
+    files = [str(tmp_path / f'backup{i}.tar.gz') for i in range(4)]
+    for fn in files:
+        open(fn, 'wb').close()
+    creds = tmp_path / 'creds.json'
+    creds.write_text('{}')
+    running = set()
+    overlapped = threading.Event()
+    lock = threading.Lock()
+
+    def upload_file(creds_fn, fn, *args, **kwargs):
+        with lock:
+            running.add(fn)
+            if len(running) > 1:
+                overlapped.set()
+        overlapped.wait(timeout=5)
+        if fn.endswith('backup1.tar.gz'):
+            raise IOError('Connection reset')
+        yield Status()
+        with lock:
+            running.discard(fn)
+
+    with patch('cobra.google_drive.upload_file', side_effect=upload_file):
+        with pytest.raises(CobraApiError, match=r'\[1\] of \[4\].*backup1.tar.gz'):
+            sut.backup_push(files, str(creds), 'folder-id', jobs=2)
+
+    assert overlapped.is_set()
+    hooks = [c.args[0] for c in hooks_mock.call_args_list]
+    assert hooks.count('before_push') == 4
+    assert hooks.count('after_push') == 3
+
+
+def test_backup_list_must_filter_remote_catalog(sut, tmp_path, exists_mock):
+    files = [dict(id=str(i), name=name, createdTime=f'2023-02-0{i}T00:00:00.000Z') 
+             for i, name in enumerate(['backup@1.tar.gz', 'daily@2.tar.gz', 'backup@3.tar.gz', 'backup@4.tar.gz'], 1)]
+    with patch('cobra.google_drive.FolderCatalog') as catalog_mock:
+        catalog_mock.return_value.files.return_value = files
+        rv = sut.backup_list('creds', 'folder-id', remote=True, backup_dir=default_backup_dir(), cache_dir=str(tmp_path),
+                             filter='not daily', before=datetime(2023, 2, 4, tzinfo=timezone.utc))
+
+    assert [f['id'] for f in rv] == ['1', '3']
+    assert catalog_mock.call_args.args[2] == join(str(tmp_path), '.cobra', 'remote', 'folder-id.json')
+
+
+def test_backup_list_must_filter_on_server_side_without_cache(sut, exists_mock, folder_list_mock):
+    folder_list_mock.return_value = [dict(id='1', name='backup@1.tar.gz', createdTime='2023-02-01T00:00:00Z')]
+    sut.backup_list('creds', 'folder-id', remote=True, backup_dir=default_backup_dir(), filter='not daily')
+    folder_list_mock.assert_called_once_with('creds', 'folder-id', exclude='daily', after=None, before=None, latest=False)
+
+
 def test_backup_list_must_list_local_or_remote_folder(sut, folder_list_mock, listdir_mock, exists_mock):
     creds, folder_id = 'creds', 'folder_id'
     assert listdir_mock.return_value == sut.backup_list(creds, folder_id, remote=False, backup_dir=default_backup_dir())
@@ -310,8 +622,133 @@ def test_pull_must_download_file(sut, download_file_mock, makedirs_mock, full_fi
     assert full_filename == sut.backup_pull(creds, file_id, no_cache=True)
     cache_dir = default_cache_dir()
     makedirs_mock.assert_called_with(cache_dir, exist_ok=True)
-    download_file_mock.assert_called_with(creds, file_id, cache_dir, use_cache=False)
-
+    download_file_mock.assert_called_with(creds, file_id, cache_dir, use_cache=False, connections=None, reserve=ANY)
+
+
+
+def test_push_and_pull_must_work_with_directory_storage(sut, tmp_path, hooks_mock):
+    backup_dir, storage, cache_dir = tmp_path / 'backups', tmp_path / 'nfs', tmp_path / 'cache'
+    backup_dir.mkdir()
+    data = os.urandom(50000)
+    (backup_dir / 'backup@1.tar.gz').write_bytes(data)
+    sut.backup_push(['backup@1.tar.gz'], None, 'host1', backup_dir=str(backup_dir), storage=str(storage),
+                    cache_dir=str(cache_dir))
+    assert (storage / 'host1' / 'backup@1.tar.gz').read_bytes() == data
+
+    files = sut.backup_list(None, 'host1', remote=True, backup_dir=str(backup_dir), storage=f'file://{storage}')
+    assert [(f['id'], f['name']) for f in files] == [('host1/backup@1.tar.gz', 'backup@1.tar.gz')]
+
+    fn = sut.backup_pull(None, None, latest=True, folder_id='host1', storage=str(storage), cache_dir=str(cache_dir))
+    assert fn == str(cache_dir / 'backup@1.tar.gz')
+    assert (cache_dir / 'backup@1.tar.gz').read_bytes() == data
+    with pytest.raises(CobraCliError):
+        sut.backup_pull(None, None, storage=str(storage), cache_dir=str(cache_dir))
+
+
+def test_push_must_pace_upload_to_max_upload_rate(sut, tmp_path, hooks_mock):
+    backup_dir = tmp_path / 'backups'
+    backup_dir.mkdir()
+    data = os.urandom(3*1024*1024)
+    (backup_dir / 'backup@1.tar.gz').write_bytes(data)
+    storages = [str(tmp_path / 'nfs1'), str(tmp_path / 'nfs2')]
+    with patch('cobra.api.RateLimit') as rate_limit_mock:
+        sut.backup_push(['backup@1.tar.gz'], None, 'host1', backup_dir=str(backup_dir), storage=storages, 
+                        max_upload_rate=1024*1024)
+
+    rate_limit_mock.assert_called_once_with(1024*1024)
+    # the file is read once for both destinations, so it's paced once
+    consumed = [c.args[0] for c in rate_limit_mock.return_value.consume.call_args_list]
+    assert sum(consumed) == len(data)
+
+
+def test_build_must_limit_helper_containers(sut, scratch_datetime, docker_client_mock, open_mock, json_dump_mock, 
+                                            volumes_list):
+    with freeze_time(scratch_datetime):
+        sut.backup_build(host_backup_dir=default_backup_dir(), cpu_quota=0.5, io_weight=100, max_read_rate=1024)
+
+    kwargs = docker_client_mock.containers.run.call_args.kwargs
+    assert (kwargs['nano_cpus'], kwargs['blkio_weight']) == (500000000, 100)
+    # the devices read are not known while the docker daemon is remote
+    assert 'device_read_bps' not in kwargs
+
+    with pytest.raises(CobraCliError, match='IO weight'):
+        sut.backup_build(host_backup_dir=default_backup_dir(), io_weight=5)
+
+
+def test_push_must_replicate_file_read_once_and_report_failed_destination(sut, tmp_path, hooks_mock):
+    backup_dir = tmp_path / 'backups'
+    backup_dir.mkdir()
+    data = os.urandom(3*1024*1024)
+    (backup_dir / 'backup@1.tar.gz').write_bytes(data)
+    creds = tmp_path / 'creds.json'
+    creds.write_text('{}')
+    storages = [str(tmp_path / 'nfs1'), str(tmp_path / 'nfs2'), 'drive']
+
+    def upload_stream(creds, chunks, mimetype, name, folder_id):
+        next(chunks)
+        raise IOError('Connection reset')
+        yield
+
+    with patch('cobra.google_drive.folder_list', return_value=[]), \
+         patch('cobra.google_drive.upload_stream', side_effect=upload_stream), \
+         patch('cobra.google_drive.upload_file') as upload_file_mock:
+        with pytest.raises(CobraApiError, match=r'\[1\] of \[3\] destinations: drive:folder-id'):
+            sut.backup_push(['backup@1.tar.gz'], str(creds), ['host1', 'host1', 'folder-id'], 
+                            backup_dir=str(backup_dir), storage=storages)
+
+    upload_file_mock.assert_not_called()
+    assert (tmp_path / 'nfs1' / 'host1' / 'backup@1.tar.gz').read_bytes() == data
+    assert (tmp_path / 'nfs2' / 'host1' / 'backup@1.tar.gz').read_bytes() == data
+    hooks = [c.args[0] for c in hooks_mock.call_args_list]
+    assert hooks == ['before_push']
+
+    # only the destination missing the file gets it
+    (tmp_path / 'nfs2' / 'host1' / 'backup@1.tar.gz').unlink()
+    with patch('cobra.storage.LocalStorage.upload_stream') as upload_stream_mock:
+        sut.backup_push(['backup@1.tar.gz'], None, 'host1', backup_dir=str(backup_dir), storage=storages[:2])
+    upload_stream_mock.assert_not_called()
+    assert (tmp_path / 'nfs2' / 'host1' / 'backup@1.tar.gz').read_bytes() == data
+
+
+def test_prune_must_remove_backups_not_kept_with_manifests(sut, tmp_path):
+    backup_dir, storage, cache_dir = tmp_path / 'backups', tmp_path / 'nfs', tmp_path / 'cache'
+    (backup_dir / '.cobra').mkdir(parents=True)
+    (storage / 'host1' / 'manifests').mkdir(parents=True)
+    cache_dir.mkdir()
+    names = [f'backup@2023020{i}.000000.tar.gz' for i in range(1, 5)]
+    for fn in names:
+        for d in (backup_dir, storage / 'host1', cache_dir):
+            (d / fn).write_bytes(b'data')
+        (backup_dir / '.cobra' / f'{fn}.manifest.json').write_text('{}')
+        (storage / 'host1' / 'manifests' / f'{fn}.manifest.json').write_text('{}')
+    (backup_dir / 'notes.txt').write_text('not a backup')
+    catalog = Catalog(str(backup_dir / '.cobra' / 'catalog.db'))
+    for fn in names:
+        catalog.add(fn, dict(files=dict()))
+    # the latest is incremental on top of the first one
+    catalog.add(names[3], dict(files=dict()), base=names[0])
+
+    kwargs = dict(backup_dir=str(backup_dir), cache_dir=str(cache_dir), remote=True, local=True, cache=True,
+                  folder_id='host1', storage=str(storage), keep_last=1)
+    rv = sut.backup_prune(dry_run=True, **kwargs)
+    assert [[f['name'] for f in removed] for removed in rv.values()] == [names[1:3]] * 3
+    assert len(os.listdir(storage / 'host1')) == 5
+
+    rv = sut.backup_prune(**kwargs)
+    assert list(rv) == [str(storage / 'host1'), str(backup_dir), str(cache_dir)]
+    assert sorted(os.listdir(storage / 'host1')) == [names[0], names[3], 'manifests']
+    assert sorted(os.listdir(storage / 'host1' / 'manifests')) == [f'{names[0]}.manifest.json', f'{names[3]}.manifest.json']
+    assert sorted(fn for fn in os.listdir(backup_dir) if not fn.startswith('.')) == [names[0], names[3], 'notes.txt']
+    assert sorted(os.listdir(backup_dir / '.cobra')) == [f'{names[0]}.manifest.json', f'{names[3]}.manifest.json', 'catalog.db']
+    assert catalog.backups() == [names[0], names[3]]
+    assert sorted(os.listdir(cache_dir)) == [names[0], names[3]]
+
+
+def test_prune_must_check_args(sut):
+    with pytest.raises(CobraCliError, match='policy'):
+        sut.backup_prune(local=True)
+    with pytest.raises(CobraCliError, match='Nothing to prune'):
+        sut.backup_prune(keep_last=1)
 
 @pytest.mark.parametrize('original_fn, fn', [(pytest.lazy_fixture('full_filename'), pytest.lazy_fixture('full_filename')),
                                              (filename(), join(default_cache_dir(), filename()))])
@@ -338,5 +775,465 @@ def test_restore_must_create_volumes_and_call_container_to_restore_files(sut, or
     metadata[host_backup_dir] = dict(bind='/backup', mode='ro')
     container_backup_archive_dir = join('/backup', backup_name, '*')
     command=['sh', '-c', f'cp -rf {container_backup_archive_dir} {container_volumes_mount_dir}']
-    docker_client_mock.containers.run.assert_called_with('busybox', remove=True, volumes=metadata, command=command)
+    docker_client_mock.containers.run.assert_called_with(HELPER_IMAGE, remove=True, volumes=metadata, command=command)
+
+
+
+def test_restore_must_pick_decompressor_by_archive_type(sut, check_output_mock, open_mock, makedirs_mock, 
+                                                       json_load_mock):
+    fn = '/some/file/backup@20230204.211624.tar.zst'
+    with patch('cobra.archive.check_program') as check_program_mock:
+        sut.backup_restore(fn)
+
+    check_output_mock.assert_called_with(['tar', 'xvf', fn, '-C', '/some/file', '-I', 'zstd'])
+    check_program_mock.assert_called_with('zstd')
+    open_mock.assert_called_with(join('/some/file', 'backup@20230204.211624', METADATA_FN))
+
+
+def test_restore_must_extract_parts(sut, check_output_mock, tmp_path, docker_client_mock):
+    backup_dir = tmp_path / 'backup@20230204.211624'
+    backup_dir.mkdir()
+    parts = { 'volume1': 'volume1.tar.zst', str(tmp_path / 'dir1'): 'dir1.tar' }
+    metadata = { 
+        'volume1': dict(bind='/backup@20230204.211624/volume1', mode='ro', driver='local', options=None, labels=None),
+        str(tmp_path / 'dir1'): dict(bind='/backup@20230204.211624/dir1', mode='ro'),
+        METADATA_INFO_KEY: dict(version=API_VERSION, compression='zstd', level=None, format='parts', parts=parts)
+    }
+    (backup_dir / METADATA_FN).write_text(json.dumps(metadata))
+    for part in parts.values():
+        (backup_dir / part).write_bytes(b'')
+
+    with patch('cobra.archive.check_program'):
+        sut.backup_restore(str(tmp_path / 'backup@20230204.211624.tar'), keep_extracted=True)
+
+    check_output_mock.assert_has_calls([
+        call(['tar', 'xvf', str(tmp_path / 'backup@20230204.211624.tar'), '-C', str(tmp_path)]),
+        call(['tar', 'xvf', str(backup_dir / 'volume1.tar.zst'), '-C', str(backup_dir), '-I', 'zstd']),
+        call(['tar', 'xvf', str(backup_dir / 'dir1.tar'), '-C', str(backup_dir)]),
+    ])
+    assert listdir(backup_dir) == [METADATA_FN]
+    docker_client_mock.volumes.create.assert_called_with('volume1', driver='local', labels=None, driver_opts=None)
+
+
+def test_incremental_build_must_archive_changed_files_only_and_restore_must_replay_chain(sut, docker_client_mock, tmp_path):
+    volume1 = { 'volume1/same': b'same', 'volume1/changed': b'old', 'volume1/deleted': b'deleted' }
+    make_helper_containers(docker_client_mock, files={ 'volume1': None } | volume1)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        full_fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, 
+                                   compression='none', parallel=1)
+
+    volume1 = { 'volume1/same': b'same', 'volume1/changed': b'newer', 'volume1/added': b'added' }
+    make_helper_containers(docker_client_mock, files={ 'volume1': None } | volume1)
+    with freeze_time(datetime(year=2000, month=5, day=6)):
+        inc_fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, 
+                                  compression='none', incremental=True, parallel=1)
+
+    inc_name = basename(inc_fn)[:-len('.tar')]
+    with tarfile.open(inc_fn) as tar:
+        metadata = json.load(tar.extractfile(join(inc_name, METADATA_FN)))
+        assert metadata[METADATA_INFO_KEY]['base'] == basename(full_fn)
+        manifest = json.load(tar.extractfile(join(inc_name, MANIFEST_FN)))
+        assert manifest['deleted'] == ['volume1/deleted']
+        assert sorted(manifest['files']) == ['volume1', 'volume1/added', 'volume1/changed', 'volume1/same']
+        with tarfile.open(fileobj=tar.extractfile(join(inc_name, 'volume1.tar'))) as part_tar:
+            assert sorted(part_tar.getnames()) == ['volume1', 'volume1/added', 'volume1/changed']
+
+    sut.backup_restore(inc_fn, cache_dir=tmp_path, keep_extracted=True)
+    restored_dir = tmp_path / inc_name / 'volume1'
+    assert sorted(listdir(restored_dir)) == ['added', 'changed', 'same']
+    for fn, data in volume1.items():
+        assert (tmp_path / inc_name / fn).read_bytes() == data
+
+
+def test_incremental_build_must_fail_if_base_not_found(sut, tmp_path):
+    with pytest.raises(CobraApiError):
+        sut.backup_build(host_backup_dir=tmp_path, base='backup@20000505.000000.tar')
+
+
+def test_dedup_build_must_store_chunks_once_and_restore_must_join_them(sut, docker_client_mock, tmp_path):
+    data = random.Random(0).randbytes(3*1024*1024)
+    backups = list()
+    for day in (5, 6):
+        backup_name = f'backup@200005{day:02}.000000'
+        make_helper_containers(docker_client_mock, files={ backup_name: None, f'{backup_name}/volume1': None, 
+                                                          f'{backup_name}/volume1/file': data })
+        with freeze_time(datetime(year=2000, month=5, day=day)):
+            backups.append(sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, dedup=True))
+
+    assert [basename(fn) for fn in backups] == ['backup@20000505.000000.idx', 'backup@20000506.000000.idx']
+    indices = [json.loads(open(fn).read()) for fn in backups]
+    assert indices[0]['name'] == 'backup@20000505.000000'
+    assert sum(size for _, size in indices[0]['chunks']) > len(data)
+    shared = set(d for d, _ in indices[0]['chunks']) & set(d for d, _ in indices[1]['chunks'])
+    # only the chunks holding the metadata and the manifest differ
+    assert len(shared) >= len(indices[0]['chunks']) - 2
+    assert (tmp_path / '.cobra' / 'backup@20000506.000000.idx.manifest.json').exists()
+
+    sut.backup_restore(backups[1], cache_dir=tmp_path, keep_extracted=True)
+    assert (tmp_path / 'backup@20000506.000000' / 'volume1' / 'file').read_bytes() == data
+    metadata = json.loads((tmp_path / 'backup@20000506.000000' / METADATA_FN).read_text())
+    assert metadata[METADATA_INFO_KEY]['format'] == 'dedup'
+    docker_client_mock.containers.run.assert_called_once()
+
+
+def test_dedup_build_must_reject_stream_and_parallel(sut):
+    with pytest.raises(CobraCliError):
+        sut.backup_build(dedup=True, parallel=2)
+
+
+def test_push_must_upload_missing_chunks_only(sut, tmp_path, upload_file_mock, folder_list_mock):
+    chunk_store = ChunkStore(tmp_path / '.cobra' / 'chunks')
+    index = list()
+    for data in (b'one', b'two', b'three'):
+        d = hashlib.sha256(data).hexdigest()
+        chunk_store.put(d, data)
+        index.append([d, len(data)])
+    write_index(tmp_path / 'backup.idx', index)
+    creds = tmp_path / 'creds.json'
+    creds.write_text('{}')
+
+    with patch('cobra.google_drive.ensure_folder', return_value='chunks-id') as ensure_folder_mock, \
+         patch('cobra.google_drive.names_list', return_value={ index[0][0]: 'id0' }), \
+         patch('cobra.google_drive.upload_bytes') as upload_bytes_mock:
+        sut.backup_push(['backup.idx'], creds=str(creds), folder_id='folder-id', backup_dir=tmp_path)
+
+    ensure_folder_mock.assert_called_with(str(creds), 'folder-id', 'chunks')
+    assert sorted(c.args[2] for c in upload_bytes_mock.call_args_list) == sorted(d for d, _ in index[1:])
+    for c in upload_bytes_mock.call_args_list:
+        assert c.args[3] == 'chunks-id'
+    upload_file_mock.assert_called_once()
+    assert upload_file_mock.call_args.args[2] == 'application/json'
+
+
+def capture_put_archive(docker_client_mock):
+    '''
+    Makes the helper container collect the data put into it. Returns the dict to get the tar data from.
+    '''
+    captured = dict()
+    def create(image, volumes):
+        container = MagicMock()
+        def put_archive(path, data):
+            captured['path'], captured['volumes'] = path, volumes
+            captured['data'] = b''.join(data)
+        container.put_archive.side_effect = put_archive
+        return container
+
+    docker_client_mock.containers.create.side_effect = create
+    return captured
+
+
+@pytest.mark.parametrize('parallel', [None, 1])
+def test_streaming_restore_must_put_archive_into_volumes_without_extracting(sut, docker_client_mock, tmp_path, parallel):
+    backup_name = 'backup@20000505.000000'
+    files = { 'volume1': None, 'volume1/file': b'data', 'volume1/dir': None, 'volume1/dir/file': b'more' }
+    if not parallel:
+        files = { backup_name: None } | { join(backup_name, k): v for k, v in files.items() }
+    make_helper_containers(docker_client_mock, files=files)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, compression='none', parallel=parallel)
+
+    captured = capture_put_archive(docker_client_mock)
+    sut.backup_restore(fn, stream=True)
+
+    docker_client_mock.volumes.create.assert_called_with('volume1', driver='local', labels=None, driver_opts=None)
+    docker_client_mock.containers.run.assert_not_called()
+    assert captured['path'] == '/'
+    assert captured['volumes'] == { 'volume1': dict(bind=f'/{backup_name}/volume1', mode='rw') }
+    with tarfile.open(fileobj=io.BytesIO(captured['data'])) as tar:
+        names = tar.getnames()
+        assert join(backup_name, METADATA_FN) not in names
+        assert join(backup_name, MANIFEST_FN) not in names
+        assert tar.extractfile(f'{backup_name}/volume1/file').read() == b'data'
+        assert tar.extractfile(f'{backup_name}/volume1/dir/file').read() == b'more'
+    assert not (tmp_path / backup_name).exists()
+
+
+def test_streaming_restore_must_reject_incremental_backup(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock, files={ 'volume1': None, 'volume1/file': b'data' })
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, compression='none', parallel=1)
+    with freeze_time(datetime(year=2000, month=5, day=6)):
+        fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, 
+                              compression='none', parallel=1, incremental=True)
+
+    with pytest.raises(CobraApiError):
+        sut.backup_restore(fn, stream=True)
+
+
+def test_streaming_restore_must_fail_if_data_precedes_metadata(sut, docker_client_mock, tmp_path):
+    fn = tmp_path / 'backup@20000505.000000.tar'
+    fn.write_bytes(make_tar({ 'backup@20000505.000000/volume1/file': b'data', 
+                              f'backup@20000505.000000/{METADATA_FN}': b'{}' }))
+    with pytest.raises(CobraApiError):
+        sut.backup_restore(str(fn), stream=True)
+
+
+def test_pull_must_restore_while_downloading_if_stream(sut, docker_client_mock, tmp_path, exists_mock):
+    backup_name = 'backup@20000505.000000'
+    metadata = { 'volume1': dict(bind=f'/{backup_name}/volume1', driver='local', options=None, labels=None) }
+    data = make_tar({ f'{backup_name}/{METADATA_FN}': json.dumps(metadata).encode(), 
+                      f'{backup_name}/volume1/file': b'data' })
+    captured = capture_put_archive(docker_client_mock)
+    with patch('cobra.google_drive.file_name', return_value=f'{backup_name}.tar'), \
+         patch('cobra.google_drive.download_stream', return_value=iter([data[:1000], data[1000:]])), \
+         patch('cobra.google_drive.download_file') as download_file_mock:
+        sut.backup_pull(creds='creds.json', file_id='file-id', restore=True, stream=True, cache_dir=tmp_path)
+
+    download_file_mock.assert_not_called()
+    with tarfile.open(fileobj=io.BytesIO(captured['data'])) as tar:
+        assert tar.extractfile(f'{backup_name}/volume1/file').read() == b'data'
+    assert listdir(tmp_path) == list()
+
+
+def test_parallel_restore_must_copy_every_volume_by_own_container(sut, scratch_datetime, docker_client_mock, 
+                                                                 backup_name, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(scratch_datetime):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+
+    sut.backup_restore(fn, parallel=2, keep_extracted=True)
+
+    assert docker_client_mock.volumes.create.call_count == len(VOLUMES)
+    assert docker_client_mock.containers.run.call_count == len(VOLUMES)
+    for v in VOLUMES:
+        docker_client_mock.containers.run.assert_any_call(
+            HELPER_IMAGE, remove=True, 
+            volumes={ v['Name']: dict(bind=f'/{backup_name}/{v["Name"]}', mode='rw'), 
+                      str(tmp_path): dict(bind='/backup', mode='ro') },
+            command=['sh', '-c', f'cp -rf /backup/{backup_name}/{v["Name"]} /{backup_name}'])
+        assert (tmp_path / backup_name / v['Name'] / 'file').read_bytes() == v['Name'].encode()
+
+
+def make_warm_helper(docker_client_mock, output=b''):
+    container = docker_client_mock.containers.create.return_value
+    container.status = 'running'
+    container.client.api.exec_create.return_value = dict(Id='exec-id')
+    container.client.api.exec_start.side_effect = lambda *args, **kwargs: iter([(output, None)])
+    container.client.api.exec_inspect.return_value = dict(ExitCode=0)
+    return container
+
+
+def test_warm_build_must_read_by_exec_and_reuse_helper(sut, scratch_datetime, docker_client_mock, backup_name, tmp_path):
+    container = make_warm_helper(docker_client_mock, make_tar({ 'cobra': None, 'cobra/volume1': None, 
+                                                                'cobra/volume1/file': b'data' }))
+    with freeze_time(scratch_datetime):
+        rv = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, warm_helpers=True)
+
+    docker_client_mock.containers.run.assert_not_called()
+    _, kwargs = docker_client_mock.containers.create.call_args
+    assert kwargs['volumes'] == { 'volume1': dict(bind='/cobra/volume1', mode='ro') }
+    container.client.api.exec_create.assert_called_with(container.id, ['tar', '-c', '-f', '-', '-C', '/', 'cobra'], 
+                                                        stdout=True, stderr=True)
+    container.remove.assert_not_called()
+    with tarfile.open(rv) as tar:
+        assert tar.getnames() == [join(backup_name, METADATA_FN), backup_name, 
+                                  f'{backup_name}/volume1', f'{backup_name}/volume1/file', join(backup_name, MANIFEST_FN)]
+        assert tar.extractfile(f'{backup_name}/volume1/file').read() == b'data'
+
+    docker_client_mock.containers.list.return_value = [container]
+    with freeze_time(scratch_datetime):
+        sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path / 'again', warm_helpers=True)
+
+    docker_client_mock.containers.create.assert_called_once()
+
+
+def test_warm_restore_must_copy_by_exec(sut, scratch_datetime, docker_client_mock, backup_name, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(scratch_datetime):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+
+    docker_client_mock.containers.create.side_effect = None
+    container = make_warm_helper(docker_client_mock)
+    sut.backup_restore(fn, parallel=2, warm_helpers=True)
+
+    docker_client_mock.containers.run.assert_not_called()
+    container.remove.assert_not_called()
+    for v in VOLUMES:
+        docker_client_mock.containers.create.assert_any_call(
+            HELPER_IMAGE, command=ANY, labels=ANY,
+            volumes={ v['Name']: dict(bind=f'/cobra/{v["Name"]}', mode='rw'), 
+                      str(tmp_path): dict(bind='/backup', mode='ro') })
+        container.client.api.exec_create.assert_any_call(
+            container.id, ['sh', '-c', f'cp -rf /backup/{backup_name}/{v["Name"]} /cobra'], stdout=True, stderr=True)
+
+
+def test_parallel_restore_must_report_failed_volumes(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(datetime(year=2023, month=2, day=4)):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+
+    def run(image, remove, volumes, command):
+        if 'volume2' in volumes:
+            raise RuntimeError('copy failed')
+
+    docker_client_mock.containers.run.side_effect = run
+    with pytest.raises(CobraApiError) as e:
+        sut.backup_restore(fn, parallel=3)
+
+    assert str(e.value.args[0]) == "Failed to restore ['volume2']"
+    assert docker_client_mock.containers.run.call_count == len(VOLUMES)
+
+
+def test_streaming_restore_must_reject_parallel(sut):
+    with pytest.raises(CobraCliError):
+        sut.backup_restore('backup.tar', stream=True, parallel=2)
+
+
+def test_restore_must_remove_extracted_tree_and_evict_cache_over_budget(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+    stale_fn = tmp_path / 'backup@19990505.000000.tar'
+    stale_fn.write_bytes(b'0' * 1024)
+    os.utime(stale_fn, (1, 1))
+
+    sut.backup_restore(fn, cache_dir=tmp_path, cache_size=os.stat(fn).st_size)
+
+    assert sorted(fn for fn in listdir(tmp_path) if not fn.startswith('.')) == [basename(fn)]
+    assert docker_client_mock.containers.run.called
+
+
+def test_restore_must_extract_only_selected_volumes(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+
+    backup_name = 'backup@20000505.000000'
+    sut.backup_restore(fn, only_volume=['volume2'], keep_extracted=True)
+
+    assert sorted(listdir(tmp_path / backup_name)) == [METADATA_FN, MANIFEST_FN, 'volume2']
+    assert (tmp_path / backup_name / 'volume2' / 'file').read_bytes() == b'volume2'
+    docker_client_mock.volumes.create.assert_called_once_with('volume2', driver='local', labels=None, driver_opts=None)
+    assert docker_client_mock.containers.run.call_args.kwargs['volumes'] == { 
+        'volume2': dict(bind=f'/{backup_name}/volume2', mode='rw'), str(tmp_path): dict(bind='/backup', mode='ro') }
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_restore_must_extract_only_files_matching_path(sut, docker_client_mock, tmp_path, stream):
+    backup_name = 'backup@20000505.000000'
+    files = { backup_name: None, f'{backup_name}/volume1': None, f'{backup_name}/volume1/etc': None,
+              f'{backup_name}/volume1/etc/app.conf': b'conf', f'{backup_name}/volume1/etc/app.yml': b'yml', 
+              f'{backup_name}/volume1/data': b'data' }
+    make_helper_containers(docker_client_mock, files=files)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, compression='none')
+
+    captured = capture_put_archive(docker_client_mock)
+    sut.backup_restore(fn, path=['volume1/etc/*.conf'], stream=stream, keep_extracted=True)
+
+    if stream:
+        with tarfile.open(fileobj=io.BytesIO(captured['data'])) as tar:
+            assert [n for n in tar.getnames() if n.startswith(f'{backup_name}/volume1/')] == [f'{backup_name}/volume1/etc/app.conf']
+    else:
+        assert sorted(listdir(tmp_path / backup_name / 'volume1')) == ['etc']
+        assert listdir(tmp_path / backup_name / 'volume1' / 'etc') == ['app.conf']
+
+
+def test_restore_must_fail_if_nothing_selected(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock)
+    with freeze_time(datetime(year=2000, month=5, day=5)):
+        fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+
+    with pytest.raises(CobraApiError):
+        sut.backup_restore(fn, only_volume=['unknown'])
+
+
+def test_seekable_build_must_index_members_and_restore_must_read_only_their_frames(sut, docker_client_mock, tmp_path):
+    files = { 'volume1': None } | { f'volume1/file{i}': random.Random(i).randbytes(50000) for i in range(8) }
+    make_helper_containers(docker_client_mock, files=files)
+    with freeze_time(datetime(year=2000, month=5, day=5)), patch('cobra.compression.FRAME_SIZE', 65536):
+        fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=tmp_path, seekable=True)
+
+    backup_name = 'backup@20000505.000000'
+    assert basename(fn) == f'{backup_name}.tar'
+    with tarfile.open(fn) as tar:
+        metadata = json.load(tar.extractfile(join(backup_name, METADATA_FN)))
+        assert metadata[METADATA_INFO_KEY]['seekable']
+        members_index = json.load(tar.extractfile(join(backup_name, '...index')))
+        part = members_index['volume1.tar.gz']
+        assert part['offset'] == tar.getmember(join(backup_name, 'volume1.tar.gz')).offset_data
+        assert len(part['frames']) > 1
+        assert sorted(part['members']) == sorted(files)
+
+    with patch('cobra.archive.decompress_range', wraps=decompress_range) as decompress_range_mock:
+        sut.backup_restore(fn, path=['volume1/file5'], keep_extracted=True)
+
+    (_, _, _, _, _, start, end), = [c.args for c in decompress_range_mock.call_args_list]
+    assert [start, end] == part['members']['volume1/file5']
+    assert listdir(tmp_path / backup_name / 'volume1') == ['file5']
+    assert (tmp_path / backup_name / 'volume1' / 'file5').read_bytes() == files['volume1/file5']
+
+
+def test_pull_must_restore_selected_files_reading_remote_seekable_backup_by_ranges(sut, docker_client_mock, tmp_path):
+    files = { 'volume1': None } | { f'volume1/file{i}': random.Random(i).randbytes(300000) for i in range(8) }
+    make_helper_containers(docker_client_mock, files=files)
+    backup_dir = tmp_path / 'backup'
+    with freeze_time(datetime(year=2000, month=5, day=5)), patch('cobra.compression.FRAME_SIZE', 65536):
+        fn = sut.backup_build(include_volumes=['volume1'], host_backup_dir=backup_dir, seekable=True)
+
+    data = open(fn, 'rb').read()
+    service, ranges = make_drive_service(data, basename(fn))
+    cache_dir = tmp_path / 'cache'
+    with patch('cobra.google_drive._service', return_value=service), \
+         patch('cobra.google_drive.BLOCK_SIZE', 65536), \
+         patch('cobra.google_drive.download_file') as download_file_mock:
+        sut.backup_pull(creds=__file__, file_id='file-id', restore=True, path=['volume1/file3'], cache_dir=cache_dir, keep_extracted=True)
+
+    download_file_mock.assert_not_called()
+    assert sum(end - start for start, end in ranges) < len(data) / 4
+    restored_dir = cache_dir / 'backup@20000505.000000' / 'volume1'
+    assert listdir(restored_dir) == ['file3']
+    assert (restored_dir / 'file3').read_bytes() == files['volume1/file3']
+
+
+def test_reindex_must_pull_missing_manifests_and_rebuild_catalog(sut, tmp_path):
+    creds = str(tmp_path / 'creds.json')
+    open(creds, 'w').close()
+    state_dir = tmp_path / '.cobra'
+    state_dir.mkdir()
+    local = dict(files={ 'volume1/file': dict(type='file', size=1, mtime=1, mode=0o644, hash='a') }, deleted=[])
+    (state_dir / 'backup@1.tar.gz.manifest.json').write_text(json.dumps(local))
+    remote = dict(local, base='backup@1.tar.gz')
+    with patch('cobra.google_drive.ensure_folder', return_value='manifests-id') as ensure_folder_mock, \
+         patch('cobra.google_drive.names_list', return_value={ 'backup@1.tar.gz.manifest.json': 'id1', 
+                                                              'backup@2.tar.gz.manifest.json': 'id2' }), \
+         patch('cobra.google_drive.download_bytes', return_value=json.dumps(remote).encode()) as download_mock:
+        assert sut.backup_reindex(str(tmp_path), remote=True, creds=creds, folder_id='folder-id') == \
+            ['backup@1.tar.gz', 'backup@2.tar.gz']
+
+    ensure_folder_mock.assert_called_once_with(creds, 'folder-id', 'manifests')
+    download_mock.assert_called_once_with(creds, 'id2')
+    assert sut.backup_diff('backup@1.tar.gz', 'backup@2.tar.gz', backup_dir=str(tmp_path)) == \
+        dict(added=[], removed=[], changed=[])
+    with pytest.raises(CobraApiError):
+        sut.backup_diff('backup@1.tar.gz', 'backup@3.tar.gz', backup_dir=str(tmp_path))
+
+
+def test_push_must_skip_file_with_same_checksum_in_remote_folder(sut, tmp_path, upload_file_mock, folder_list_mock, hooks_mock):
+    creds = tmp_path / '.creds.json'
+    creds.write_text('{}')
+    data = b'backup data'
+    for name in ('backup@1.tar', 'backup@2.tar', 'backup@3.tar'):
+        (tmp_path / name).write_bytes(data)
+    md5 = hashlib.md5(data).hexdigest()
+    folder_list_mock.return_value = [dict(name='backup@1.tar', md5Checksum=md5, size=str(len(data))), 
+                                     dict(name='backup@2.tar', md5Checksum='other', size=str(len(data)))]
+
+    sut.backup_push([], str(creds), 'folder-id', backup_dir=str(tmp_path))
+
+    folder_list_mock.assert_called_once_with(str(creds), 'folder-id')
+    assert sorted(basename(c.args[1]) for c in upload_file_mock.call_args_list) == ['backup@2.tar', 'backup@3.tar']
+    assert [c.args[0] for c in hooks_mock.call_args_list].count('after_push') == 3
+    with open(tmp_path / '.cobra' / 'backup@1.tar.md5.json') as f:
+        assert json.load(f)['md5'] == md5
+
+
+def test_build_must_save_checksum_computed_while_writing(sut, docker_client_mock, tmp_path):
+    make_helper_containers(docker_client_mock)
+    fn = sut.backup_build(host_backup_dir=tmp_path, compression='none', parallel=2)
+    with open(tmp_path / '.cobra' / f'{basename(fn)}.md5.json') as f:
+        checksum = json.load(f)
 
+    with open(fn, 'rb') as f:
+        assert checksum['md5'] == hashlib.md5(f.read()).hexdigest()
+    assert checksum['size'] == os.stat(fn).st_size
@@ -0,0 +1,197 @@
+from cobra.compression import detect_engine, check_program, decompress, get_engine, decompress_range
+from cobra.stream import IterReader, chunks_of
+
+from fnmatch import fnmatchcase
+from os.path import basename
+from itertools import chain
+import tarfile
+import time
+import io
+
+
+# the member index of the seekable archive
+MEMBERS_INDEX_FN = '...index'
+
+
+def _tar_info(name, size, mode):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = mode
+    info.mtime = int(time.time())
+    return info
+
+
+def host_tar(fileobj, sources, root=None, bufsize=tarfile.RECORDSIZE):
+    '''
+    Writes the tar of the host directories laid out the same way as the one the helper container gives.
+    The symlinks are archived as is, the special files tar is not able to archive are skipped.
+
+    @param fileobj The file-like object to write the tar to
+    @param sources The dict of the member names to the host directories
+    @param root If given the directories are put under this top directory member
+    '''
+    with tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.GNU_FORMAT, bufsize=bufsize) as tar:
+        if root:
+            info = _tar_info(root, 0, 0o755)
+            info.type = tarfile.DIRTYPE
+            tar.addfile(info)
+
+        for name, path in sources.items():
+            tar.add(path, arcname=f'{root}/{name}' if root else name)
+
+
+def tar_member(name, data, mode=0o644):
+    '''
+    Returns tar header and padded data for a single file without the end of archive marker.
+    This way the result can be prepended to any other tar stream.
+    '''
+    info = _tar_info(name, len(data), mode)
+    _, remainder = divmod(len(data), tarfile.BLOCKSIZE)
+    padding = tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b''
+    return info.tobuf(format=tarfile.GNU_FORMAT) + data + padding
+
+
+def add_bytes(tar, name, data, mode=0o644):
+    tar.addfile(_tar_info(name, len(data), mode), io.BytesIO(data))
+
+
+def next_members(tar):
+    '''
+    Yields the members of the stream mode tar starting from the current position.
+    Unlike iterating the tar itself it never goes back to the members already read.
+    '''
+    while True:
+        member = tar.next()
+        if member is None:
+            return
+        yield member
+
+
+def extract_command(fn, dest_dir):
+    '''
+    Returns tar command extracting the given archive to dest_dir with the matching decompressor.
+    '''
+    command = ['tar', 'xvf', fn, '-C', dest_dir]
+    engine = detect_engine(fn)
+    # gnu tar recognizes gzip itself
+    if engine.name != 'gzip' and engine.decompress_program:
+        check_program(engine.decompress_program)
+        command += ['-I', engine.decompress_program]
+
+    return command
+
+
+def read_member(fn, name):
+    '''
+    Returns the content of the archive member streaming the archive up to it or None if not found.
+    '''
+    engine = detect_engine(fn)
+    with open(fn, 'rb') as f:
+        chunks = decompress(chunks_of(f), engine.name)
+        try:
+            with tarfile.open(fileobj=IterReader(chunks), mode='r|') as tar:
+                for info in tar:
+                    if info.name == name:
+                        return tar.extractfile(info).read()
+        finally:
+            chunks.close()
+
+    return None
+
+
+def _seekable(fileobj):
+    try:
+        return fileobj.seekable()
+    except AttributeError:
+        # the member of the stream mode tar
+        return False
+
+
+def open_member_tar(tar, member, compression):
+    '''
+    Opens the tar archive stored as the member of another one. 
+    The uncompressed one is opened in random access mode if possible so the skipped members are not read.
+    '''
+    fileobj = tar.extractfile(member)
+    if get_engine(compression).program is None and _seekable(fileobj):
+        return tarfile.open(fileobj=fileobj, mode='r:')
+
+    return tarfile.open(fileobj=IterReader(decompress(chunks_of(fileobj), compression)), mode='r|')
+
+
+def _merge_ranges(ranges):
+    merged = list()
+    for start, end in sorted(ranges):
+        if merged and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    return merged
+
+
+def read_members(fileobj, base, part_index, compression, select):
+    '''
+    Yields the selected members of the part built by frames along with their content file objects. 
+    Only the frames holding the members are read and decompressed. 
+    The adjacent members are read at once.
+
+    @param fileobj The seekable file object containing the part
+    @param base The offset of the part in fileobj
+    @param part_index The dict of the frames, the compressed size and the members [start, end) offsets of the part
+    @param select The function telling whether the member with the given name is selected
+    '''
+    ranges = [r for name, r in part_index['members'].items() if select(name)]
+    for start, end in _merge_ranges(ranges):
+        chunks = decompress_range(fileobj, base, part_index['frames'], part_index['size'], compression, start, end)
+        # the end of archive marker
+        chunks = chain(chunks, (tarfile.NUL * 2 * tarfile.BLOCKSIZE,))
+        with tarfile.open(fileobj=IterReader(chunks), mode='r|') as tar:
+            for member in next_members(tar):
+                yield member, tar.extractfile(member) if member.isreg() else None
+
+
+class Selection:
+    '''
+    Selects the backup members by volume names and path globs. The paths are relative to the backup root 
+    i.e. start with the volume name or the directory base name the same way as the manifest keys do.
+    Empty selection selects everything.
+    '''
+    def __init__(self, volumes=None, paths=None):
+        self.__volumes = set(volumes) if volumes else set()
+        self.__paths = list(paths) if paths else list()
+
+
+    def __bool__(self):
+        return bool(self.__volumes or self.__paths)
+
+
+    def bind(self, metadata):
+        '''
+        Resolves the directories given by the host path into the names they are archived under.
+        '''
+        self.__volumes |= { basename(opts['bind']) for key, opts in metadata.items() 
+                            if key in self.__volumes and isinstance(opts, dict) and 'bind' in opts }
+
+
+    def match(self, key):
+        components = key.split('/')
+        if self.__volumes and components[0] not in self.__volumes:
+            return False
+
+        if not self.__paths:
+            return True
+
+        # the directory matched selects everything beneath
+        ancestors = ['/'.join(components[:i]) for i in range(1, len(components) + 1)]
+        return any(fnmatchcase(a, p) for p in self.__paths for a in ancestors)
+
+
+    def match_volume(self, name):
+        '''
+        Tells whether the volume or the directory archived under the given name may contain selected members.
+        '''
+        if self.__volumes and name not in self.__volumes:
+            return False
+
+        return not self.__paths or any(fnmatchcase(name, p.split('/')[0]) for p in self.__paths)
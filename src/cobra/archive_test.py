@@ -0,0 +1,71 @@
+from cobra.archive import Selection, tar_member, next_members, read_members
+
+import pytest
+
+import io
+import tarfile
+
+
+def test_empty_selection_must_select_everything():
+    selection = Selection()
+    assert not selection
+    assert selection.match('volume1/file')
+    assert selection.match_volume('volume1')
+
+
+@pytest.mark.parametrize('volumes, paths, key, expected', [
+    (['volume1'], None, 'volume1/file', True),
+    (['volume1'], None, 'volume2/file', False),
+    (None, ['volume1/etc/*.conf'], 'volume1/etc/app.conf', True),
+    (None, ['volume1/etc/*.conf'], 'volume1/etc/app.yml', False),
+    (None, ['volume1/etc'], 'volume1/etc/sub/app.yml', True),
+    (None, ['*/etc'], 'volume2/etc/app.yml', True),
+    (['volume2'], ['*/etc'], 'volume1/etc/app.yml', False),
+])
+def test_selection_must_match_volumes_and_paths(volumes, paths, key, expected):
+    assert Selection(volumes, paths).match(key) == expected
+
+
+def test_selection_must_tell_volumes_possibly_containing_selected_members():
+    selection = Selection(paths=['volume1/etc', '*2/etc'])
+    assert selection.match_volume('volume1')
+    assert selection.match_volume('volume2')
+    assert not selection.match_volume('volume3')
+
+
+def test_selection_must_resolve_directories_by_metadata():
+    selection = Selection(['/host/dir'])
+    selection.bind({ '/host/dir': dict(bind='/backup@20000505.000000/dir1234'), '@cobra': dict(version='1.0') })
+    assert selection.match('dir1234/file')
+    assert not selection.match('dir/file')
+
+
+def test_next_members_must_not_go_back():
+    data = tar_member('a', b'a') + tar_member('b', b'b') + tarfile.NUL * 2 * tarfile.BLOCKSIZE
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r|') as tar:
+        assert next(next_members(tar)).name == 'a'
+        assert [m.name for m in next_members(tar)] == ['b']
+
+
+def test_read_members_must_read_only_selected_members_by_frames():
+    from cobra.compression import compress_frames
+
+    names = [f'volume1/file{i}' for i in range(8)]
+    f = io.BytesIO()
+    offsets = dict()
+    with tarfile.open(fileobj=f, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        for name in names:
+            data = name.encode() * 2000
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            start = tar.offset
+            tar.addfile(info, io.BytesIO(data))
+            offsets[name] = [start, tar.offset]
+
+    frames = list()
+    compressed = b''.join(compress_frames([f.getvalue()], frames, 'gzip', frame_size=16384))
+    part_index = dict(size=len(compressed), frames=frames, members=offsets)
+    selected = { 'volume1/file2', 'volume1/file3', 'volume1/file6' }
+    rv = [(m.name, fileobj.read()) for m, fileobj in 
+          read_members(io.BytesIO(compressed), 0, part_index, 'gzip', lambda name: name in selected)]
+    assert rv == [(name, name.encode() * 2000) for name in sorted(selected)]
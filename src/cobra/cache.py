@@ -0,0 +1,230 @@
+from cobra.exc import CobraCliError
+from cobra.dedup import CHUNKS_DIR, is_index, index_basename
+from cobra.compression import archive_basename
+
+from os.path import join, exists, isdir, islink, basename
+import os
+import re
+import shutil
+import time
+
+
+STATE_DIR = '.cobra'
+PINS_DIR = 'pins'
+BLOCKS_DIR = 'blocks'
+_UNITS = dict(K=1024, M=1024**2, G=1024**3, T=1024**4)
+
+
+def parse_size(value):
+    '''
+    Parses the size given in bytes or with K, M, G or T suffix e.g. 512M.
+    '''
+    m = re.fullmatch(r'(\d+)([KMGT]?)B?', value.strip().upper())
+    if m is None:
+        raise CobraCliError(f'Invalid size [{value}]. Expected bytes number optionally followed by K, M, G or T')
+
+    number, unit = m.groups()
+    return int(number) * _UNITS.get(unit, 1)
+
+
+def _size(path):
+    if islink(path) or not isdir(path):
+        return os.lstat(path).st_size
+
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for fn in filenames:
+            try:
+                total += os.lstat(join(dirpath, fn)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CacheManager:
+    '''
+    Keeps the cache directory within the byte budget evicting the least recently used entries.
+    The entries are the pulled backup files and the extracted trees in the cache directory itself,
+    the remote file blocks and the deduplicated chunks. The files pinned by the running processes
+    are never evicted, the chunks are not evicted while any index is pinned. Without the budget 
+    the manager does nothing at all, so the runs with no budget don't pin the files they use.
+    The last use time is kept as the file access time set explicitly, so it doesn't depend on the mount options.
+    '''
+    def __init__(self, cache_dir, budget=None):
+        '''
+        @param cache_dir The cache directory
+        @param budget The size in bytes the cache is kept within, None means unlimited
+        '''
+        self.__cache_dir = cache_dir
+        self.__budget = budget
+        self.__pins = list()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.release()
+
+
+    def __pins_dir(self):
+        return join(self.__cache_dir, STATE_DIR, PINS_DIR)
+
+
+    def pin(self, name):
+        '''
+        Protects the file with the given name in the cache directory from eviction until released.
+        '''
+        if self.__budget is None:
+            return
+
+        os.makedirs(self.__pins_dir(), exist_ok=True)
+        pin_fn = join(self.__pins_dir(), f'{basename(name)}.{os.getpid()}')
+        open(pin_fn, 'w').close()
+        self.__pins.append(pin_fn)
+
+
+    def release(self):
+        while self.__pins:
+            pin_fn = self.__pins.pop()
+            if exists(pin_fn):
+                os.remove(pin_fn)
+
+
+    def pinned(self):
+        '''
+        Returns the set of the names pinned by the processes alive.
+        '''
+        if not exists(self.__pins_dir()):
+            return set()
+
+        names = set()
+        for fn in os.listdir(self.__pins_dir()):
+            name, _, pid = fn.rpartition('.')
+            if pid.isdigit() and _alive(int(pid)):
+                names.add(name)
+                continue
+
+            try:
+                os.remove(join(self.__pins_dir(), fn))
+            except FileNotFoundError:
+                pass
+        return names
+
+
+    def touch(self, name):
+        '''
+        Marks the entry as used just now.
+        '''
+        path = join(self.__cache_dir, basename(name))
+        if self.__budget is not None and exists(path):
+            now = time.time()
+            os.utime(path, (now, os.stat(path).st_mtime))
+
+
+    def entries(self):
+        '''
+        Returns the list of (path, size, last use time) of the entries that may be evicted.
+        '''
+        paths = [join(self.__cache_dir, fn) for fn in os.listdir(self.__cache_dir) if not fn.startswith('.')] \
+            if exists(self.__cache_dir) else list()
+
+        blocks_dir = join(self.__cache_dir, STATE_DIR, BLOCKS_DIR)
+        if exists(blocks_dir):
+            paths.extend(join(blocks_dir, fn) for fn in os.listdir(blocks_dir))
+
+        chunks_dir = join(self.__cache_dir, STATE_DIR, CHUNKS_DIR)
+        if exists(chunks_dir):
+            for dirpath, _, filenames in os.walk(chunks_dir):
+                paths.extend(join(dirpath, fn) for fn in filenames)
+
+        rv = list()
+        for path in paths:
+            try:
+                rv.append((path, _size(path), os.lstat(path).st_atime))
+            except FileNotFoundError:
+                pass
+        return rv
+
+
+    def usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+
+    def evict(self, reserve=0):
+        '''
+        Removes the least recently used entries not pinned until the cache and the reserved bytes fit the budget.
+        Returns the list of the paths removed.
+        '''
+        if self.__budget is None:
+            return list()
+
+        pinned = self.pinned()
+        # the trees are extracted next to the backup files under the name without extension
+        protected = pinned | { index_basename(n) if is_index(n) else archive_basename(n) for n in pinned }
+        chunks_dir = join(self.__cache_dir, STATE_DIR, CHUNKS_DIR)
+        keep_chunks = any(is_index(n) for n in pinned)
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = list()
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total + reserve <= self.__budget:
+                break
+
+            if basename(path) in protected or (keep_chunks and path.startswith(chunks_dir)):
+                continue
+
+            self.__remove(path)
+            total -= size
+            removed.append(path)
+
+        return removed
+
+
+    def remove(self, name):
+        '''
+        Removes the backup file along with the tree extracted from it unless it's pinned. 
+        Returns whether it's removed.
+        '''
+        name = basename(name)
+        if name in self.pinned():
+            return False
+
+        self.__remove(join(self.__cache_dir, name))
+        tree = join(self.__cache_dir, index_basename(name) if is_index(name) else archive_basename(name))
+        if exists(tree):
+            self.__remove(tree)
+        return True
+
+
+    def reserve(self, name, size):
+        '''
+        Pins the file about to be downloaded and makes room for it.
+        '''
+        self.pin(name)
+        self.evict(size)
+
+
+    def __remove(self, path):
+        if isdir(path) and not islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif exists(path):
+            os.remove(path)
+
+        # the checksum, the partial download and its journal of the backup file
+        parent, name = os.path.split(path)
+        if parent == self.__cache_dir:
+            for fn in os.listdir(parent):
+                if fn.startswith(f'.{name}.'):
+                    os.remove(join(parent, fn))
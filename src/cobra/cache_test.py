@@ -0,0 +1,82 @@
+from cobra.cache import CacheManager, parse_size
+from cobra.exc import CobraCliError
+
+import pytest
+import os
+
+
+def put(path, size, atime):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'0' * size)
+    os.utime(path, (atime, atime))
+
+
+def test_parse_size_must_accept_suffixes():
+    assert parse_size('512') == 512
+    assert parse_size('2K') == 2048
+    assert parse_size('10g') == 10*1024**3
+    with pytest.raises(CobraCliError):
+        parse_size('ten')
+
+
+def test_evict_must_remove_least_recently_used_first(tmp_path):
+    put(tmp_path / 'backup@1.tar.gz', 100, 1)
+    put(tmp_path / '.backup@1.tar.gz.md5', 10, 1)
+    put(tmp_path / 'backup@2.tar.gz', 100, 3)
+    put(tmp_path / '.cobra' / 'blocks' / 'file-id.md5', 100, 2)
+    cache = CacheManager(str(tmp_path), budget=250)
+    assert cache.evict(reserve=50) == [str(tmp_path / 'backup@1.tar.gz')]
+    assert sorted(os.listdir(tmp_path)) == ['.cobra', 'backup@2.tar.gz']
+    assert cache.evict(reserve=100) == [str(tmp_path / '.cobra' / 'blocks' / 'file-id.md5')]
+
+
+def test_evict_must_skip_pinned_files_and_their_trees(tmp_path):
+    put(tmp_path / 'backup@1.tar.gz', 100, 1)
+    put(tmp_path / 'backup@1' / 'volume1' / 'file', 100, 1)
+    put(tmp_path / 'backup@2.tar.gz', 100, 2)
+    with CacheManager(str(tmp_path), budget=100) as cache:
+        cache.pin('backup@1.tar.gz')
+        assert cache.evict() == [str(tmp_path / 'backup@2.tar.gz')]
+
+    assert cache.pinned() == set()
+    assert len(CacheManager(str(tmp_path), budget=0).evict()) == 2
+
+
+def test_evict_must_keep_chunks_while_index_is_pinned(tmp_path):
+    put(tmp_path / 'backup@1.idx', 10, 2)
+    put(tmp_path / '.cobra' / 'chunks' / 'ab' / 'abcd', 100, 1)
+    with CacheManager(str(tmp_path), budget=10) as cache:
+        cache.pin('backup@1.idx')
+        assert cache.evict() == list()
+
+    assert CacheManager(str(tmp_path), budget=10).evict() == [str(tmp_path / '.cobra' / 'chunks' / 'ab' / 'abcd')]
+
+
+def test_touch_must_make_entry_recently_used(tmp_path):
+    put(tmp_path / 'backup@1.tar.gz', 100, 1)
+    put(tmp_path / 'backup@2.tar.gz', 100, 2)
+    cache = CacheManager(str(tmp_path), budget=100)
+    cache.touch('backup@1.tar.gz')
+    assert cache.evict() == [str(tmp_path / 'backup@2.tar.gz')]
+
+
+def test_manager_without_budget_must_do_nothing(tmp_path):
+    put(tmp_path / 'backup@1.tar.gz', 100, 1)
+    with CacheManager(str(tmp_path)) as cache:
+        cache.pin('backup@1.tar.gz')
+        assert cache.evict(reserve=1000) == list()
+
+    assert os.listdir(tmp_path) == ['backup@1.tar.gz']
+
+
+def test_remove_must_take_extracted_tree_and_skip_pinned(tmp_path):
+    put(tmp_path / 'backup@1.tar.gz', 100, 1)
+    put(tmp_path / '.backup@1.tar.gz.md5', 10, 1)
+    put(tmp_path / 'backup@1' / 'volume1' / 'file', 100, 1)
+    put(tmp_path / 'backup@2.tar.gz', 100, 2)
+    with CacheManager(str(tmp_path), budget=1000) as cache:
+        cache.pin('backup@2.tar.gz')
+        assert CacheManager(str(tmp_path)).remove('backup@1.tar.gz')
+        assert not CacheManager(str(tmp_path)).remove('backup@2.tar.gz')
+
+    assert sorted(os.listdir(tmp_path)) == ['.cobra', 'backup@2.tar.gz']
@@ -0,0 +1,140 @@
+from contextlib import closing
+from os.path import dirname
+import os
+import sqlite3
+
+
+CATALOG_FN = 'catalog.db'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    base TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    backup_id INTEGER NOT NULL REFERENCES backups(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    volume TEXT NOT NULL,
+    path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    mtime INTEGER,
+    mode INTEGER,
+    hash TEXT,
+    linkname TEXT,
+    offset INTEGER,
+    PRIMARY KEY (backup_id, key)
+);
+CREATE INDEX IF NOT EXISTS files_key ON files(key);
+CREATE INDEX IF NOT EXISTS files_path ON files(path);
+'''
+
+FIELDS = ('volume', 'path', 'type', 'size', 'mtime', 'mode', 'hash', 'linkname', 'offset')
+# the fields telling the file is changed
+_COMPARED = ('type', 'size', 'mtime', 'mode', 'hash', 'linkname')
+
+
+def split_key(key):
+    '''
+    Splits the manifest key into the volume name and the path within the volume.
+    '''
+    volume, _, path = key.partition('/')
+    return volume, path
+
+
+class Catalog:
+    '''
+    SQLite database of the files every backup holds as recorded by the backup manifests.
+    Answers what is in the backups without reading the archives.
+    '''
+    def __init__(self, fn):
+        self.__fn = fn
+
+
+    def __connect(self):
+        os.makedirs(dirname(self.__fn), exist_ok=True)
+        conn = sqlite3.connect(self.__fn)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.executescript(_SCHEMA)
+        return conn
+
+
+    def add(self, name, manifest, base=None, offsets=None):
+        '''
+        Puts the backup into the catalog replacing the one with the same name if any.
+
+        @param name The backup file name
+        @param manifest The manifest dict as saved by the build
+        @param base The base backup file name of incremental backup
+        @param offsets The dict of the manifest keys to the member offsets in the uncompressed volume part
+        '''
+        offsets = offsets if offsets else dict()
+        with closing(self.__connect()) as conn, conn:
+            conn.execute('DELETE FROM backups WHERE name = ?', (name,))
+            backup_id = conn.execute('INSERT INTO backups (name, base) VALUES (?, ?)', (name, base)).lastrowid
+            conn.executemany(
+                'INSERT INTO files (backup_id, key, volume, path, type, size, mtime, mode, hash, linkname, offset) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((backup_id, key, *split_key(key), e.get('type'), e.get('size'), e.get('mtime'), e.get('mode'),
+                  e.get('hash'), e.get('linkname'), offsets.get(key)) for key, e in manifest['files'].items()))
+
+
+    def remove(self, name):
+        with closing(self.__connect()) as conn, conn:
+            conn.execute('DELETE FROM backups WHERE name = ?', (name,))
+
+
+    def clear(self):
+        with closing(self.__connect()) as conn, conn:
+            conn.execute('DELETE FROM backups')
+
+
+    def backups(self):
+        with closing(self.__connect()) as conn:
+            return [row['name'] for row in conn.execute('SELECT name FROM backups ORDER BY name')]
+
+
+    def bases(self):
+        '''
+        Returns the dict of the incremental backup names to their base backup names.
+        '''
+        with closing(self.__connect()) as conn:
+            return { row['name']: row['base'] for row in conn.execute('SELECT name, base FROM backups WHERE base IS NOT NULL') }
+
+
+    def find(self, pattern):
+        '''
+        Returns the list of the files matching the glob pattern along with the backups holding them.
+        The pattern is matched against the path starting with the volume name and against the path within the volume.
+        '''
+        with closing(self.__connect()) as conn:
+            rows = conn.execute(
+                f'SELECT b.name AS backup, {", ".join(f"f.{c}" for c in FIELDS)} FROM files f '
+                'JOIN backups b ON b.id = f.backup_id WHERE f.key GLOB ? OR f.path GLOB ? '
+                'ORDER BY f.key, b.name', (pattern, pattern))
+            return [dict(row) for row in rows]
+
+
+    def files(self, name):
+        '''
+        Returns the dict of the manifest keys to the file fields of the backup or None if it's not in the catalog.
+        '''
+        with closing(self.__connect()) as conn:
+            row = conn.execute('SELECT id FROM backups WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return None
+
+            rows = conn.execute(f'SELECT key, {", ".join(FIELDS)} FROM files WHERE backup_id = ?', (row['id'],))
+            return { r['key']: dict(r) for r in rows }
+
+
+def diff(files_a, files_b):
+    '''
+    Returns the dict of the added, removed and changed keys going from the files of backup a to the ones of b.
+    '''
+    common = set(files_a) & set(files_b)
+    return dict(added=sorted(set(files_b) - set(files_a)),
+                removed=sorted(set(files_a) - set(files_b)),
+                changed=sorted(k for k in common if any(files_a[k][f] != files_b[k][f] for f in _COMPARED)))
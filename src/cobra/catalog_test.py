@@ -0,0 +1,54 @@
+from cobra.catalog import Catalog, diff, split_key
+
+import pytest
+
+
+def manifest(**files):
+    return dict(files={ key.replace('__', '/'): dict(type='file', size=1, mtime=1, mode=0o644, hash=h)
+                        for key, h in files.items() }, deleted=list())
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return Catalog(str(tmp_path / '.cobra' / 'catalog.db'))
+
+
+def test_split_key_must_split_volume_and_path():
+    assert split_key('volume1/etc/app.conf') == ('volume1', 'etc/app.conf')
+    assert split_key('volume1') == ('volume1', '')
+
+
+def test_find_must_match_glob_by_key_or_path(catalog):
+    catalog.add('backup@1.tar.gz', manifest(volume1__etc__app__conf='a', volume2__data='b'))
+    catalog.add('backup@2.tar.gz', manifest(volume1__etc__app__conf='c'), base='backup@1.tar.gz',
+                offsets={ 'volume1/etc/app/conf': 512 })
+    found = catalog.find('volume1/etc/*')
+    assert [(f['backup'], f['hash'], f['offset']) for f in found] == [('backup@1.tar.gz', 'a', None),
+                                                                      ('backup@2.tar.gz', 'c', 512)]
+    assert [f['volume'] for f in catalog.find('data')] == ['volume2']
+    assert catalog.find('nothing*') == list()
+
+
+
+def test_bases_must_map_incremental_backups_to_bases(catalog):
+    catalog.add('backup@1.tar.gz', manifest(volume1__data='a'))
+    catalog.add('backup@2.tar.gz', manifest(volume1__data='b'), base='backup@1.tar.gz')
+    assert catalog.bases() == { 'backup@2.tar.gz': 'backup@1.tar.gz' }
+    catalog.remove('backup@2.tar.gz')
+    assert catalog.bases() == dict()
+
+def test_add_must_replace_backup_with_same_name(catalog):
+    catalog.add('backup@1.tar.gz', manifest(volume1__a='a', volume1__b='b'))
+    catalog.add('backup@1.tar.gz', manifest(volume1__a='a'))
+    assert list(catalog.files('backup@1.tar.gz')) == ['volume1/a']
+    assert catalog.backups() == ['backup@1.tar.gz']
+    catalog.remove('backup@1.tar.gz')
+    assert catalog.files('backup@1.tar.gz') is None
+    assert catalog.find('*') == list()
+
+
+def test_diff_must_tell_added_removed_and_changed(catalog):
+    catalog.add('backup@1.tar.gz', manifest(volume1__same='a', volume1__changed='b', volume1__removed='c'))
+    catalog.add('backup@2.tar.gz', manifest(volume1__same='a', volume1__changed='x', volume1__added='d'))
+    assert diff(catalog.files('backup@1.tar.gz'), catalog.files('backup@2.tar.gz')) == \
+        dict(added=['volume1/added'], removed=['volume1/removed'], changed=['volume1/changed'])
@@ -3,6 +3,9 @@ from cobra.api import Api, purge, DEFAULT_BASE_URL, default_backup_dir, \
 from cobra.exc import CobraCliError
 from cobra.cli_handler import CliHandler
 from cobra.hooks import Hooks, default_hooks_dir
+from cobra.compression import COMPRESSIONS, DEFAULT_COMPRESSION
+from cobra.cache import parse_size
+from cobra.google_drive import TRANSPORT
 
 
 import os
@@ -13,6 +16,7 @@ import sys
 from docker import DockerClient
 import docker
 from os.path import join
+from datetime import datetime
 
 
 def parse_command_line(cli_handler, args=sys.argv[1:]):
@@ -41,44 +45,175 @@ def parse_command_line(cli_handler, args=sys.argv[1:]):
     backup_build_parser.add_argument('--rm', action='store_true', default=False, help='Remove the backup from the local machine after backup uploaded to remote storage (default: %(default)s). Only if push specified.')
     backup_build_parser.add_argument('--push', action='store_true', default=False, help='Whether to upload created backup file to google drive folder shared to service account. '
         'Needs to designate service account credentials (default: %(default)s)')
+    backup_build_parser.add_argument('--stream', action='store_true', default=False, help='Upload the backup while building it without writing local file. '
+        'Requires --push (default: %(default)s)')
+    backup_build_parser.add_argument('--keep-local', action='store_true', default=False, help='Write local copy of the backup being streamed (default: %(default)s)')
+    backup_build_parser.add_argument('--incremental', action='store_true', default=False, help='Archive only the files changed since the latest backup '
+        'with the same basename. Full backup is built if there is no such one (default: %(default)s)')
+    backup_build_parser.add_argument('--base', metavar='BACKUP', help='Base backup file for incremental backup. '
+        'If no path given the file is looked for in backup directory (default: %(default)s)')
+    backup_build_parser.add_argument('--seekable', action='store_true', default=False, help='Build the parts compressed by independent frames '
+        'along with the index of the members so single files are restored without decompressing the whole backup. '
+        'Implies --parallel 1 unless given (default: %(default)s)')
+    backup_build_parser.add_argument('--dedup', action='store_true', default=False, help='Split the archive into content defined chunks '
+        'stored once and shared by all the backups. The backup file is the index of the chunks (default: %(default)s)')
     backup_build_parser.add_argument('--backup-dir', default=default_backup_dir(), dest='host_backup_dir', metavar='BACKUP_DIR', help='The directory to store backups (default: %(default)s)')
     backup_build_parser.add_argument('--creds', metavar='FILENAME', help='Google service account credentials file in json format')
-    backup_build_parser.add_argument('--folder-id', help='Google drive folder id the backup files will reside under')
+    backup_build_parser.add_argument('--folder-id', action='append', help='Google drive folder id the backup files will reside under. Can be specified multiple times to push to every folder reading the backup once (default: %(default)s)')
+    backup_build_parser.add_argument('--storage', action='append', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed. Can be specified multiple times to push to every storage reading the backup once, the storages are paired with --folder-id in order (default: drive)')
+    backup_build_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
     backup_build_parser.add_argument('--basename', default='backup', dest='backup_basename', metavar='BASENAME', help='Backup files prefix (default: %(default)s)')
+    backup_build_parser.add_argument('--compression', default=DEFAULT_COMPRESSION, choices=COMPRESSIONS, help='Compression engine. gzip runs within the helper container unless everything is read on the host, '
+        'the others compress on the host utilizing all the cores, the corresponding program must be installed (default: %(default)s)')
+    backup_build_parser.add_argument('--compress-level', type=int, default=None, metavar='LEVEL', help='Compression level, the engine default is used if not given (default: %(default)s)')
+    backup_build_parser.add_argument('--parallel', type=int, default=None, metavar='N', help='Archive volumes and directories as separately compressed parts '
+        'using at most N helper containers at a time (default: %(default)s)')
+    backup_build_parser.add_argument('--no-host-read', action='store_true', default=False, help='Always archive by the helper container. '
+        'By default the directories and the local driver volumes are read right on the host if the docker daemon is local (default: %(default)s)')
+    backup_build_parser.add_argument('--warm-helpers', action='store_true', default=False, help='Read the volumes by the helper containers kept running '
+        'and reused by the next builds of the same volumes. gzip is done on the host then. See helpers prune (default: %(default)s)')
+    backup_build_parser.add_argument('--cpu-quota', type=float, default=None, metavar='CPUS', help='Let the helper containers use at most CPUS cores e.g. 0.5 (default: unlimited)')
+    backup_build_parser.add_argument('--io-weight', type=int, default=None, metavar='WEIGHT', help='The block IO weight of the helper containers from 10 to 1000, the default one is 500. '
+        'Takes effect with the BFQ or CFQ disk scheduler (default: %(default)s)')
+    backup_build_parser.add_argument('--max-read-rate', type=parse_size, default=None, metavar='SIZE', help='Read at most SIZE bytes per second e.g. 50M. '
+        'It limits the helper containers reading the disks if the docker daemon is local and the streams read on the host (default: unlimited)')
+    backup_build_parser.add_argument('--max-upload-rate', type=parse_size, default=None, metavar='SIZE', help='Upload at most SIZE bytes per second e.g. 10M '
+        'for all the files and the destinations together (default: unlimited)')
     # backup/push
     backup_push_parser = backup_sp.add_parser('push', help='Push backup file to a storage')
     backup_push_parser.add_argument('files', nargs='*', help='A file names space seprated list to push. To designate exact file on file system include path like \'./file/to/push\' for current directory. If no path given the files are looked for in backup directory either default or specified by --backup-dir option. If no files given then all files from default or desiginated by --backup-dir option are taken')
     backup_push_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
     backup_push_parser.add_argument('--creds', help='Google service account credentials file in json format')
-    backup_push_parser.add_argument('--folder-id', help='Google drive folder id the backup files will reside under')
+    backup_push_parser.add_argument('--folder-id', action='append', help='Google drive folder id the backup files will reside under. Can be specified multiple times to push to every folder reading the backup once (default: %(default)s)')
+    backup_push_parser.add_argument('--storage', action='append', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed. Can be specified multiple times to push to every storage reading the backup once, the storages are paired with --folder-id in order (default: drive)')
+    backup_push_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
+    backup_push_parser.add_argument('--cache-dir', default=default_cache_dir(), help='The directory to keep the upload sessions in to resume the interrupted uploads (default: %(default)s)')
+    backup_push_parser.add_argument('--jobs', type=int, default=None, metavar='N', help='Upload N files at a time (default: one by one)')
+    backup_push_parser.add_argument('--force', action='store_true', default=False, help='Upload the files even if the same ones are in the remote folder already (default: %(default)s)')
     backup_push_parser.add_argument('--rm', action='store_true', default=False, help='Remove the backup from the local machine after backup uploaded to remote storage (default: %(default)s). Only if push specified.')
+    backup_push_parser.add_argument('--max-upload-rate', type=parse_size, default=None, metavar='SIZE', help='Upload at most SIZE bytes per second e.g. 10M '
+        'for all the files and the destinations together (default: unlimited)')
     backup_push_parser.set_defaults(handler=cli_handler.backup_push)
     # backup/list
     backup_list_parser = backup_sp.add_parser('list', help='List backup files by default on locally.')
     backup_list_parser.add_argument('--remote', action='store_true', default=False, help='List remote files instead of local (default: %(default)s)')
     backup_list_parser.add_argument('--folder-id', help='Google drive folder id to list')
+    backup_list_parser.add_argument('--storage', default='drive', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed (default: %(default)s)')
+    backup_list_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
     backup_list_parser.add_argument('--creds', help='Google service account credentials file in json format')
     backup_list_parser.add_argument('--json', action='store_true', default=False, help='Print in json format (default: %(default)s)')
     backup_list_parser.add_argument('--plain', action='store_true', default=False, help='Print a list of file names and ids (default: %(default)s)')
     backup_list_parser.add_argument('--id', action='store_true', default=False, help='Print a file id instead of name in case of --plain (default: %(default)s)')
     backup_list_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
     backup_list_parser.add_argument('--filter', help='File name should include pattern, to exclude prepend the pattern with \'not\' (default: %(default)s)')
+    backup_list_parser.add_argument('--after', type=datetime.fromisoformat, metavar='DATETIME', help='List the remote files created after the date and time given in ISO format e.g. 2023-02-04T21:00 (default: %(default)s)')
+    backup_list_parser.add_argument('--before', type=datetime.fromisoformat, metavar='DATETIME', help='List the remote files created before the date and time given in ISO format (default: %(default)s)')
+    backup_list_parser.add_argument('--cache-dir', default=default_cache_dir(), help='The directory to keep the remote folder catalog in (default: %(default)s)')
+    backup_list_parser.add_argument('--no-cache', action='store_true', default=False, help='Don\'t use the remote folder catalog and list the folder (default: %(default)s)')
     backup_list_parser.set_defaults(handler=cli_handler.backup_list)
     # backup/pull
     backup_pull_parser = backup_sp.add_parser('pull', help='Pulls given backup from remote storage')
     backup_pull_parser.add_argument('--file-id', default=None, help='Google drive file id to pull')
     backup_pull_parser.add_argument('--latest', action='store_true', default=False, help='Get latest file to pull. Note that the file name is not checked (default: %(default)s)')
     backup_pull_parser.add_argument('--folder-id', default=None, help='Google drive folder id to pull from')
-    backup_pull_parser.add_argument('--creds', required=True, help='Google service account credentials file in json format')
+    backup_pull_parser.add_argument('--storage', default='drive', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed (default: %(default)s)')
+    backup_pull_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
+    backup_pull_parser.add_argument('--creds', help='Google service account credentials file in json format')
     backup_pull_parser.add_argument('--restore', action='store_true', default=False, help='Restore backup after download (default: %(default)s)')
+    backup_pull_parser.add_argument('--parallel', type=int, default=None, metavar='N', help='Restore volumes and directories '
+        'using at most N helper containers at a time (default: %(default)s)')
+    backup_pull_parser.add_argument('--only-volume', action='append', metavar='NAME', help='Restore only the given volume or directory. '
+        'Can be specified multiple times (default: %(default)s)')
+    backup_pull_parser.add_argument('--path', action='append', metavar='GLOB', help='Restore only the files matching the pattern '
+        'starting with the volume name e.g. \'volume1/etc/*.conf\'. Can be specified multiple times (default: %(default)s)')
+    backup_pull_parser.add_argument('--stream', action='store_true', default=False, help='Restore while downloading without writing '
+        'the backup to cache directory. Only with --restore (default: %(default)s)')
     backup_pull_parser.add_argument('--cache-dir', default=default_cache_dir(), help='The directory to store downloaded backup files (default: %(default)s)')
+    backup_pull_parser.add_argument('--connections', type=int, default=None, metavar='N', help='Download the file by ranges '
+        'using N connections at a time (default: 4)')
     backup_pull_parser.add_argument('--no-cache', action='store_true', default=False, help='Ignore files that reside in cache directory and download from remote storage (default: %(default)s)')
+    backup_pull_parser.add_argument('--cache-size', type=parse_size, default=None, metavar='SIZE', help='Keep the cache directory within the size e.g. 20G '
+        'evicting the least recently used backups, blocks and chunks (default: unlimited)')
+    backup_pull_parser.add_argument('--keep-extracted', action='store_true', default=False, help='Keep the backup tree extracted '
+        'to restore from (default: %(default)s)')
+    backup_pull_parser.add_argument('--warm-helpers', action='store_true', default=False, help='Copy into the volumes by the helper containers '
+        'kept running and reused by the next restores of the same volumes. See helpers prune (default: %(default)s)')
+    backup_pull_parser.add_argument('--cpu-quota', type=float, default=None, metavar='CPUS', help='Let the helper containers use at most CPUS cores e.g. 0.5 (default: unlimited)')
+    backup_pull_parser.add_argument('--io-weight', type=int, default=None, metavar='WEIGHT', help='The block IO weight of the helper containers from 10 to 1000, the default one is 500. '
+        'Takes effect with the BFQ or CFQ disk scheduler (default: %(default)s)')
+    backup_pull_parser.add_argument('--max-read-rate', type=parse_size, default=None, metavar='SIZE', help='Let the helper containers read the extracted backup '
+        'at most SIZE bytes per second e.g. 50M. Only if the docker daemon is local (default: unlimited)')
     backup_pull_parser.set_defaults(handler=cli_handler.backup_pull)
     # backup/restore
     backup_restore_parser = backup_sp.add_parser('restore', help='Restores given backup.')
     backup_restore_parser.add_argument('file', help='A backup archive to restore from. To designate exact file on file system include path like \'./file/to/restore\' for current directory. If no path given the file is looked for in a directory either default or specified by --cache-dir option')
     backup_restore_parser.add_argument('--cache-dir', default=default_cache_dir(), help='The directory where temporary backup files are stored (default: %(default)s)')
+    backup_restore_parser.add_argument('--creds', help='Google service account credentials file in json format. Used to pull base backups of incremental one')
+    backup_restore_parser.add_argument('--folder-id', help='Google drive folder id to pull base backups of incremental one from')
+    backup_restore_parser.add_argument('--storage', default='drive', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed (default: %(default)s)')
+    backup_restore_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
+    backup_restore_parser.add_argument('--parallel', type=int, default=None, metavar='N', help='Restore volumes and directories '
+        'using at most N helper containers at a time (default: %(default)s)')
+    backup_restore_parser.add_argument('--only-volume', action='append', metavar='NAME', help='Restore only the given volume or directory. '
+        'Can be specified multiple times (default: %(default)s)')
+    backup_restore_parser.add_argument('--path', action='append', metavar='GLOB', help='Restore only the files matching the pattern '
+        'starting with the volume name e.g. \'volume1/etc/*.conf\'. Can be specified multiple times (default: %(default)s)')
+    backup_restore_parser.add_argument('--stream', action='store_true', default=False, help='Stream the archive right into the volumes '
+        'without extracting it to disk first. Incremental backups are not supported (default: %(default)s)')
+    backup_restore_parser.add_argument('--cache-size', type=parse_size, default=None, metavar='SIZE', help='Keep the cache directory within the size e.g. 20G '
+        'evicting the least recently used backups, blocks and chunks (default: unlimited)')
+    backup_restore_parser.add_argument('--keep-extracted', action='store_true', default=False, help='Keep the backup tree extracted '
+        'to restore from (default: %(default)s)')
+    backup_restore_parser.add_argument('--warm-helpers', action='store_true', default=False, help='Copy into the volumes by the helper containers '
+        'kept running and reused by the next restores of the same volumes. See helpers prune (default: %(default)s)')
+    backup_restore_parser.add_argument('--cpu-quota', type=float, default=None, metavar='CPUS', help='Let the helper containers use at most CPUS cores e.g. 0.5 (default: unlimited)')
+    backup_restore_parser.add_argument('--io-weight', type=int, default=None, metavar='WEIGHT', help='The block IO weight of the helper containers from 10 to 1000, the default one is 500. '
+        'Takes effect with the BFQ or CFQ disk scheduler (default: %(default)s)')
+    backup_restore_parser.add_argument('--max-read-rate', type=parse_size, default=None, metavar='SIZE', help='Let the helper containers read the extracted backup '
+        'at most SIZE bytes per second e.g. 50M. Only if the docker daemon is local (default: unlimited)')
     backup_restore_parser.set_defaults(handler=cli_handler.backup_restore)
+    # backup/find
+    backup_find_parser = backup_sp.add_parser('find', help='Find the backups holding the files by the catalog')
+    backup_find_parser.add_argument('pattern', help='The glob pattern of the file path either starting with the volume name e.g. \'volume1/etc/*.conf\' or within the volume e.g. \'etc/*.conf\'')
+    backup_find_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
+    backup_find_parser.add_argument('--json', action='store_true', default=False, help='Print in json format (default: %(default)s)')
+    backup_find_parser.set_defaults(handler=cli_handler.backup_find)
+    # backup/diff
+    backup_diff_parser = backup_sp.add_parser('diff', help='Show the files added (+), removed (-) and changed (~) between two backups by the catalog')
+    backup_diff_parser.add_argument('backup_a', help='The backup file name to compare from')
+    backup_diff_parser.add_argument('backup_b', help='The backup file name to compare to')
+    backup_diff_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
+    backup_diff_parser.add_argument('--json', action='store_true', default=False, help='Print in json format (default: %(default)s)')
+    backup_diff_parser.set_defaults(handler=cli_handler.backup_diff)
+    # backup/reindex
+    backup_reindex_parser = backup_sp.add_parser('reindex', help='Rebuild the catalog from the backup manifests')
+    backup_reindex_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
+    backup_reindex_parser.add_argument('--remote', action='store_true', default=False, help='Pull the manifests pushed along with the backups first (default: %(default)s)')
+    backup_reindex_parser.add_argument('--creds', help='Google service account credentials file in json format')
+    backup_reindex_parser.add_argument('--folder-id', help='Google drive folder id the backups are pushed to')
+    backup_reindex_parser.add_argument('--storage', default='drive', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed (default: %(default)s)')
+    backup_reindex_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
+    backup_reindex_parser.set_defaults(handler=cli_handler.backup_reindex)
+    # backup/prune
+    backup_prune_parser = backup_sp.add_parser('prune', help='Remove the backups the retention policy doesn\'t keep. The policy applies to every basename separately')
+    backup_prune_parser.add_argument('--remote', action='store_true', default=False, help='Prune the remote folder (default: %(default)s)')
+    backup_prune_parser.add_argument('--local', action='store_true', default=False, help='Prune the backup directory (default: %(default)s)')
+    backup_prune_parser.add_argument('--cache', action='store_true', default=False, help='Prune the cache directory (default: %(default)s)')
+    backup_prune_parser.add_argument('--keep-last', type=int, default=None, metavar='N', help='Keep N latest backups (default: %(default)s)')
+    backup_prune_parser.add_argument('--keep-daily', type=int, default=None, metavar='N', help='Keep the latest backup of each of N last days having backups (default: %(default)s)')
+    backup_prune_parser.add_argument('--keep-weekly', type=int, default=None, metavar='N', help='Keep the latest backup of each of N last weeks having backups (default: %(default)s)')
+    backup_prune_parser.add_argument('--keep-monthly', type=int, default=None, metavar='N', help='Keep the latest backup of each of N last months having backups (default: %(default)s)')
+    backup_prune_parser.add_argument('--max-total-size', type=parse_size, default=None, metavar='SIZE', help='Remove the oldest backups kept until the rest fit the size e.g. 100G. '
+        'The latest backup is never removed (default: unlimited)')
+    backup_prune_parser.add_argument('--dry-run', action='store_true', default=False, help='Only show what would be removed (default: %(default)s)')
+    backup_prune_parser.add_argument('--json', action='store_true', default=False, help='Print in json format (default: %(default)s)')
+    backup_prune_parser.add_argument('--backup-dir', default=default_backup_dir(), help='The directory to store backups (default: %(default)s)')
+    backup_prune_parser.add_argument('--cache-dir', default=default_cache_dir(), help='The directory to store downloaded backup files (default: %(default)s)')
+    backup_prune_parser.add_argument('--creds', help='Google service account credentials file in json format')
+    backup_prune_parser.add_argument('--folder-id', help='Google drive folder id the backups are pushed to')
+    backup_prune_parser.add_argument('--storage', default='drive', metavar='STORAGE', help='Where the backups reside: drive for Google Drive, the directory path or file:// url e.g. the NFS mount, or s3://bucket/prefix url. For the directory and S3 --folder-id is the sub folder and --creds is not needed (default: %(default)s)')
+    backup_prune_parser.add_argument('--endpoint-url', metavar='URL', help='The S3 compatible service url e.g. MinIO. The credentials are taken from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY (default: %(default)s)')
+    backup_prune_parser.set_defaults(handler=cli_handler.backup_prune)
     # backup/rm
     # backup_rm_parser = backup_sp.add_parser('rm', help='Remove backup.')
     # backup_rm_parser.add_argument('--file-id', required=True, help='Google drive folder id to take backup from')
@@ -101,6 +236,14 @@ def parse_command_line(cli_handler, args=sys.argv[1:]):
     hooks_init_parser = hooks_sp.add_parser('init', help='Initialize hooks in hooks directory. NOTE that all the hook files will be overwritten!')
     hooks_init_parser.add_argument('--hooks-dir', default=default_hooks_dir(), help='Specifies hooks directory to search for hooks (default: %(default)s)')
     hooks_init_parser.set_defaults(handler=cli_handler.init_hooks)
+    # helpers
+    helpers_parser = sp.add_parser('helpers', help='Warm helper containers kept running by --warm-helpers. By default lists them.')
+    helpers_parser.set_defaults(handler=cli_handler.helpers_list)
+    helpers_sp = helpers_parser.add_subparsers(title='helpers subcommands', help='Helper containers related subcommands')
+    helpers_list_parser = helpers_sp.add_parser('list', help='List warm helpers.')
+    helpers_list_parser.set_defaults(handler=cli_handler.helpers_list)
+    helpers_prune_parser = helpers_sp.add_parser('prune', help='Remove warm helpers releasing the volumes they mount.')
+    helpers_prune_parser.set_defaults(handler=cli_handler.helpers_prune)
     # dirs
     dirs_parser = sp.add_parser('dirs', help='Print default directories used by cobra')
     dirs_parser.set_defaults(handler=cli_handler.print_default_dirs)
@@ -164,3 +307,5 @@ def _main():
 
     cli_handler.bind(api)
     args['handler'](**args, print=True)
+    if TRANSPORT.stats()['requests']:
+        logging.info(TRANSPORT.summary())
@@ -24,33 +24,52 @@ def base_url():
 
 @pytest.mark.parametrize('cli_args, expected_args', [
                                                 # PROFILE
-                                                 (['--base-url', BASE_URL, 'backup', 'build', '--include', 'volume1', 'volume2', '--exclude', 'volume3', '--dir', 'dir1', 'dir2'], 
+                                                 (['--base-url', BASE_URL, 'backup', 'build', '--include', 'volume1', 'volume2', '--exclude', 'volume3', '--dir', 'dir1', 'dir2', '--cpu-quota', '0.5', '--io-weight', '100', '--max-read-rate', '50M'], 
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=BASE_URL, log_level='INFO', handler='backup_build', 
                                                            host_backup_dir=default_backup_dir(), backup_basename='backup', hooks_dir=default_hooks_dir(), 
-                                                           hook_off=[], creds=None, folder_id=None, push=False, rm=False, 
+                                                           hook_off=[], creds=None, folder_id=None, storage=None, endpoint_url=None, push=False, rm=False, compression='gzip', compress_level=None, parallel=None, stream=False, keep_local=False, incremental=False, base=None, dedup=False, seekable=False, no_host_read=False, warm_helpers=False,
+                                                           cpu_quota=0.5, io_weight=100, max_read_rate=50*1024**2, max_upload_rate=None,
                                                            include_volumes=['volume1', 'volume2'], exclude_volumes=['volume3'], dir_names=['dir1', 'dir2'])), 
-                                                 (['backup', 'push', 'filename1', 'filename2', '--creds', 'key.json', '--folder-id', 'asdf', '--rm'], 
+                                                 (['backup', 'push', 'filename1', 'filename2', '--creds', 'key.json', '--folder-id', 'asdf', '--folder-id', 'qwer', '--rm', '--max-upload-rate', '10M'], 
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_push', 
-                                                           backup_dir=default_backup_dir(), hooks_dir=default_hooks_dir(), rm=True,
-                                                           creds='key.json', folder_id='asdf', hook_off=[], files=['filename1', 'filename2'])), 
+                                                           backup_dir=default_backup_dir(), hooks_dir=default_hooks_dir(), rm=True, cache_dir=default_cache_dir(), jobs=None, force=False, max_upload_rate=10*1024**2,
+                                                           creds='key.json', folder_id=['asdf', 'qwer'], storage=None, endpoint_url=None, hook_off=[], files=['filename1', 'filename2'])), 
                                                  (['backup', 'list', '--remote', '--creds', 'key.json', '--folder-id', 'asdf'], 
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_list', 
                                                            backup_dir=default_backup_dir(), hooks_dir=default_hooks_dir(), json=False, plain=False,
-                                                           creds='key.json', folder_id='asdf', hook_off=[], filter=None, remote=True, id=False)), 
+                                                           creds='key.json', folder_id='asdf', storage='drive', endpoint_url=None, hook_off=[], filter=None, remote=True, id=False, after=None, before=None, cache_dir=default_cache_dir(), no_cache=False)), 
                                                  (['backup', 'pull', '--file-id', 'file-id', '--creds', 'key.json', '--no-cache'],
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_pull', 
                                                            latest=False, folder_id=None, cache_dir=default_cache_dir(), hooks_dir=default_hooks_dir(), no_cache=True,
-                                                           creds='key.json', file_id='file-id', hook_off=[], restore=False)), 
+                                                           creds='key.json', file_id='file-id', hook_off=[], restore=False, stream=False, connections=None, parallel=None, only_volume=None, path=None, cache_size=None, keep_extracted=False, warm_helpers=False,
+                                                           cpu_quota=None, io_weight=None, max_read_rate=None, storage='drive', endpoint_url=None)), 
+                                                 (['backup', 'pull', '--latest', '--storage', 's3://backups/host1', '--endpoint-url', 'http://minio:9000'],
+                                                 Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_pull', 
+                                                           latest=True, folder_id=None, cache_dir=default_cache_dir(), hooks_dir=default_hooks_dir(), no_cache=False,
+                                                           creds=None, file_id=None, hook_off=[], restore=False, stream=False, connections=None, parallel=None, only_volume=None, path=None, cache_size=None, keep_extracted=False, warm_helpers=False,
+                                                           cpu_quota=None, io_weight=None, max_read_rate=None, storage='s3://backups/host1', endpoint_url='http://minio:9000')), 
                                                  (['backup', 'restore', 'filename'],
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_restore', 
                                                            cache_dir=default_cache_dir(), hooks_dir=default_hooks_dir(), 
-                                                           file='filename', hook_off=[])), 
+                                                           file='filename', hook_off=[], creds=None, folder_id=None, storage='drive', endpoint_url=None, stream=False, parallel=None, only_volume=None, path=None, cache_size=None, keep_extracted=False, warm_helpers=False,
+                                                           cpu_quota=None, io_weight=None, max_read_rate=None)), 
+                                                 (['backup', 'diff', 'backup@1.tar.gz', 'backup@2.tar.gz', '--json'],
+                                                 Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_diff', 
+                                                           backup_dir=default_backup_dir(), hooks_dir=default_hooks_dir(), hook_off=[], 
+                                                           backup_a='backup@1.tar.gz', backup_b='backup@2.tar.gz', json=True)), 
+                                                 (['backup', 'prune', '--remote', '--local', '--keep-daily', '7', '--keep-monthly', '12', '--max-total-size', '10G', '--dry-run', '--storage', '/mnt/nfs'],
+                                                 Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='backup_prune', 
+                                                           backup_dir=default_backup_dir(), cache_dir=default_cache_dir(), hooks_dir=default_hooks_dir(), hook_off=[], 
+                                                           remote=True, local=True, cache=False, keep_last=None, keep_daily=7, keep_weekly=None, keep_monthly=12, 
+                                                           max_total_size=10*1024**3, dry_run=True, json=False, creds=None, folder_id=None, storage='/mnt/nfs', endpoint_url=None)), 
                                                  (['volume', 'list', '--json'],
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='volumes_list', 
                                                            json=True)), 
                                                  (['hooks', 'init', '--hooks-dir', '/hooks/dir'],
                                                  Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='init_hooks', 
                                                            hooks_dir='/hooks/dir')), 
+                                                 (['helpers', 'prune'],
+                                                 Namespace(help=False, tls=False, cert_dir=None, base_url=DEFAULT_BASE_URL, log_level='INFO', handler='helpers_prune')), 
                                                 ])
 def test_parse_command_line_must_setup_right_command_handler(cli_handler_mock, cli_args, expected_args):
     args, _ = parse_command_line(cli_handler_mock, args=cli_args)
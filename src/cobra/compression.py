@@ -0,0 +1,222 @@
+from cobra.exc import CobraApiError
+from cobra.stream import rechunk, read_exactly, skip
+
+from subprocess import Popen, PIPE
+from threading import Thread
+from bisect import bisect_left, bisect_right
+import os
+import shutil
+
+
+DEFAULT_COMPRESSION = 'gzip'
+READ_CHUNK_SIZE = 1024*1024
+FRAME_SIZE = 8*1024*1024
+
+
+class Engine:
+    def __init__(self, name, ext, mimetype, program=None, threads_opt=None,
+                 levels=(1, 9), magic=None, decompress_program=None):
+        '''
+        Describes the compression engine.
+
+        @param name The engine name as used in --compression option
+        @param ext The archive file extension e.g. '.tar.gz'
+        @param mimetype The mimetype used on upload
+        @param program The host program to pipe the tar stream through. None means no compression.
+        @param threads_opt The program option format string to set worker threads number e.g. '-T{}'
+        @param levels The (min, max) tuple of compression levels supported
+        @param magic The leading bytes of the compressed stream
+        @param decompress_program The host program used to decompress. By default the same as program.
+        '''
+        self.name = name
+        self.ext = ext
+        self.mimetype = mimetype
+        self.program = program
+        self.threads_opt = threads_opt
+        self.levels = levels
+        self.magic = magic
+        self.decompress_program = decompress_program if decompress_program else program
+
+
+    def compress_command(self, level=None, threads=None):
+        if self.program is None:
+            return None
+
+        command = [self.program, '-c']
+        if level is not None:
+            lo, hi = self.levels
+            if not lo <= level <= hi:
+                raise CobraApiError(f'Compression level for {self.name} must be in range [{lo}, {hi}], got [{level}]')
+            command.append(f'-{level}')
+
+        if self.threads_opt:
+            command.append(self.threads_opt.format(threads if threads else os.cpu_count()))
+
+        return command
+
+
+    def decompress_command(self):
+        if self.decompress_program is None:
+            return None
+
+        return [self.decompress_program, '-d', '-c']
+
+
+ENGINES = {
+    'gzip': Engine('gzip', '.tar.gz', 'application/gzip', 'gzip', magic=b'\x1f\x8b'),
+    'pigz': Engine('pigz', '.tar.gz', 'application/gzip', 'pigz', threads_opt='-p{}',
+                   magic=b'\x1f\x8b', decompress_program='gzip'),
+    'zstd': Engine('zstd', '.tar.zst', 'application/zstd', 'zstd', threads_opt='-T{}',
+                   levels=(1, 19), magic=b'\x28\xb5\x2f\xfd'),
+    'lz4': Engine('lz4', '.tar.lz4', 'application/x-lz4', 'lz4', levels=(1, 12),
+                  magic=b'\x04\x22\x4d\x18'),
+    'none': Engine('none', '.tar', 'application/x-tar'),
+}
+COMPRESSIONS = tuple(ENGINES.keys())
+
+
+def get_engine(name):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise CobraApiError(f'Unknown compression [{name}]. The only allowed are {COMPRESSIONS}')
+
+
+def engine_by_filename(fn):
+    '''
+    Returns the engine able to decompress the given file judging by its extension or None if unknown.
+    Gzip compatible files are always decompressed with gzip engine regardless of compressor used.
+    '''
+    # longer extensions first not to take .tar.gz for .tar
+    for engine in sorted(ENGINES.values(), key=lambda e: len(e.ext), reverse=True):
+        if fn.endswith(engine.ext):
+            return ENGINES['gzip'] if engine.ext == ENGINES['gzip'].ext else engine
+
+    return None
+
+
+def engine_by_magic(head):
+    for engine in ENGINES.values():
+        if engine.magic and head.startswith(engine.magic):
+            return ENGINES['gzip'] if engine.magic == ENGINES['gzip'].magic else engine
+
+    return ENGINES['none']
+
+
+def detect_engine(fn):
+    engine = engine_by_filename(fn)
+    if engine is not None:
+        return engine
+
+    with open(fn, 'rb') as f:
+        return engine_by_magic(f.read(4))
+
+
+def archive_basename(fn):
+    '''
+    Strips archive extension from the given file name e.g. backup@20230204.211624.tar.zst -> backup@20230204.211624
+    '''
+    engine = engine_by_filename(fn)
+    if engine is None:
+        return fn
+
+    return fn[:-len(engine.ext)]
+
+
+def check_program(program):
+    if shutil.which(program) is None:
+        raise CobraApiError(f'Program not found [{program}]. Install it or choose another compression')
+
+
+def pipe(command, chunks, chunk_size=READ_CHUNK_SIZE):
+    '''
+    Pipes the byte chunks through the given host command.
+    Returns generator yielding the command output.
+    '''
+    check_program(command[0])
+    proc = Popen(command, stdin=PIPE, stdout=PIPE)
+    errors = list()
+
+    def feed():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        while True:
+            data = proc.stdout.read(chunk_size)
+            if not data:
+                break
+            yield data
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        rc = proc.wait()
+
+    if errors:
+        raise errors[0]
+
+    if rc != 0:
+        raise CobraApiError(f'Command {command} exited with code [{rc}]')
+
+
+def compress(chunks, compression=DEFAULT_COMPRESSION, level=None, threads=None):
+    command = get_engine(compression).compress_command(level, threads)
+    if command is None:
+        yield from chunks
+        return
+
+    yield from pipe(command, chunks)
+
+
+def decompress(chunks, compression):
+    command = get_engine(compression).decompress_command()
+    if command is None:
+        yield from chunks
+        return
+
+    yield from pipe(command, chunks)
+
+
+def compress_frames(chunks, frames, compression=DEFAULT_COMPRESSION, level=None, threads=None, frame_size=None):
+    '''
+    Compresses every frame_size bytes of the stream independently. The concatenated frames are 
+    the valid stream for every engine, so the result is decompressed as usual.
+
+    @param frames The list to append [compressed offset, uncompressed offset] pair of every frame to
+    '''
+    offset = uncompressed_offset = 0
+    for frame in rechunk(chunks, frame_size if frame_size else FRAME_SIZE):
+        data = b''.join(compress((frame,), compression, level, threads))
+        frames.append([offset, uncompressed_offset])
+        offset += len(data)
+        uncompressed_offset += len(frame)
+        yield data
+
+
+def decompress_range(fileobj, base, frames, size, compression, start, end):
+    '''
+    Yields [start, end) bytes of the uncompressed stream decompressing only the frames holding them.
+
+    @param fileobj The seekable file object containing the compressed stream
+    @param base The offset of the compressed stream in fileobj
+    @param frames The frames list as made by compress_frames
+    @param size The compressed stream size
+    '''
+    uncompressed_offsets = [u for _, u in frames]
+    first = bisect_right(uncompressed_offsets, start) - 1
+    last = bisect_left(uncompressed_offsets, end)
+    begin = frames[first][0]
+    stop = frames[last][0] if last < len(frames) else size
+    fileobj.seek(base + begin)
+    yield from skip(decompress(read_exactly(fileobj, stop - begin), compression), 
+                    start - frames[first][1], end - start)
@@ -0,0 +1,103 @@
+from cobra.compression import (get_engine, engine_by_filename, engine_by_magic, archive_basename, 
+    compress, decompress, pipe, compress_frames, decompress_range)
+from cobra.exc import CobraApiError
+
+import pytest
+
+import gzip
+import io
+import random
+import os
+import shutil
+
+
+DATA = b'cobra' * 100000
+
+
+def chunked(data, size=65536):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'pigz', 'zstd', 'lz4', 'none'])
+def test_compress_decompress_must_roundtrip(compression):
+    engine = get_engine(compression)
+    if engine.program and shutil.which(engine.program) is None:
+        pytest.skip(f'{engine.program} is not installed')
+
+    compressed = b''.join(compress(chunked(DATA), compression, level=1))
+    if compression != 'none':
+        assert compressed.startswith(engine.magic)
+        assert len(compressed) < len(DATA)
+
+    assert DATA == b''.join(decompress(chunked(compressed), compression))
+
+
+def test_gzip_output_must_be_readable_by_standard_gzip():
+    assert DATA == gzip.decompress(b''.join(compress(chunked(DATA), 'gzip')))
+
+
+def test_compress_command_must_use_all_cores_by_default():
+    assert get_engine('zstd').compress_command(level=5) == ['zstd', '-c', '-5', f'-T{os.cpu_count()}']
+    assert get_engine('pigz').compress_command(threads=4) == ['pigz', '-c', '-p4']
+    assert get_engine('none').compress_command() is None
+
+
+def test_compress_command_must_check_level():
+    with pytest.raises(CobraApiError):
+        get_engine('gzip').compress_command(level=10)
+
+
+def test_get_engine_must_raise_on_unknown_compression():
+    with pytest.raises(CobraApiError):
+        get_engine('rar')
+
+
+@pytest.mark.parametrize('fn, expected, basename', [
+    ('backup@20230204.211624.tar.gz', 'gzip', 'backup@20230204.211624'),
+    ('backup@20230204.211624.tar.zst', 'zstd', 'backup@20230204.211624'),
+    ('backup@20230204.211624.tar.lz4', 'lz4', 'backup@20230204.211624'),
+    ('backup@20230204.211624.tar', 'none', 'backup@20230204.211624'),
+    ('backup@20230204.211624', None, 'backup@20230204.211624'),
+])
+def test_engine_by_filename_must_detect_by_extension(fn, expected, basename):
+    engine = engine_by_filename(fn)
+    assert (engine.name if engine else None) == expected
+    assert archive_basename(fn) == basename
+
+
+def test_engine_by_magic_must_detect_by_leading_bytes():
+    assert engine_by_magic(b'\x28\xb5\x2f\xfd').name == 'zstd'
+    assert engine_by_magic(b'\x1f\x8b\x08\x00').name == 'gzip'
+    assert engine_by_magic(b'back').name == 'none'
+
+
+def test_pipe_must_raise_on_command_failure():
+    with pytest.raises(CobraApiError):
+        list(pipe(['sh', '-c', 'cat > /dev/null; exit 3'], chunked(DATA)))
+
+
+def test_pipe_must_propagate_source_errors():
+    def source():
+        yield b'data'
+        raise ValueError('source failed')
+
+    with pytest.raises(ValueError):
+        list(pipe(['cat'], source()))
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd', 'lz4', 'none'])
+def test_frames_must_be_decompressed_as_whole_and_by_range(compression):
+    engine = get_engine(compression)
+    if engine.program and shutil.which(engine.program) is None:
+        pytest.skip(f'{engine.program} is not installed')
+
+    data = random.Random(0).randbytes(100000) + DATA
+    frames = list()
+    compressed = b''.join(compress_frames(chunked(data), frames, compression, frame_size=65536))
+    assert [u for _, u in frames] == list(range(0, len(data), 65536))
+    assert data == b''.join(decompress(chunked(compressed), compression))
+
+    f = io.BytesIO(b'prefix' + compressed)
+    for start, end in [(0, 10), (65530, 65540), (100, 300000), (len(data) - 5, len(data))]:
+        assert data[start:end] == b''.join(decompress_range(f, len(b'prefix'), frames, len(compressed), 
+                                                            compression, start, end))
@@ -0,0 +1,176 @@
+from cobra.exc import CobraApiError
+from cobra.aux_stuff import rand_str
+
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join, exists, dirname
+import hashlib
+import json
+import os
+import random
+import zlib
+
+
+INDEX_EXT = '.idx'
+CHUNKS_DIR = 'chunks'
+MIN_CHUNK_SIZE = 256*1024
+MAX_CHUNK_SIZE = 4*1024*1024
+DEFAULT_LEVEL = 6
+
+# The chunk boundary is placed right after ANCHOR_LEN bytes in a row each belonging to the anchor set.
+# The anchor set is 16 pseudo random byte values so for random data the boundary is met
+# every 16^5 = 1 MiB on average. Since the boundary depends on the content only, an insertion
+# or removal shifts the boundaries along with the data and the rest of the chunks stay the same.
+# Unlike rolling hash it's evaluated by bytes.translate and bytes.find i.e. at C speed.
+_ANCHOR_SET = random.Random(0x636f627261).sample(range(256), 16)
+_ANCHOR_TABLE = bytes(1 if b in _ANCHOR_SET else 0 for b in range(256))
+ANCHOR_LEN = 5
+_ANCHOR = b'\x01' * ANCHOR_LEN
+
+
+def is_index(fn):
+    return fn.endswith(INDEX_EXT)
+
+
+def index_basename(fn):
+    return fn[:-len(INDEX_EXT)]
+
+
+def _cut(data, min_size, max_size):
+    if len(data) <= min_size:
+        return len(data)
+
+    window = data[:max_size].translate(_ANCHOR_TABLE)
+    i = window.find(_ANCHOR, min_size - ANCHOR_LEN)
+    return i + ANCHOR_LEN if i != -1 else len(window)
+
+
+def split(chunks, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    '''
+    Splits the byte stream into content defined chunks of [min_size, max_size] bytes.
+    '''
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= max_size:
+            end = _cut(buffer, min_size, max_size)
+            yield bytes(buffer[:end])
+            del buffer[:end]
+
+    while buffer:
+        end = _cut(buffer, min_size, max_size)
+        yield bytes(buffer[:end])
+        del buffer[:end]
+
+
+def chunk_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkStore:
+    '''
+    The directory of zlib compressed chunks named by sha256 of their uncompressed content.
+    '''
+    def __init__(self, root):
+        self.__root = root
+
+
+    @property
+    def root(self):
+        return self.__root
+
+
+    def path(self, digest):
+        return join(self.__root, digest[:2], digest)
+
+
+    def has(self, digest):
+        return exists(self.path(digest))
+
+
+    def put(self, digest, data, level=DEFAULT_LEVEL):
+        fn = self.path(digest)
+        if exists(fn):
+            return False
+
+        self.put_compressed(digest, zlib.compress(data, level))
+        return True
+
+
+    def put_compressed(self, digest, data):
+        fn = self.path(digest)
+        os.makedirs(dirname(fn), exist_ok=True)
+        # the same chunk may be put concurrently
+        temp_fn = f'{fn}.{rand_str()}.part'
+        with open(temp_fn, 'wb') as f:
+            f.write(data)
+        os.replace(temp_fn, fn)
+
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+
+        if chunk_digest(data) != digest:
+            raise CobraApiError(f'Chunk is corrupted [{digest}]')
+
+        return data
+
+
+def store(chunks, chunk_store, level=DEFAULT_LEVEL, workers=None):
+    '''
+    Splits the stream into chunks and puts the new ones into the store.
+    Hashing and compression run in the worker threads, zlib and hashlib release GIL.
+    Returns the index that is the list of [digest, size] pairs.
+    '''
+    workers = workers if workers else os.cpu_count()
+
+    def put(data):
+        d = chunk_digest(data)
+        chunk_store.put(d, data, level)
+        return [d, len(data)]
+
+    index = list()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = list()
+        for data in split(chunks):
+            pending.append(executor.submit(put, data))
+            # keep memory bounded
+            if len(pending) >= 2*workers:
+                index.append(pending.pop(0).result())
+
+        index.extend(f.result() for f in pending)
+
+    return index
+
+
+def _find(stores, digest):
+    for s in stores:
+        if s.has(digest):
+            return s
+
+    raise CobraApiError(f'Chunk not found [{digest}]')
+
+
+def load(stores, index):
+    '''
+    Returns the generator of the original stream.
+
+    @param stores The list of chunk stores to look the chunks up in
+    @param index The list of [digest, size] pairs
+    '''
+    for d, _ in index:
+        yield _find(stores, d).get(d)
+
+
+def missing(stores, index):
+    return sorted({ d for d, _ in index if not any(s.has(d) for s in stores) })
+
+
+def write_index(fn, index, **info):
+    with open(fn, 'w') as f:
+        json.dump(dict(info, chunks=index), f)
+
+
+def read_index(fn):
+    with open(fn) as f:
+        return json.load(f)
@@ -0,0 +1,75 @@
+from cobra.dedup import (split, store, load, missing, ChunkStore, chunk_digest, write_index, read_index,
+    is_index, index_basename, MIN_CHUNK_SIZE, MAX_CHUNK_SIZE)
+from cobra.exc import CobraApiError
+
+import pytest
+import random
+import zlib
+
+
+@pytest.fixture
+def data():
+    return random.Random(1).randbytes(8*1024*1024)
+
+
+def pieces(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_split_must_not_depend_on_input_chunking(data):
+    expected = list(split([data]))
+    assert b''.join(expected) == data
+    assert list(split(pieces(data, 65536))) == expected
+    assert list(split(pieces(data, 1000003))) == expected
+
+
+def test_split_must_respect_chunk_size_bounds(data):
+    sizes = [len(c) for c in split([data])]
+    assert all(MIN_CHUNK_SIZE <= size <= MAX_CHUNK_SIZE for size in sizes[:-1])
+    assert sizes[-1] <= MAX_CHUNK_SIZE
+    assert [len(c) for c in split([bytes(MAX_CHUNK_SIZE*2 + 1)])] == [MAX_CHUNK_SIZE, MAX_CHUNK_SIZE, 1]
+
+
+def test_split_must_resync_after_insertion(data):
+    original = set(split([data]))
+    shifted = list(split([b'inserted' + data]))
+    assert len(original.intersection(shifted)) >= len(shifted) - 2
+
+
+def test_store_must_put_chunks_once_and_load_must_restore_stream(data, tmp_path):
+    chunk_store = ChunkStore(tmp_path)
+    index = store(pieces(data, 65536), chunk_store, workers=2)
+    assert b''.join(load([chunk_store], index)) == data
+    assert missing([chunk_store], index) == list()
+    assert missing([ChunkStore(tmp_path / 'empty')], index) == sorted(set(d for d, _ in index))
+
+    for d, _ in index:
+        assert not chunk_store.put(d, b'whatever')
+
+
+def test_load_must_look_up_all_stores(tmp_path):
+    first, second = ChunkStore(tmp_path / 'first'), ChunkStore(tmp_path / 'second')
+    first.put(chunk_digest(b'one'), b'one')
+    second.put(chunk_digest(b'two'), b'two')
+    index = [[chunk_digest(b'one'), 3], [chunk_digest(b'two'), 3]]
+    assert b''.join(load([first, second], index)) == b'onetwo'
+
+    with pytest.raises(CobraApiError):
+        list(load([first], index))
+
+
+def test_get_must_detect_corrupted_chunk(tmp_path):
+    chunk_store = ChunkStore(tmp_path)
+    d = chunk_digest(b'data')
+    chunk_store.put(d, b'data')
+    chunk_store.put_compressed(d, zlib.compress(b'tampered'))
+    with pytest.raises(CobraApiError):
+        chunk_store.get(d)
+
+
+def test_index_must_roundtrip(tmp_path):
+    fn = tmp_path / 'backup@20000505.000000.idx'
+    write_index(fn, [['abc', 1]], name='backup@20000505.000000')
+    assert read_index(fn) == dict(name='backup@20000505.000000', chunks=[['abc', 1]])
+    assert is_index(str(fn))
+    assert index_basename('backup@20000505.000000.idx') == 'backup@20000505.000000'
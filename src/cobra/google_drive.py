@@ -1,18 +1,35 @@
 from cobra.aux_stuff import rand_str
+from cobra.exc import CobraApiError
+from cobra.stream import RangedFile
 
 from googleapiclient.discovery_cache import LOGGER as google_discovery_cache_logger
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import (MediaFileUpload, MediaIoBaseDownload, MediaUpload, MediaIoBaseUpload, 
+    MediaDownloadProgress)
+from googleapiclient.errors import HttpError
 from google.oauth2.service_account import Credentials
+import hashlib
 import io
+import json
+import logging
 import os
+import random
 import shutil
+import socket
+import ssl
+import threading
+import time
+from contextlib import contextmanager
 from os import stat
-from os.path import join, abspath, realpath, exists
+from os.path import join, abspath, realpath, exists, dirname, basename
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from logging import ERROR
+from datetime import datetime, timezone
 
 google_discovery_cache_logger.setLevel(level=ERROR)
 SCOPES = ['https://www.googleapis.com/auth/drive']
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
 
 
 def file_size(filename):
@@ -20,21 +37,392 @@ def file_size(filename):
     return file_stats.st_size
 
 
+# The directory to keep the access tokens in. By default it's in the cobra cache directory.
+TOKEN_CACHE_DIR = None
+
+
+def _token_fn(service_acc_key_fn):
+    '''
+    Returns the file name the access token got by the key is cached in. 
+    The key file replaced gets the new token file.
+    '''
+    key_fn = realpath(service_acc_key_fn)
+    key = hashlib.sha1(f'{key_fn}:{stat(key_fn).st_mtime}'.encode('utf-8')).hexdigest()
+    cache_dir = TOKEN_CACHE_DIR if TOKEN_CACHE_DIR else \
+        join(os.getenv('XDG_CACHE_HOME', join(os.getenv('HOME'), '.cache')), 'cobra', '.cobra', 'tokens')
+    return join(cache_dir, f'{key}.json')
+
+
+class _CachedCredentials(Credentials):
+    '''
+    Service account credentials saving the access token got to the file, so the short runs 
+    reuse the token until it expires instead of requesting the new one every time.
+    '''
+    token_fn = None
+
+
+    def load_token(self):
+        token = _load_state(self.token_fn)
+        if token is not None:
+            self.token = token['token']
+            self.expiry = datetime.fromisoformat(token['expiry'])
+
+
+    def refresh(self, request):
+        super().refresh(request)
+        if self.token_fn and self.expiry:
+            # the token is the secret
+            os.makedirs(dirname(self.token_fn), mode=0o700, exist_ok=True)
+            temp_fn = f'{self.token_fn}.{rand_str()}'
+            with open(os.open(temp_fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump(dict(token=self.token, expiry=self.expiry.isoformat()), f)
+            os.replace(temp_fn, self.token_fn)
+
+
+_credentials = dict()
+_credentials_lock = threading.Lock()
+_local = threading.local()
+_discovery_document = None
+
+
+def _discovery():
+    '''
+    Returns the Drive discovery document bundled with the client library parsed once per process.
+    '''
+    global _discovery_document
+    if _discovery_document is None:
+        _discovery_document = json.loads(get_static_doc('drive', 'v3'))
+
+    return _discovery_document
+
+
+def _credentials_of(service_acc_key_fn):
+    key = realpath(service_acc_key_fn)
+    with _credentials_lock:
+        if key not in _credentials:
+            credentials = _CachedCredentials.from_service_account_file(service_acc_key_fn, scopes=SCOPES)
+            credentials.token_fn = _token_fn(service_acc_key_fn)
+            credentials.load_token()
+            _credentials[key] = credentials
+
+        return _credentials[key]
+
+
 def _service(service_acc_key_fn):
-    credentials = Credentials.from_service_account_file(service_acc_key_fn, scopes=SCOPES)
-    return build('drive', 'v3', credentials=credentials)
+    '''
+    Returns the service of the calling thread. The http client is not thread safe so every thread 
+    gets its own one, while the credentials and so the access token are shared by all of them.
+    '''
+    key = realpath(service_acc_key_fn)
+    services = _local.__dict__.setdefault('services', dict())
+    if key not in services:
+        services[key] = build_from_document(_discovery(), credentials=_credentials_of(service_acc_key_fn))
+
+    return services[key]
+
+
+# the statuses worth retrying, the 403 ones only if the reason is the rate limit
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+MAX_RETRIES = 8
+# the backoff before the n-th retry is random in [0, min(BACKOFF_CAP, BACKOFF_BASE * 2**n)] seconds
+BACKOFF_BASE = 1
+BACKOFF_CAP = 64
+# the requests per second sent by the process at most, the Drive quota is 12000 requests per minute per user
+REQUEST_RATE = 100
+REQUEST_BURST = 100
+
+_logger = logging.getLogger(__name__)
+
+
+def _throttled(e):
+    '''
+    Returns whether the error tells the requests are too frequent.
+    '''
+    if not isinstance(e, HttpError):
+        return False
+
+    status = e.resp.status
+    content = e.content if isinstance(e.content, bytes) else b''
+    return status == 429 or (status == 403 and any(r.encode() in content for r in RATE_LIMIT_REASONS))
+
+
+def _retryable(e):
+    if isinstance(e, HttpError):
+        return _throttled(e) or e.resp.status in RETRY_STATUSES
+
+    return isinstance(e, (ConnectionError, TimeoutError, socket.timeout, ssl.SSLError))
+
+
+class TokenBucket:
+    '''
+    Lets through rate requests per second on average and burst ones at once at most.
+    '''
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__last = clock()
+        self.__lock = threading.Lock()
+
+
+    def acquire(self):
+        '''
+        Takes the token waiting for it if there is none. Returns the time waited.
+        '''
+        with self.__lock:
+            now = self.__clock()
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+            self.__last = now
+            # the token is taken in advance, so the concurrent callers queue up one after another
+            self.__tokens -= 1
+            wait = -self.__tokens / self.__rate if self.__tokens < 0 else 0
+
+        if wait:
+            self.__sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrency:
+    '''
+    Limits the requests in flight. The limit is halved when throttled and grows by one back to maximum 
+    after as many requests as the limit is succeed in a row (additive increase, multiplicative decrease).
+    '''
+    def __init__(self, limit, minimum=1):
+        self.__maximum = limit
+        self.__minimum = min(minimum, limit)
+        self.__limit = limit
+        self.__in_flight = 0
+        self.__succeeded = 0
+        self.__cond = threading.Condition()
+
+
+    @property
+    def limit(self):
+        return self.__limit
+
+
+    @contextmanager
+    def slot(self):
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.__in_flight < self.__limit)
+            self.__in_flight += 1
+        try:
+            yield
+        finally:
+            with self.__cond:
+                self.__in_flight -= 1
+                self.__cond.notify_all()
+
+
+    def throttled(self):
+        with self.__cond:
+            self.__limit = max(self.__minimum, self.__limit // 2)
+            self.__succeeded = 0
+
+
+    def succeeded(self):
+        with self.__cond:
+            self.__succeeded += 1
+            if self.__succeeded >= self.__limit and self.__limit < self.__maximum:
+                self.__limit += 1
+                self.__succeeded = 0
+                self.__cond.notify_all()
+
+
+class TransportPolicy:
+    '''
+    The policy all the Drive requests of the process are sent by. The requests are rate limited 
+    by the token bucket, the throttled, failed by the server and the connection ones are retried 
+    with the exponential backoff with full jitter honoring Retry-After.
+    '''
+    def __init__(self, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP, 
+                 rate=REQUEST_RATE, burst=REQUEST_BURST, sleep=time.sleep):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.__bucket = TokenBucket(rate, burst, sleep=sleep)
+        self.__sleep = sleep
+        self.__lock = threading.Lock()
+        self.__stats = dict(requests=0, retries=0, throttled=0, failed=0, waited=0.0)
+
+
+    def __count(self, key, value=1):
+        with self.__lock:
+            self.__stats[key] += value
+
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
+
+
+    def summary(self):
+        stats = self.stats()
+        return f'Drive requests [{stats["requests"]}], retried [{stats["retries"]}], ' \
+               f'throttled [{stats["throttled"]}], failed [{stats["failed"]}], ' \
+               f'waited [{stats["waited"]:.1f}] seconds'
+
+
+    def backoff(self, attempt, error=None):
+        '''
+        Sleeps before the retry. Returns the time slept.
+        '''
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+        retry_after = error.resp.get('retry-after') if isinstance(error, HttpError) else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(self.backoff_cap, int(retry_after)))
+        self.__count('retries')
+        self.__count('waited', delay)
+        self.__sleep(delay)
+        return delay
+
+
+    def retry(self, e, attempt, concurrency=None):
+        '''
+        Returns whether the request failed with the error is to be sent again, and if so backs off.
+        '''
+        if _throttled(e):
+            self.__count('throttled')
+            if concurrency is not None:
+                concurrency.throttled()
+        if not _retryable(e) or attempt >= self.max_retries:
+            self.__count('failed')
+            return False
+
+        delay = self.backoff(attempt, e)
+        _logger.warning(f'Retrying in [{delay:.1f}] seconds after [{e}]')
+        return True
+
+
+    def call(self, fn, concurrency=None):
+        '''
+        Returns the result of fn sending the request, retrying it according to the policy.
+
+        @param concurrency The AdaptiveConcurrency limiting the parallel calls of fn told about throttling
+        '''
+        attempt = 0
+        while True:
+            self.__count('waited', self.__bucket.acquire())
+            self.__count('requests')
+            try:
+                rv = fn()
+            except Exception as e:
+                if not self.retry(e, attempt, concurrency):
+                    raise
+                attempt += 1
+                continue
+
+            if concurrency is not None:
+                concurrency.succeeded()
+            return rv
+
+
+# shared by all the threads so the limits apply to the process
+TRANSPORT = TransportPolicy()
+
+
+def _execute(request, concurrency=None):
+    return TRANSPORT.call(request.execute, concurrency)
+
+
+# must be multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = 8*1024*1024
+MIN_UPLOAD_CHUNK_SIZE = 1024*1024
+MAX_UPLOAD_CHUNK_SIZE = 64*1024*1024
+_UPLOAD_CHUNK_ALIGN = 256*1024
+# the time a single chunk upload is aimed to take
+CHUNK_DURATION = 4
+
+
+class AdaptiveMediaFileUpload(MediaFileUpload):
+    '''
+    Resumable file media which chunk size is tuned for every chunk to take about CHUNK_DURATION seconds.
+    The small chunks cost the round trip each, the big ones cost much to resend on failure.
+    '''
+    def __init__(self, filename, mimetype, chunksize=UPLOAD_CHUNK_SIZE):
+        super().__init__(filename, mimetype=mimetype, resumable=True, chunksize=chunksize)
+        self.__chunksize = chunksize
+
+
+    def chunksize(self):
+        return self.__chunksize
+
+
+    def adapt(self, elapsed):
+        wanted = self.__chunksize * CHUNK_DURATION / max(elapsed, 0.001)
+        # twice at most at once not to overreact to the single slow or fast chunk
+        wanted = min(max(wanted, self.__chunksize / 2), self.__chunksize * 2)
+        wanted = min(max(wanted, MIN_UPLOAD_CHUNK_SIZE), MAX_UPLOAD_CHUNK_SIZE)
+        self.__chunksize = int(wanted) // _UPLOAD_CHUNK_ALIGN * _UPLOAD_CHUNK_ALIGN
+
+
+def _load_state(state_fn):
+    if not state_fn or not exists(state_fn):
+        return None
+
+    with open(state_fn) as f:
+        return json.load(f)
 
 
 def upload_file(service_acc_key_fn, filename, mimetype,
-                upload_filename, parent_folder_id, resumable=True, chunksize=262144):
+                upload_filename, parent_folder_id, resumable=True, chunksize=None, state_fn=None):
+    '''
+    Uploads the file. Yields the upload progress.
+
+    @param chunksize The upload chunk size. If not given it's chosen adaptively.
+    @param state_fn If given the upload session is saved to it after every chunk, so the upload 
+                    interrupted is resumed by the next call with the same file and folder
+    '''
     service = _service(service_acc_key_fn)
-    media = MediaFileUpload(filename, mimetype=mimetype, resumable=resumable, chunksize=chunksize)
+    if not resumable:
+        media = MediaFileUpload(filename, mimetype=mimetype, resumable=False)
+    elif chunksize:
+        media = MediaFileUpload(filename, mimetype=mimetype, resumable=True, chunksize=chunksize)
+    else:
+        media = AdaptiveMediaFileUpload(filename, mimetype)
     body = dict(name=upload_filename, parents=[parent_folder_id])
     
     request = service.files().create(body=body, media_body=media)
+    file_stat = stat(filename)
+    state = dict(filename=abspath(filename), size=file_stat.st_size, mtime=file_stat.st_mtime, 
+                 name=upload_filename, folder_id=parent_folder_id)
+    saved = _load_state(state_fn) if resumable else None
+    resumed = saved is not None and all(saved.get(k) == v for k, v in state.items())
     done = None
+    if resumed:
+        request.resumable_uri = saved['uri']
+        try:
+            offset, done = TRANSPORT.call(lambda: _committed_offset(request, file_stat.st_size))
+        except HttpError as e:
+            if e.resp.status not in (404, 410):
+                raise
+            # the session has expired, starting over
+            resumed = False
+            request = service.files().create(body=body, media_body=media)
+        else:
+            request.resumable_progress = offset
+
     while done is None:
-        chunk = request.next_chunk()
+        start = time.monotonic()
+        try:
+            chunk = TRANSPORT.call(request.next_chunk)
+        except HttpError as e:
+            if not resumed or e.resp.status not in (404, 410):
+                raise
+            # the session has expired, starting over
+            resumed = False
+            request = service.files().create(body=body, media_body=media)
+            continue
+
+        if state_fn and request.resumable_uri:
+            _save_json(state_fn, dict(state, uri=request.resumable_uri, progress=request.resumable_progress))
+
+        if isinstance(media, AdaptiveMediaFileUpload):
+            media.adapt(time.monotonic() - start)
+
         if not chunk:
             continue
 
@@ -42,16 +430,123 @@ def upload_file(service_acc_key_fn, filename, mimetype,
         if status:
             yield status
 
+    if state_fn and exists(state_fn):
+        os.remove(state_fn)
+
     return request
 
 
+def _committed_offset(request, size):
+    '''
+    Asks the upload session for the bytes it has got. Returns the offset to continue from along with None 
+    or None along with the file resource if the upload is complete already. 
+    Raises HttpError if the session is gone.
+    '''
+    headers = { 'Content-Range': f'bytes */{size}', 'Content-Length': '0' }
+    resp, content = request.http.request(request.resumable_uri, 'PUT', headers=headers)
+    if resp.status in (200, 201):
+        return None, request.postproc(resp, content)
+    if resp.status != 308:
+        raise HttpError(resp, content, uri=request.resumable_uri)
+
+    # the range is bytes=0-N where N is the last byte got, there is none if nothing is got
+    committed = resp.get('range')
+    return (int(committed.rsplit('-', 1)[1]) + 1 if committed else 0), None
+
+
+# must be multiple of 256 KiB
+STREAM_CHUNK_SIZE = 8*1024*1024
+
+
+class ChunksMediaUpload(MediaUpload):
+    '''
+    Resumable media of unknown size read from the byte chunks iterable. 
+    Only the data not yet confirmed by the server is kept in memory 
+    that is at most two upload chunks ahead.
+    '''
+    def __init__(self, chunks, mimetype, chunksize=STREAM_CHUNK_SIZE):
+        self.__chunks = iter(chunks)
+        self.__mimetype = mimetype
+        self.__chunksize = chunksize
+        self.__buffer = bytearray()
+        self.__offset = 0
+        self.__size = None
+
+
+    def chunksize(self):
+        return self.__chunksize
+
+
+    def mimetype(self):
+        return self.__mimetype
+
+
+    def size(self):
+        # size is asked before every chunk is sent, reading ahead lets the last full chunk
+        # be sent along with the total size, otherwise the empty request would be needed
+        self.__fill(self.__offset + 2*self.__chunksize + 1)
+        return self.__size
+
+
+    def resumable(self):
+        return True
+
+
+    def has_stream(self):
+        return False
+
+
+    def getbytes(self, begin, length):
+        if begin < self.__offset:
+            raise ValueError(f'The data at [{begin}] is already discarded')
+
+        del self.__buffer[:begin - self.__offset]
+        self.__offset = begin
+        self.__fill(begin + length)
+        return bytes(self.__buffer[:length])
+
+
+    def __fill(self, end):
+        while self.__size is None and self.__offset + len(self.__buffer) < end:
+            try:
+                self.__buffer += next(self.__chunks)
+            except StopIteration:
+                self.__size = self.__offset + len(self.__buffer)
+
+
+def upload_stream(service_acc_key_fn, chunks, mimetype, upload_filename, 
+                  parent_folder_id, chunksize=STREAM_CHUNK_SIZE):
+    service = _service(service_acc_key_fn)
+    media = ChunksMediaUpload(chunks, mimetype, chunksize)
+    body = dict(name=upload_filename, parents=[parent_folder_id])
+
+    request = service.files().create(body=body, media_body=media)
+    done = None
+    while done is None:
+        status, done = TRANSPORT.call(request.next_chunk)
+        if status:
+            yield status
+
+    return done
+
+
 DOWNLOAD_CHUNK_SIZE = 20*1024*1024
+DEFAULT_CONNECTIONS = 4
+
+def download_file(service_acc_key_fn, file_id, local_dir=None, use_cache=True, chunksize=DOWNLOAD_CHUNK_SIZE,
+                  connections=None, reserve=None):
+    '''
+    Downloads the file. Yields the file name first and then the download progress.
+    Downloading to local_dir the file is fetched by ranges using several connections at a time, 
+    the progress is journaled so the interrupted download is resumed, the result is checked by md5.
+    The file already in local_dir is taken if its size and md5 are the same as the remote ones.
 
-def download_file(service_acc_key_fn, file_id, local_dir=None, use_cache=True, chunksize=DOWNLOAD_CHUNK_SIZE):
+    @param reserve If given it's called with the file name and size before downloading to make room for it
+    '''
     service = _service(service_acc_key_fn)
 
     # pylint: disable=maybe-no-member
-    metadata = service.files().get(fileId=file_id).execute()
+    metadata = _execute(service.files().get(fileId=file_id, fields='name,size,md5Checksum', supportsAllDrives=True))
     fn = metadata['name']
     yield fn
     if local_dir:
@@ -61,14 +556,24 @@ def download_file(service_acc_key_fn, file_id, local_dir=None, use_cache=True, c
 
         temp_fn = join(local_dir, rand_str(16))
         full_fn = join(local_dir, fn)
-        if use_cache and exists(full_fn):
+        if use_cache and exists(full_fn) and cache_valid(full_fn, metadata):
+            return full_fn
+
+        if reserve:
+            reserve(fn, int(metadata.get('size', 0)))
+
+        # the native google documents have no size
+        if 'size' in metadata:
+            yield from _download_ranges(service_acc_key_fn, file_id, metadata, full_fn, chunksize, connections)
+            if metadata.get('md5Checksum'):
+                save_checksum(full_fn, metadata['md5Checksum'])
             return full_fn
 
     request = service.files().get_media(fileId=file_id)
     with io.FileIO(temp_fn, 'wb') if local_dir else io.BytesIO() as stream:
         downloader = MediaIoBaseDownload(stream, request, chunksize=chunksize)
         while True:
-            status, done = downloader.next_chunk()
+            status, done = TRANSPORT.call(downloader.next_chunk)
             yield status
             if done:
                 break
@@ -80,13 +585,412 @@ def download_file(service_acc_key_fn, file_id, local_dir=None, use_cache=True, c
         return stream.getvalue(), fn
 
 
-def folder_list(service_acc_key_fn, folder_id):
+def _load_journal(journal_fn, part_fn, file_id, metadata, chunksize):
+    '''
+    Returns the journal of the download to resume or the new one if the file has changed since.
+    '''
+    if exists(journal_fn) and exists(part_fn):
+        with open(journal_fn) as f:
+            journal = json.load(f)
+        if journal.get('id') == file_id and journal.get('md5') == metadata.get('md5Checksum') \
+           and journal.get('size') == int(metadata['size']):
+            return journal
+
+    with open(part_fn, 'wb') as f:
+        f.truncate(int(metadata['size']))
+
+    return dict(id=file_id, md5=metadata.get('md5Checksum'), size=int(metadata['size']), chunksize=chunksize, done=[])
+
+
+def _save_json(fn, obj):
+    os.makedirs(dirname(fn), exist_ok=True)
+    temp_fn = f'{fn}.{rand_str()}'
+    with open(temp_fn, 'w') as f:
+        json.dump(obj, f)
+    os.replace(temp_fn, fn)
+
+
+def _md5(fn):
+    digest = hashlib.md5()
+    with open(fn, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _checksum_fn(full_fn):
+    return join(dirname(full_fn), f'.{basename(full_fn)}.md5')
+
+
+def save_checksum(full_fn, md5):
+    st = stat(full_fn)
+    _save_json(_checksum_fn(full_fn), dict(md5=md5, size=st.st_size, mtime=st.st_mtime_ns))
+
+
+def saved_md5(full_fn):
+    '''
+    Returns the md5 kept next to the file if the file isn't modified since, otherwise None.
+    '''
+    st = stat(full_fn)
+    saved = _load_state(_checksum_fn(full_fn))
+    if saved is None or saved.get('size') != st.st_size or saved.get('mtime') != st.st_mtime_ns:
+        return None
+
+    return saved['md5']
+
+
+def cache_valid(full_fn, metadata):
+    '''
+    Returns whether the file downloaded before is the same as the remote one. 
+    The md5 is computed once and kept next to the file while the file isn't modified.
+    '''
+    st = stat(full_fn)
+    if 'size' in metadata and st.st_size != int(metadata['size']):
+        return False
+
+    md5 = metadata.get('md5Checksum')
+    if not md5:
+        return True
+
+    saved = saved_md5(full_fn)
+    if saved is None:
+        saved = _md5(full_fn)
+        save_checksum(full_fn, saved)
+
+    return saved == md5
+
+
+def _download_ranges(service_acc_key_fn, file_id, metadata, full_fn, chunksize, connections):
+    part_fn = join(dirname(full_fn), f'.{basename(full_fn)}.part')
+    journal_fn = f'{part_fn}.json'
+    journal = _load_journal(journal_fn, part_fn, file_id, metadata, chunksize)
+    size, chunksize = journal['size'], journal['chunksize']
+    done = set(journal['done'])
+    todo = [i for i in range(-(-size // chunksize)) if i not in done]
+
+    # the workers are shrunk while Drive throttles and grown back once it doesn't
+    concurrency = AdaptiveConcurrency(connections if connections else DEFAULT_CONNECTIONS)
+
+    def fetch(i):
+        start, end = i * chunksize, min((i + 1) * chunksize, size)
+        with concurrency.slot():
+            data = _get_range(_service(service_acc_key_fn), file_id, start, end, concurrency)
+        if len(data) != end - start:
+            raise IOError(f'Got [{len(data)}] bytes of range [{start}, {end}) of [{file_id}]')
+
+        with open(part_fn, 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+        return i
+
+    with ThreadPoolExecutor(max_workers=concurrency.limit) as executor:
+        futures = [executor.submit(fetch, i) for i in todo]
+        try:
+            for future in as_completed(futures):
+                done.add(future.result())
+                _save_json(journal_fn, dict(journal, done=sorted(done)))
+                yield MediaDownloadProgress(min(len(done) * chunksize, size), size)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    md5 = metadata.get('md5Checksum')
+    if md5 and _md5(part_fn) != md5:
+        os.remove(part_fn)
+        os.remove(journal_fn)
+        raise CobraApiError(f'Checksum mismatch of the downloaded file [{basename(full_fn)}]')
+
+    os.replace(part_fn, full_fn)
+    if exists(journal_fn):
+        os.remove(journal_fn)
+
+
+def file_name(service_acc_key_fn, file_id):
+    service = _service(service_acc_key_fn)
+    return _execute(service.files().get(fileId=file_id, fields='name', supportsAllDrives=True))['name']
+
+
+def download_stream(service_acc_key_fn, file_id, chunksize=DOWNLOAD_CHUNK_SIZE):
+    '''
+    Downloads the file chunk by chunk. Returns generator yielding the file content, 
+    only the current chunk is kept in memory.
+    '''
+    service = _service(service_acc_key_fn)
+    request = service.files().get_media(fileId=file_id)
+    stream = io.BytesIO()
+    downloader = MediaIoBaseDownload(stream, request, chunksize=chunksize)
+    done = False
+    while not done:
+        _, done = TRANSPORT.call(downloader.next_chunk)
+        data = stream.getvalue()
+        stream.seek(0)
+        stream.truncate()
+        if data:
+            yield data
+
+
+def _get_range(service, file_id, start, end, concurrency=None):
+    request = service.files().get_media(fileId=file_id, supportsAllDrives=True)
+    request.headers['Range'] = f'bytes={start}-{end - 1}'
+    return _execute(request, concurrency)
+
+
+def read_range(service_acc_key_fn, file_id, start, end):
+    '''
+    Returns [start, end) bytes of the file.
+    '''
+    return _get_range(_service(service_acc_key_fn), file_id, start, end)
+
+
+BLOCK_SIZE = 1024*1024
+
+
+class RemoteFile(RangedFile):
+    '''
+    Seekable read only file object of the drive file fetching only the byte ranges read.
+    See RangedFile for the blocks caching.
+    '''
+    def __init__(self, service_acc_key_fn, file_id, block_cache_dir=None, block_size=None):
+        service = _service(service_acc_key_fn)
+        metadata = _execute(service.files().get(fileId=file_id, fields='name,size,md5Checksum', 
+                                                supportsAllDrives=True))
+        # the file content change is detected by md5
+        cache_dir = join(block_cache_dir, f'{file_id}.{metadata.get("md5Checksum", "")}') if block_cache_dir else None
+        super().__init__(lambda start, end: _get_range(service, file_id, start, end), metadata['name'], 
+                         int(metadata['size']), cache_dir, block_size if block_size else BLOCK_SIZE)
+
+
+FILE_FIELDS = 'id,name,createdTime,modifiedTime,size,md5Checksum'
+
+
+def _quote(value):
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+def _rfc3339(dt):
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def folder_query(folder_id, exclude=None, after=None, before=None, name=None):
+    '''
+    Returns the query of the backup files in the folder. The sub folders e.g. the chunks one are not listed.
+
+    @param name The exact name of the files listed
+    @param exclude The name part the files listed must not contain
+    @param after The datetime the files listed must be created after
+    @param before The datetime the files listed must be created before
+    '''
+    q = f"{_quote(folder_id)} in parents and trashed = false and mimeType != {_quote(FOLDER_MIMETYPE)}"
+    # Drive matches the words of the name by prefix, so the names it excludes surely contain 
+    # the pattern, the rest is to be checked by the caller
+    if exclude:
+        q += f" and not name contains {_quote(exclude)}"
+    if after:
+        q += f" and createdTime > {_quote(_rfc3339(after))}"
+    if before:
+        q += f" and createdTime < {_quote(_rfc3339(before))}"
+    if name:
+        q += f" and name = {_quote(name)}"
+    return q
+
+
+def folder_list(service_acc_key_fn, folder_id, exclude=None, after=None, before=None, latest=False, name=None):
+    '''
+    Returns the list of the backup files in the folder ordered by creation time.
+    See folder_query for the filter parameters.
+
+    @param latest If True only the latest file is requested
+    '''
+    service = _service(service_acc_key_fn)
+    q = folder_query(folder_id, exclude, after, before, name)
+    if latest:
+        return _list_all(service, q, FILE_FIELDS, order_by='createdTime desc', limit=1)
+
+    return _list_all(service, q, FILE_FIELDS, order_by='createdTime')
+
+
+def _list_all(service, q, fields='id,name', order_by=None, limit=None):
+    files = list()
+    page_token = None
+    while True:
+        results = _execute(service.files().list(q=q, fields=f'nextPageToken,files({fields})',
+                                                corpora='allDrives',
+                                                supportsAllDrives=True, 
+                                                includeItemsFromAllDrives=True,
+                                                orderBy=order_by,
+                                                pageSize=limit if limit else 1000,
+                                                pageToken=page_token))
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token or (limit and len(files) >= limit):
+            return files[:limit] if limit else files
+
+
+class FolderCatalog:
+    '''
+    The local copy of the folder listing kept in the file. It's brought up to date by the Drive changes 
+    since the last time, that is usually the single request with no changes, instead of listing the folder.
+    '''
+    def __init__(self, service_acc_key_fn, folder_id, catalog_fn):
+        self.__service_acc_key_fn = service_acc_key_fn
+        self.__folder_id = folder_id
+        self.__catalog_fn = catalog_fn
+
+
+    def files(self):
+        '''
+        Returns the up to date list of the folder files ordered by creation time.
+        '''
+        catalog = _load_state(self.__catalog_fn)
+        if catalog is None or catalog.get('folder_id') != self.__folder_id:
+            catalog = self.__rebuild()
+        else:
+            try:
+                self.__update(catalog)
+            except HttpError as e:
+                # the page token is no longer valid
+                if e.resp.status not in (400, 404, 410):
+                    raise
+                catalog = self.__rebuild()
+
+        _save_json(self.__catalog_fn, catalog)
+        return sorted(catalog['files'].values(), key=lambda f: f.get('createdTime', ''))
+
+
+    def __rebuild(self):
+        service = _service(self.__service_acc_key_fn)
+        # taken before listing not to miss the changes made meanwhile
+        token = _execute(service.changes().getStartPageToken(supportsAllDrives=True))['startPageToken']
+        files = folder_list(self.__service_acc_key_fn, self.__folder_id)
+        return dict(folder_id=self.__folder_id, token=token, files={ f['id']: f for f in files })
+
+
+    def __update(self, catalog):
+        service = _service(self.__service_acc_key_fn)
+        files = catalog['files']
+        page_token = catalog['token']
+        while page_token:
+            results = _execute(service.changes().list(pageToken=page_token, spaces='drive', pageSize=1000,
+                                                      supportsAllDrives=True, includeItemsFromAllDrives=True,
+                                                      fields=f'nextPageToken,newStartPageToken,'
+                                                             f'changes(fileId,removed,file({FILE_FIELDS},parents,trashed,mimeType))'
+                                                      ))
+            for change in results.get('changes', []):
+                f = change.get('file')
+                if change.get('removed') or not f or f.get('trashed') or f.get('mimeType') == FOLDER_MIMETYPE \
+                        or self.__folder_id not in f.get('parents', []):
+                    files.pop(change['fileId'], None)
+                else:
+                    files[f['id']] = { k: f[k] for k in FILE_FIELDS.split(',') if k in f }
+
+            if 'newStartPageToken' in results:
+                catalog['token'] = results['newStartPageToken']
+            page_token = results.get('nextPageToken')
+
+
+_folders_lock = threading.Lock()
+
+
+def ensure_folder(service_acc_key_fn, parent_folder_id, name):
+    '''
+    Returns the id of the sub folder with the given name creating it if necessary.
+    '''
     service = _service(service_acc_key_fn)
-    results = service.files().list(q=f"'{folder_id}' in parents",
-                                   fields='files(id,name,createdTime,modifiedTime,size,md5Checksum)',
-                                   corpora='allDrives',
-                                   supportsAllDrives=True, 
-                                   includeItemsFromAllDrives=True,
-                                   orderBy='createdTime').execute()
-
-    return results.get('files', [])
+    q = f"{_quote(parent_folder_id)} in parents and name = {_quote(name)} and mimeType = {_quote(FOLDER_MIMETYPE)} " \
+        "and trashed = false"
+    # the concurrent pushes must not create the same folder twice
+    with _folders_lock:
+        folders = _list_all(service, q)
+        if folders:
+            return folders[0]['id']
+
+        body = dict(name=name, parents=[parent_folder_id], mimeType=FOLDER_MIMETYPE)
+        return _execute(service.files().create(body=body, fields='id', supportsAllDrives=True))['id']
+
+
+def find_file(service_acc_key_fn, folder_id, name):
+    '''
+    Returns the id of the file with the given name in the folder or None if there is no such one.
+    '''
+    service = _service(service_acc_key_fn)
+    files = _list_all(service, f"{_quote(folder_id)} in parents and name = {_quote(name)} and trashed = false", 
+                      limit=1)
+    return files[0]['id'] if files else None
+
+
+def names_list(service_acc_key_fn, folder_id):
+    '''
+    Returns the dict of all the file names in the folder to their ids.
+    '''
+    service = _service(service_acc_key_fn)
+    files = _list_all(service, f"{_quote(folder_id)} in parents and trashed = false")
+    return { f['name']: f['id'] for f in files }
+
+
+def upload_bytes(service_acc_key_fn, data, upload_filename, parent_folder_id, 
+                 mimetype='application/octet-stream'):
+    service = _service(service_acc_key_fn)
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mimetype, resumable=False)
+    body = dict(name=upload_filename, parents=[parent_folder_id])
+    return _execute(service.files().create(body=body, media_body=media, fields='id'))
+
+
+def download_bytes(service_acc_key_fn, file_id):
+    service = _service(service_acc_key_fn)
+    return _execute(service.files().get_media(fileId=file_id))
+
+
+def file_parents(service_acc_key_fn, file_id):
+    service = _service(service_acc_key_fn)
+    return _execute(service.files().get(fileId=file_id, fields='parents', supportsAllDrives=True)).get('parents', [])
+
+
+def file_metadata(service_acc_key_fn, file_id):
+    '''
+    Returns the file listing fields along with the parents of the file.
+    '''
+    service = _service(service_acc_key_fn)
+    return _execute(service.files().get(fileId=file_id, fields=f'{FILE_FIELDS},parents', supportsAllDrives=True))
+
+
+# Drive takes at most this many requests in one batch
+DELETE_BATCH = 100
+
+def delete_files(service_acc_key_fn, file_ids):
+    '''
+    Deletes the files by the batch requests of DELETE_BATCH deletes each instead of the request per file. 
+    The files not found are taken as deleted, the throttled deletes are sent again in the next batches.
+    Raises CobraApiError listing the files failed once all the batches are sent.
+    '''
+    service = _service(service_acc_key_fn)
+    file_ids = list(file_ids)
+    failed = dict()
+    retried = list()
+
+    def callback(request_id, response, exception):
+        if exception is None or (isinstance(exception, HttpError) and exception.resp.status == 404):
+            return
+        if _retryable(exception):
+            retried.append(request_id)
+        failed[request_id] = exception
+
+    pending = file_ids
+    attempt = 0
+    while pending:
+        for i in range(0, len(pending), DELETE_BATCH):
+            batch = service.new_batch_http_request(callback=callback)
+            for file_id in pending[i:i + DELETE_BATCH]:
+                batch.add(service.files().delete(fileId=file_id, supportsAllDrives=True), request_id=file_id)
+            TRANSPORT.call(batch.execute)
+
+        pending, retried[:] = list(retried), list()
+        if pending and not TRANSPORT.retry(failed[pending[0]], attempt):
+            break
+        for file_id in pending:
+            failed.pop(file_id)
+        attempt += 1
+
+    if failed:
+        raise CobraApiError(f'Failed to delete [{len(failed)}] of [{len(file_ids)}] files: {", ".join(failed)}', failed)
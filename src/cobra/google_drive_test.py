@@ -0,0 +1,558 @@
+from cobra.google_drive import (ChunksMediaUpload, _list_all, download_stream, RemoteFile, read_range, download_file, 
+    upload_file, AdaptiveMediaFileUpload, _service, _CachedCredentials, SCOPES, folder_list, folder_query, FolderCatalog, MIN_UPLOAD_CHUNK_SIZE, MAX_UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_SIZE, 
+    delete_files, DELETE_BATCH, ensure_folder, names_list, TransportPolicy, TokenBucket, AdaptiveConcurrency)
+from cobra.exc import CobraApiError
+
+import pytest
+import io
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from googleapiclient.errors import HttpError
+import httplib2
+
+
+CHUNK_SIZE = 8
+
+
+def test_chunks_media_upload_must_return_requested_ranges():
+    media = ChunksMediaUpload([b'0123', b'4567', b'89'], 'application/zstd', chunksize=CHUNK_SIZE)
+    assert media.resumable()
+    assert media.mimetype() == 'application/zstd'
+    assert media.getbytes(0, CHUNK_SIZE) == b'01234567'
+    # resend after failure
+    assert media.getbytes(4, CHUNK_SIZE) == b'456789'
+    assert media.size() == 10
+
+
+def test_chunks_media_upload_must_discard_confirmed_data():
+    media = ChunksMediaUpload([b'0123', b'4567', b'89'], 'application/zstd', chunksize=CHUNK_SIZE)
+    media.getbytes(4, CHUNK_SIZE)
+    with pytest.raises(ValueError):
+        media.getbytes(0, CHUNK_SIZE)
+
+
+def test_chunks_media_upload_must_read_ahead_to_know_size_before_last_full_chunk():
+    chunks = (bytes([i]) * 4 for i in range(6))
+    media = ChunksMediaUpload(chunks, 'application/zstd', chunksize=CHUNK_SIZE)
+    assert media.size() is None
+    media.getbytes(0, CHUNK_SIZE)
+    assert media.size() is None
+    media.getbytes(8, CHUNK_SIZE)
+    assert media.size() == 24
+    assert len(media.getbytes(16, CHUNK_SIZE)) == CHUNK_SIZE
+
+
+def test_list_all_must_follow_page_tokens():
+    service = MagicMock()
+    service.files.return_value.list.return_value.execute.side_effect = [
+        dict(files=[dict(id='1', name='a')], nextPageToken='token'),
+        dict(files=[dict(id='2', name='b')]),
+    ]
+    assert _list_all(service, "'folder' in parents") == [dict(id='1', name='a'), dict(id='2', name='b')]
+    page_tokens = [c.kwargs['pageToken'] for c in service.files.return_value.list.call_args_list]
+    assert page_tokens == [None, 'token']
+
+
+def test_download_stream_must_yield_chunks_and_keep_only_the_current_one():
+    class Downloader:
+        def __init__(self, fd, request, chunksize):
+            self.__fd = fd
+            self.__chunks = [b'0123', b'4567', b'89']
+
+        def next_chunk(self):
+            self.__fd.write(self.__chunks.pop(0))
+            return None, not self.__chunks
+
+    with patch('cobra.google_drive._service'), patch('cobra.google_drive.MediaIoBaseDownload', Downloader):
+        assert list(download_stream('creds.json', 'file-id')) == [b'0123', b'4567', b'89']
+
+
+def make_drive_service(data, name='backup.tar', md5='md5'):
+    '''
+    Returns the drive service mock serving the ranges of data. The list of the ranges requested is returned too.
+    '''
+    service = MagicMock()
+    service.files.return_value.get.return_value.execute.return_value = dict(name=name, size=str(len(data)), md5Checksum=md5)
+    ranges = list()
+    def get_media(fileId, **kwargs):
+        request = MagicMock()
+        request.headers = dict()
+        def execute():
+            start, end = map(int, request.headers['Range'][len('bytes='):].split('-'))
+            ranges.append((start, end + 1))
+            return data[start:end + 1]
+        request.execute.side_effect = execute
+        return request
+
+    service.files.return_value.get_media.side_effect = get_media
+    return service, ranges
+
+
+def test_remote_file_must_fetch_only_blocks_read(tmp_path):
+    data = bytes(range(256)) * 100
+    service, ranges = make_drive_service(data)
+    with patch('cobra.google_drive._service', return_value=service):
+        f = RemoteFile('creds.json', 'file-id', tmp_path, block_size=1000)
+        assert f.name == 'backup.tar'
+        f.seek(2500)
+        assert f.read(1000) == data[2500:3500]
+        assert ranges == [(2000, 4000)]
+        f.seek(-10, io.SEEK_END)
+        assert f.read() == data[-10:]
+        assert ranges[-1] == (25000, 25600)
+        assert f.fetched == 2600
+
+        # the blocks are cached on disk
+        f = RemoteFile('creds.json', 'file-id', tmp_path, block_size=1000)
+        f.seek(2000)
+        assert f.read(2000) == data[2000:4000]
+        assert len(ranges) == 2
+        assert f.fetched == 0
+
+
+def test_read_range_must_request_range():
+    data = b'0123456789'
+    service, ranges = make_drive_service(data)
+    with patch('cobra.google_drive._service', return_value=service):
+        assert read_range('creds.json', 'file-id', 2, 5) == b'234'
+
+
+def download(tmp_path, **kwargs):
+    gen = download_file('creds.json', 'file-id', tmp_path, chunksize=1000, **kwargs)
+    assert next(gen) == 'backup.tar'
+    statuses = list()
+    try:
+        while True:
+            statuses.append(next(gen))
+    except StopIteration as e:
+        return e.value, statuses
+
+
+def test_download_file_must_fetch_ranges_in_parallel_and_check_md5(tmp_path):
+    data = os.urandom(10500)
+    service, ranges = make_drive_service(data, md5=hashlib.md5(data).hexdigest())
+    with patch('cobra.google_drive._service', return_value=service):
+        fn, statuses = download(tmp_path, connections=3)
+
+    assert fn == str(tmp_path / 'backup.tar')
+    assert open(fn, 'rb').read() == data
+    assert sorted(ranges) == [(i, min(i + 1000, len(data))) for i in range(0, len(data), 1000)]
+    assert statuses[-1].progress() == 1
+    # the partial file and the journal are gone, the checksum is kept to validate the cached file
+    assert sorted(os.listdir(tmp_path)) == ['.backup.tar.md5', 'backup.tar']
+
+
+def test_download_file_must_take_cached_file_only_if_checksum_matches(tmp_path):
+    data = os.urandom(3000)
+    service, ranges = make_drive_service(data, md5=hashlib.md5(data).hexdigest())
+    (tmp_path / 'backup.tar').write_bytes(data)
+    reserve = MagicMock()
+    with patch('cobra.google_drive._service', return_value=service):
+        download(tmp_path, reserve=reserve)
+        assert ranges == list()
+        reserve.assert_not_called()
+
+        (tmp_path / 'backup.tar').write_bytes(os.urandom(3000))
+        fn, _ = download(tmp_path, reserve=reserve)
+
+    assert open(fn, 'rb').read() == data
+    reserve.assert_called_once_with('backup.tar', 3000)
+
+
+def test_download_file_must_resume_by_journal(tmp_path):
+    data = os.urandom(5000)
+    (tmp_path / '.backup.tar.part').write_bytes(data[:2000] + bytes(3000))
+    journal = dict(id='file-id', md5=hashlib.md5(data).hexdigest(), size=len(data), chunksize=1000, done=[0, 1])
+    (tmp_path / '.backup.tar.part.json').write_text(json.dumps(journal))
+    service, ranges = make_drive_service(data, md5=hashlib.md5(data).hexdigest())
+    with patch('cobra.google_drive._service', return_value=service):
+        fn, _ = download(tmp_path)
+
+    assert sorted(ranges) == [(2000, 3000), (3000, 4000), (4000, 5000)]
+    assert open(fn, 'rb').read() == data
+
+
+def test_download_file_must_keep_journal_if_interrupted(tmp_path):
+    data = os.urandom(3000)
+    service, ranges = make_drive_service(data, md5=hashlib.md5(data).hexdigest())
+    media = service.files.return_value.get_media.side_effect
+    def get_media(fileId, **kwargs):
+        request = media(fileId, **kwargs)
+        execute = request.execute.side_effect
+        request.execute.side_effect = lambda: execute() if request.headers['Range'] != 'bytes=1000-1999' else 1/0
+        return request
+    service.files.return_value.get_media.side_effect = get_media
+    with patch('cobra.google_drive._service', return_value=service), pytest.raises(ZeroDivisionError):
+        download(tmp_path, connections=1)
+
+    journal = json.loads((tmp_path / '.backup.tar.part.json').read_text())
+    assert journal['done'] == [0]
+
+
+def test_download_file_must_fail_on_checksum_mismatch(tmp_path):
+    service, _ = make_drive_service(b'data', md5='wrong')
+    with patch('cobra.google_drive._service', return_value=service), pytest.raises(CobraApiError):
+        download(tmp_path)
+
+    assert os.listdir(tmp_path) == list()
+
+
+def make_upload_request(statuses):
+    request = MagicMock()
+    request.resumable_uri = None
+    request.resumable_progress = 0
+
+    def next_chunk():
+        request.resumable_uri = 'session-uri'
+        request.resumable_progress += 1
+        return statuses.pop(0)
+
+    request.next_chunk.side_effect = next_chunk
+    return request
+
+
+@patch('cobra.google_drive._service')
+def test_upload_file_must_save_session_and_remove_it_when_done(service_mock, tmp_path):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    state_fn = str(tmp_path / 'state' / 'upload.json')
+    saved = list()
+    request = make_upload_request([('status', None), (None, dict(id='file-id'))])
+    service_mock.return_value.files.return_value.create.return_value = request
+    with patch('cobra.google_drive._save_json', side_effect=lambda f, obj: saved.append(obj)):
+        assert list(upload_file('key.json', str(fn), 'application/gzip', 'backup.tar.gz', 'folder', 
+                                chunksize=UPLOAD_CHUNK_SIZE, state_fn=state_fn)) == ['status']
+
+    assert [s['uri'] for s in saved] == ['session-uri', 'session-uri']
+    assert saved[0]['name'] == 'backup.tar.gz' and saved[0]['folder_id'] == 'folder'
+    assert not os.path.exists(state_fn)
+
+
+def save_upload_state(fn, state_fn):
+    st = os.stat(fn)
+    state_fn.write_text(json.dumps(dict(filename=str(fn), size=st.st_size, mtime=st.st_mtime, 
+                                        name='backup.tar.gz', folder_id='folder', uri='saved-uri')))
+
+
+@pytest.mark.parametrize('committed, offset', [('bytes=0-1', 2), (None, 0)])
+@patch('cobra.google_drive._service')
+def test_upload_file_must_resume_saved_session_from_committed_offset(service_mock, tmp_path, committed, offset):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    state_fn = tmp_path / 'upload.json'
+    save_upload_state(fn, state_fn)
+    request = make_upload_request([(None, dict(id='file-id'))])
+    headers = dict(status='308', range=committed) if committed else dict(status='308')
+    request.http.request.return_value = (httplib2.Response(headers), b'')
+    request.next_chunk.side_effect = lambda: (None, dict(uri=request.resumable_uri, 
+                                                         progress=request.resumable_progress))
+    service_mock.return_value.files.return_value.create.return_value = request
+    rv = upload_file('key.json', str(fn), 'application/gzip', 'backup.tar.gz', 'folder', 
+                     chunksize=UPLOAD_CHUNK_SIZE, state_fn=str(state_fn))
+    list(rv)
+    request.http.request.assert_called_once_with('saved-uri', 'PUT', 
+                                                 headers={ 'Content-Range': 'bytes */4', 'Content-Length': '0' })
+    request.next_chunk.assert_called_once()
+    assert request.resumable_progress == offset
+    assert not state_fn.exists()
+
+
+@patch('cobra.google_drive._service')
+def test_upload_file_must_finish_if_saved_session_is_complete(service_mock, tmp_path):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    state_fn = tmp_path / 'upload.json'
+    save_upload_state(fn, state_fn)
+    request = make_upload_request([])
+    request.http.request.return_value = (httplib2.Response(dict(status='200')), b'{"id": "file-id"}')
+    service_mock.return_value.files.return_value.create.return_value = request
+    assert list(upload_file('key.json', str(fn), 'application/gzip', 'backup.tar.gz', 'folder', 
+                            chunksize=UPLOAD_CHUNK_SIZE, state_fn=str(state_fn))) == list()
+    request.next_chunk.assert_not_called()
+    request.postproc.assert_called_once()
+    assert not state_fn.exists()
+
+
+@patch('cobra.google_drive._service')
+def test_upload_file_must_start_over_if_saved_session_expired(service_mock, tmp_path):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    state_fn = tmp_path / 'upload.json'
+    save_upload_state(fn, state_fn)
+    expired = make_upload_request([])
+    expired.http.request.return_value = (httplib2.Response(dict(status='404')), b'')
+    fresh = make_upload_request([(None, dict(id='file-id'))])
+    service_mock.return_value.files.return_value.create.side_effect = [expired, fresh]
+    list(upload_file('key.json', str(fn), 'application/gzip', 'backup.tar.gz', 'folder', 
+                     chunksize=UPLOAD_CHUNK_SIZE, state_fn=str(state_fn)))
+    expired.next_chunk.assert_not_called()
+    fresh.next_chunk.assert_called_once()
+    assert fresh.resumable_uri == 'session-uri'
+
+
+@patch('cobra.google_drive._service')
+def test_upload_file_must_not_resume_session_of_changed_file(service_mock, tmp_path):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    state_fn = tmp_path / 'upload.json'
+    state_fn.write_text(json.dumps(dict(filename=str(fn), size=1, mtime=0, 
+                                        name='backup.tar.gz', folder_id='folder', uri='saved-uri')))
+    request = make_upload_request([(None, dict(id='file-id'))])
+    service_mock.return_value.files.return_value.create.return_value = request
+    list(upload_file('key.json', str(fn), 'application/gzip', 'backup.tar.gz', 'folder', 
+                     chunksize=UPLOAD_CHUNK_SIZE, state_fn=str(state_fn)))
+    assert request.resumable_uri == 'session-uri'
+
+
+def test_adaptive_media_must_keep_chunk_size_aligned_and_bounded(tmp_path):
+    fn = tmp_path / 'backup.tar.gz'
+    fn.write_bytes(b'data')
+    media = AdaptiveMediaFileUpload(str(fn), 'application/gzip')
+    media.adapt(0.1)
+    assert media.chunksize() == 2*UPLOAD_CHUNK_SIZE
+    for _ in range(10):
+        media.adapt(0.1)
+    assert media.chunksize() == MAX_UPLOAD_CHUNK_SIZE
+    for _ in range(10):
+        media.adapt(100)
+    assert media.chunksize() == MIN_UPLOAD_CHUNK_SIZE
+    media.adapt(3)
+    assert media.chunksize() % (256*1024) == 0
+
+
+@patch('cobra.google_drive.build_from_document')
+@patch('cobra.google_drive._CachedCredentials')
+def test_service_must_be_per_thread_and_share_credentials(credentials_mock, build_mock, tmp_path):
+    build_mock.side_effect = lambda *args, **kwargs: object()
+    key_fn = tmp_path / 'key.json'
+    key_fn.write_text('{}')
+    with patch('cobra.google_drive.TOKEN_CACHE_DIR', str(tmp_path / 'tokens')):
+        service = _service(str(key_fn))
+    assert _service(str(key_fn)) is service
+    other = list()
+    t = threading.Thread(target=lambda: other.append(_service(str(key_fn))))
+    t.start()
+    t.join()
+    assert other[0] is not service
+    credentials_mock.from_service_account_file.assert_called_once()
+    assert build_mock.call_args.args[0]['name'] == 'drive'
+
+
+def test_cached_credentials_must_save_token_and_load_it(tmp_path):
+    token_fn = str(tmp_path / 'tokens' / 'key.json')
+    expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def refresh(self, request):
+        self.token, self.expiry = 'access-token', expiry
+
+    credentials = _CachedCredentials(MagicMock(), 'cobra@example.com', 'https://token.uri', scopes=SCOPES)
+    credentials.token_fn = token_fn
+    with patch('google.oauth2.service_account.Credentials.refresh', refresh):
+        credentials.refresh(None)
+
+    assert os.stat(token_fn).st_mode & 0o777 == 0o600
+    credentials = _CachedCredentials(MagicMock(), 'cobra@example.com', 'https://token.uri', scopes=SCOPES)
+    credentials.token_fn = token_fn
+    credentials.load_token()
+    assert credentials.token == 'access-token'
+    assert credentials.expiry == expiry
+    assert credentials.valid
+
+
+def test_folder_query_must_filter_on_server_side():
+    q = folder_query("folder'id", exclude='daily', after=datetime(2023, 2, 4, 21, tzinfo=timezone.utc))
+    assert q == ("'folder\\'id' in parents and trashed = false and mimeType != 'application/vnd.google-apps.folder'"
+                 " and not name contains 'daily' and createdTime > '2023-02-04T21:00:00'")
+
+
+@patch('cobra.google_drive._service')
+def test_folder_list_must_request_only_latest_file(service_mock):
+    list_mock = service_mock.return_value.files.return_value.list
+    list_mock.return_value.execute.return_value = dict(files=[dict(id='2', name='b')], nextPageToken='token')
+    assert folder_list('key.json', 'folder', latest=True) == [dict(id='2', name='b')]
+    list_mock.assert_called_once()
+    assert list_mock.call_args.kwargs['orderBy'] == 'createdTime desc'
+    assert list_mock.call_args.kwargs['pageSize'] == 1
+
+
+
+@patch('cobra.google_drive._service')
+def test_delete_files_must_send_batches_and_report_failed(service_mock):
+    batches = list()
+    def new_batch_http_request(callback):
+        batch = MagicMock()
+        def execute():
+            for c in batch.add.call_args_list:
+                file_id = c.kwargs['request_id']
+                status = dict(missing=404, locked=403).get(file_id)
+                callback(file_id, None, HttpError(MagicMock(status=status), b'') if status else None)
+        batch.execute.side_effect = execute
+        batches.append(batch)
+        return batch
+
+    service_mock.return_value.new_batch_http_request.side_effect = new_batch_http_request
+    file_ids = [str(i) for i in range(DELETE_BATCH + 1)] + ['missing', 'locked']
+    with pytest.raises(CobraApiError, match=r'\[1\] of \[103\] files: locked'):
+        delete_files('key.json', file_ids)
+
+    assert [b.add.call_count for b in batches] == [DELETE_BATCH, 3]
+    delete_mock = service_mock.return_value.files.return_value.delete
+    assert delete_mock.call_count == len(file_ids)
+    delete_mock.return_value.execute.assert_not_called()
+
+@patch('cobra.google_drive._service')
+def test_folder_queries_must_quote_names(service_mock):
+    list_mock = service_mock.return_value.files.return_value.list
+    list_mock.return_value.execute.return_value = dict(files=[dict(id='folder-id', name="it's")])
+    assert ensure_folder('key.json', 'parent-id', "it's") == 'folder-id'
+    assert list_mock.call_args.kwargs['q'] == \
+        "'parent-id' in parents and name = 'it\\'s' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
+    assert names_list('key.json', "folder'id") == { "it's": 'folder-id' }
+    assert list_mock.call_args.kwargs['q'] == "'folder\\'id' in parents and trashed = false"
+
+
+def http_error(status, content=b'', **headers):
+    resp = MagicMock(status=status)
+    resp.get.side_effect = headers.get
+    return HttpError(resp, content)
+
+
+def test_transport_must_retry_throttled_and_transient_failures():
+    sleeps = list()
+    sut = TransportPolicy(sleep=sleeps.append)
+    fn = MagicMock(side_effect=[http_error(429), http_error(503), 
+                                http_error(403, b'{"error": {"errors": [{"reason": "userRateLimitExceeded"}]}}'),
+                                ConnectionResetError(), 'done'])
+    concurrency = AdaptiveConcurrency(8)
+    assert sut.call(fn, concurrency) == 'done'
+    assert fn.call_count == 5
+    # full jitter within the exponential bound
+    assert all(0 <= s <= 2**i for i, s in enumerate(sleeps))
+    assert concurrency.limit == 2
+    stats = sut.stats()
+    assert (stats['requests'], stats['retries'], stats['throttled'], stats['failed']) == (5, 4, 2, 0)
+    assert stats['waited'] == pytest.approx(sum(sleeps))
+
+
+def test_transport_must_not_retry_client_errors_and_give_up_after_max_retries():
+    sut = TransportPolicy(max_retries=2, sleep=lambda s: None)
+    fn = MagicMock(side_effect=http_error(403, b'{"error": {"errors": [{"reason": "insufficientPermissions"}]}}'))
+    with pytest.raises(HttpError):
+        sut.call(fn)
+    assert fn.call_count == 1
+
+    fn = MagicMock(side_effect=http_error(500))
+    with pytest.raises(HttpError):
+        sut.call(fn)
+    assert fn.call_count == 3
+    assert sut.stats()['failed'] == 2
+
+
+def test_transport_must_honor_retry_after():
+    sleeps = list()
+    sut = TransportPolicy(sleep=sleeps.append)
+    sut.call(MagicMock(side_effect=[http_error(429, **{ 'retry-after': '7' }), 'done']))
+    assert sleeps == [7]
+
+
+def test_token_bucket_must_let_burst_through_and_then_keep_rate():
+    now = [0.0]
+    sleeps = list()
+    sut = TokenBucket(rate=10, burst=2, clock=lambda: now[0], sleep=sleeps.append)
+    assert [sut.acquire() for _ in range(4)] == [0, 0, pytest.approx(0.1), pytest.approx(0.2)]
+    now[0] = 10.0
+    assert sut.acquire() == 0
+    assert sleeps == [pytest.approx(0.1), pytest.approx(0.2)]
+
+
+def test_adaptive_concurrency_must_halve_when_throttled_and_grow_back():
+    sut = AdaptiveConcurrency(8)
+    sut.throttled()
+    sut.throttled()
+    assert sut.limit == 2
+    for _ in range(2):
+        sut.succeeded()
+    assert sut.limit == 3
+    for _ in range(3 + 4 + 5 + 6 + 7):
+        sut.succeeded()
+    assert sut.limit == 8
+    for _ in range(4):
+        sut.throttled()
+    assert sut.limit == 1
+
+
+def test_adaptive_concurrency_must_limit_slots():
+    sut = AdaptiveConcurrency(2)
+    sut.throttled()
+    in_flight = list()
+    lock = threading.Lock()
+    def worker():
+        with sut.slot():
+            with lock:
+                in_flight.append(1)
+                assert len(in_flight) == 1
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+@patch('cobra.google_drive.TRANSPORT', TransportPolicy(sleep=lambda s: None))
+@patch('cobra.google_drive._service')
+def test_delete_files_must_resend_throttled_deletes(service_mock):
+    throttled = ['2', '3']
+    def new_batch_http_request(callback):
+        batch = MagicMock()
+        def execute():
+            for c in batch.add.call_args_list:
+                file_id = c.kwargs['request_id']
+                error = http_error(403, b'rateLimitExceeded') if file_id in throttled else None
+                callback(file_id, None, error)
+            throttled.clear()
+        batch.execute.side_effect = execute
+        return batch
+
+    service_mock.return_value.new_batch_http_request.side_effect = new_batch_http_request
+    delete_files('key.json', ['1', '2', '3'])
+    deleted = [c.kwargs['fileId'] for c in service_mock.return_value.files.return_value.delete.call_args_list]
+    assert deleted == ['1', '2', '3', '2', '3']
+
+
+def file_meta(id, created, **kwargs):
+    return dict(dict(id=id, name=f'backup{id}.tar.gz', createdTime=created), **kwargs)
+
+
+@patch('cobra.google_drive._service')
+def test_folder_catalog_must_list_once_and_apply_changes_then(service_mock, tmp_path):
+    catalog_fn = str(tmp_path / 'catalog.json')
+    service = service_mock.return_value
+    service.changes.return_value.getStartPageToken.return_value.execute.return_value = dict(startPageToken='1')
+    service.files.return_value.list.return_value.execute.return_value = dict(
+        files=[file_meta('1', '2023-01-01T00:00:00.000Z'), file_meta('2', '2023-01-02T00:00:00.000Z')])
+    catalog = FolderCatalog('key.json', 'folder', catalog_fn)
+    assert [f['id'] for f in catalog.files()] == ['1', '2']
+
+    service.changes.return_value.list.return_value.execute.side_effect = [
+        dict(nextPageToken='2', changes=[
+            dict(fileId='1', removed=True),
+            dict(fileId='3', file=file_meta('3', '2023-01-03T00:00:00.000Z', parents=['folder'])),
+        ]),
+        dict(newStartPageToken='3', changes=[
+            dict(fileId='4', file=file_meta('4', '2023-01-04T00:00:00.000Z', parents=['other'])),
+            dict(fileId='2', file=file_meta('2', '2023-01-02T00:00:00.000Z', parents=['folder'], trashed=True)),
+        ]),
+    ]
+    assert [f['id'] for f in FolderCatalog('key.json', 'folder', catalog_fn).files()] == ['3']
+    service.files.return_value.list.assert_called_once()
+    tokens = [c.kwargs['pageToken'] for c in service.changes.return_value.list.call_args_list]
+    assert tokens == ['1', '2']
+    with open(catalog_fn) as f:
+        assert json.load(f)['token'] == '3'
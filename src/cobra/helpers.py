@@ -0,0 +1,228 @@
+from cobra.exc import CobraApiError
+
+from os.path import dirname, basename, join, exists, realpath
+from contextlib import contextmanager
+import docker
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+# the helper image is pinned so the tar and cp the helpers run behave the same on every host
+HELPER_IMAGE = 'busybox:1.36'
+# the label the warm helpers are found by, its value is the signature of the image and the mounts
+HELPER_LABEL = 'cobra.helper'
+# the directory the warm helpers mount the volumes under, it doesn't depend on the backup name so they are reused
+HELPER_MOUNT_DIR = '/cobra'
+# keeps the warm helper running doing nothing
+IDLE_COMMAND = ['sleep', '2147483647']
+
+
+def signature(image, volume_opts, limits=None):
+    '''
+    Returns the label value telling the helpers with the same image, the same mounts and the same limits.
+    '''
+    data = json.dumps([image, sorted(volume_opts.items())] + ([sorted(limits.items())] if limits else []), 
+                      sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def block_device(path):
+    '''
+    Returns the block device the path is stored on the way the cgroup throttling takes it, 
+    that is the whole disk rather than its partition, or None if it's not known e.g. for tmpfs or nfs.
+    '''
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return None
+
+    sys_dir = realpath(f'/sys/dev/block/{os.major(dev)}:{os.minor(dev)}')
+    if exists(join(sys_dir, 'partition')):
+        sys_dir = dirname(sys_dir)
+    try:
+        with open(join(sys_dir, 'dev')) as f:
+            return f'/dev/block/{f.read().strip()}'
+    except OSError:
+        return None
+
+
+def container_limits(cpu_quota=None, io_weight=None, read_rate=None, devices=None):
+    '''
+    Returns the container options limiting the helper by its cgroup.
+
+    @param cpu_quota The number of CPUs the helper may use at most, e.g. 0.5
+    @param io_weight The block IO weight from 10 to 1000 relative to the other containers and processes (500 by default)
+    @param read_rate The bytes per second the helper may read from every one of the devices
+    @param devices The block devices the read rate applies to
+    '''
+    limits = dict()
+    if cpu_quota:
+        limits['nano_cpus'] = int(cpu_quota * 1e9)
+    if io_weight:
+        limits['blkio_weight'] = io_weight
+    if read_rate and devices:
+        limits['device_read_bps'] = [dict(Path=device, Rate=int(read_rate)) for device in devices]
+    return limits
+
+
+class HelperPool:
+    '''
+    Runs the helper containers the volumes are read and written by. The image is pulled once before
+    the first helper is needed. The one-shot helpers are removed right after the operation, the warm ones
+    are kept running and reused by the next operations with the same mounts, so the frequent backups
+    don't pay the container creation, start and removal every time. The commands are run in the warm helpers
+    by exec, their output is streamed and the exit code is checked.
+    '''
+    def __init__(self, gateway, image=HELPER_IMAGE):
+        '''
+        @param gateway The DockerClient instance
+        @param image The helper image
+        '''
+        self.__docker = gateway
+        self.__image = image
+        self.__pulled = False
+        self.__limits = dict()
+        self.__lock = threading.Lock()
+        self.__logger = logging.getLogger(__name__)
+
+
+    @property
+    def image(self):
+        return self.__image
+
+
+    @contextmanager
+    def limited(self, limits):
+        '''
+        Makes the helpers started meanwhile be limited by the container options given, see container_limits.
+        The warm helpers are told by their limits too, so the ones started with other limits aren't reused.
+        '''
+        saved = self.__limits
+        self.__limits = dict(limits) if limits else dict()
+        try:
+            yield
+        finally:
+            self.__limits = saved
+
+
+    def pull(self):
+        '''
+        Pulls the helper image unless it's there already.
+        '''
+        with self.__lock:
+            if self.__pulled:
+                return
+
+            try:
+                self.__docker.images.get(self.__image)
+            except docker.errors.ImageNotFound:
+                self.__logger.info(f'Pulling helper image [{self.__image}]')
+                self.__docker.images.pull(self.__image)
+            self.__pulled = True
+
+
+    def create(self, volume_opts):
+        '''
+        Creates the one-shot helper not started, it's enough to get and put the archives.
+        '''
+        self.pull()
+        return self.__docker.containers.create(self.__image, volumes=volume_opts, **self.__limits)
+
+
+    @contextmanager
+    def acquire(self, volume_opts, warm=False):
+        '''
+        Gives the helper having the volumes mounted. The one-shot helper is removed on exit,
+        the warm one is started if needed and left running.
+        '''
+        if not warm:
+            container = self.create(volume_opts)
+            try:
+                yield container
+            finally:
+                container.remove(force=True)
+            return
+
+        yield self.__warm(volume_opts)
+
+
+    def __warm(self, volume_opts):
+        label = f'{HELPER_LABEL}={signature(self.__image, volume_opts, self.__limits)}'
+        for container in self.__docker.containers.list(all=True, filters=dict(label=label)):
+            if container.status != 'running':
+                container.start()
+            return container
+
+        self.pull()
+        container = self.__docker.containers.create(
+            self.__image, command=IDLE_COMMAND, volumes=volume_opts, 
+            labels={ HELPER_LABEL: signature(self.__image, volume_opts, self.__limits) }, **self.__limits)
+        container.start()
+        self.__logger.info(f'Started warm helper [{container.name}]')
+        return container
+
+
+    def run(self, volume_opts, command, warm=False):
+        '''
+        Runs the command in the helper having the volumes mounted and returns its output.
+        '''
+        if not warm:
+            self.pull()
+            return self.__docker.containers.run(self.__image, remove=True, volumes=volume_opts, command=command, 
+                                                **self.__limits)
+
+        with self.acquire(volume_opts, warm=True) as container:
+            return b''.join(self.exec_stream(container, command))
+
+
+    def exec_stream(self, container, command):
+        '''
+        Runs the command in the running helper yielding its output as it comes.
+        Raises CobraApiError with the command stderr if it exits with non-zero code.
+        '''
+        api = container.client.api
+        exec_id = api.exec_create(container.id, command, stdout=True, stderr=True)['Id']
+        stderr = list()
+        for out, err in api.exec_start(exec_id, stream=True, demux=True):
+            if err:
+                stderr.append(err)
+            if out:
+                yield out
+
+        exit_code = api.exec_inspect(exec_id)['ExitCode']
+        if exit_code:
+            message = b''.join(stderr).decode('utf-8', errors='replace').strip()
+            raise CobraApiError(f'Helper command {command} failed with exit code [{exit_code}]: {message}')
+
+
+    def archive(self, container, path, warm=False):
+        '''
+        Returns the tar stream chunks of the path in the helper, the members start with the path basename.
+        The warm helper is running so tar is run by exec, the one-shot one is read by the docker archive api.
+        '''
+        if warm:
+            return self.exec_stream(container, ['tar', '-c', '-f', '-', '-C', dirname(path), basename(path)])
+
+        bits, _ = container.get_archive(path)
+        return bits
+
+
+    def helpers(self):
+        '''
+        Returns the list of the warm helpers.
+        '''
+        return self.__docker.containers.list(all=True, filters=dict(label=HELPER_LABEL))
+
+
+    def prune(self):
+        '''
+        Removes all the warm helpers and returns their names.
+        '''
+        names = list()
+        for container in self.helpers():
+            container.remove(force=True)
+            names.append(container.name)
+        return names
@@ -0,0 +1,133 @@
+from cobra.helpers import HelperPool, HELPER_IMAGE, HELPER_LABEL, IDLE_COMMAND, signature, container_limits
+from cobra.exc import CobraApiError
+
+import pytest
+import docker
+from docker import DockerClient
+from unittest.mock import create_autospec, MagicMock
+
+
+VOLUME_OPTS = { 'volume1': dict(bind='/cobra/volume1', mode='ro') }
+
+
+@pytest.fixture
+def docker_client_mock():
+    mock = create_autospec(DockerClient, spec_set=True, instance=True)
+    mock.containers.list.return_value = list()
+    return mock
+
+
+@pytest.fixture
+def sut(docker_client_mock):
+    return HelperPool(docker_client_mock)
+
+
+def make_exec_container(chunks, exit_code=0):
+    container = MagicMock()
+    container.client.api.exec_create.return_value = dict(Id='exec-id')
+    container.client.api.exec_start.return_value = iter(chunks)
+    container.client.api.exec_inspect.return_value = dict(ExitCode=exit_code)
+    return container
+
+
+def test_image_must_be_pulled_once(sut, docker_client_mock):
+    docker_client_mock.images.get.side_effect = docker.errors.ImageNotFound('not found')
+    sut.create(VOLUME_OPTS)
+    sut.run(VOLUME_OPTS, ['true'])
+    docker_client_mock.images.pull.assert_called_once_with(HELPER_IMAGE)
+    docker_client_mock.containers.create.assert_called_once_with(HELPER_IMAGE, volumes=VOLUME_OPTS)
+    docker_client_mock.containers.run.assert_called_once_with(HELPER_IMAGE, remove=True, volumes=VOLUME_OPTS,
+                                                              command=['true'])
+
+
+def test_one_shot_helper_must_be_removed(sut, docker_client_mock):
+    with sut.acquire(VOLUME_OPTS) as container:
+        assert container is docker_client_mock.containers.create.return_value
+
+    container.remove.assert_called_once_with(force=True)
+
+
+def test_warm_helper_must_be_created_once_and_left_running(sut, docker_client_mock):
+    with sut.acquire(VOLUME_OPTS, warm=True) as container:
+        pass
+
+    docker_client_mock.containers.create.assert_called_once_with(
+        HELPER_IMAGE, command=IDLE_COMMAND, volumes=VOLUME_OPTS,
+        labels={ HELPER_LABEL: signature(HELPER_IMAGE, VOLUME_OPTS) })
+    container.start.assert_called_once()
+    container.remove.assert_not_called()
+
+    stopped = MagicMock(status='exited')
+    docker_client_mock.containers.list.return_value = [stopped]
+    with sut.acquire(VOLUME_OPTS, warm=True) as container:
+        assert container is stopped
+
+    docker_client_mock.containers.list.assert_called_with(
+        all=True, filters=dict(label=f'{HELPER_LABEL}={signature(HELPER_IMAGE, VOLUME_OPTS)}'))
+    assert docker_client_mock.containers.create.call_count == 1
+    stopped.start.assert_called_once()
+
+
+def test_signature_must_tell_mounts_apart():
+    assert signature(HELPER_IMAGE, VOLUME_OPTS) == signature(HELPER_IMAGE, dict(VOLUME_OPTS))
+    assert signature(HELPER_IMAGE, VOLUME_OPTS) != signature(HELPER_IMAGE, { 'volume1': dict(bind='/cobra/volume1', mode='rw') })
+    assert signature(HELPER_IMAGE, VOLUME_OPTS) != signature('busybox:latest', VOLUME_OPTS)
+
+
+def test_exec_stream_must_yield_stdout_and_raise_on_failure(sut):
+    container = make_exec_container([(b'out1', None), (None, b'warning'), (b'out2', None)])
+    assert list(sut.exec_stream(container, ['tar', '-c'])) == [b'out1', b'out2']
+    container.client.api.exec_start.assert_called_with('exec-id', stream=True, demux=True)
+
+    container = make_exec_container([(b'partial', b'tar: no such file')], exit_code=1)
+    with pytest.raises(CobraApiError, match='no such file'):
+        list(sut.exec_stream(container, ['tar', '-c']))
+
+
+def test_warm_run_must_exec_in_running_helper(sut, docker_client_mock):
+    container = make_exec_container([(b'copied', None)])
+    container.status = 'running'
+    docker_client_mock.containers.list.return_value = [container]
+    assert sut.run(VOLUME_OPTS, ['cp', '-rf', '/backup/x', '/cobra'], warm=True) == b'copied'
+    container.client.api.exec_create.assert_called_with(container.id, ['cp', '-rf', '/backup/x', '/cobra'],
+                                                        stdout=True, stderr=True)
+    docker_client_mock.containers.run.assert_not_called()
+    container.remove.assert_not_called()
+
+
+def test_prune_must_remove_warm_helpers(sut, docker_client_mock):
+    helpers = [MagicMock(), MagicMock()]
+    helpers[0].name, helpers[1].name = 'helper1', 'helper2'
+    docker_client_mock.containers.list.return_value = helpers
+    assert sut.prune() == ['helper1', 'helper2']
+    docker_client_mock.containers.list.assert_called_with(all=True, filters=dict(label=HELPER_LABEL))
+    for helper in helpers:
+        helper.remove.assert_called_once_with(force=True)
+
+
+def test_container_limits_must_map_to_cgroup_options():
+    assert container_limits() == dict()
+    assert container_limits(cpu_quota=1.5, io_weight=200, read_rate=1024, devices=['/dev/block/8:0']) == \
+        dict(nano_cpus=1500000000, blkio_weight=200, device_read_bps=[dict(Path='/dev/block/8:0', Rate=1024)])
+    assert container_limits(read_rate=1024) == dict()
+
+
+def test_helpers_must_be_limited_within_limited_block(sut, docker_client_mock):
+    limits = container_limits(cpu_quota=0.5, io_weight=100)
+    with sut.limited(limits):
+        sut.run(VOLUME_OPTS, ['true'])
+        with sut.acquire(VOLUME_OPTS, warm=True):
+            pass
+
+    docker_client_mock.containers.run.assert_called_once_with(HELPER_IMAGE, remove=True, volumes=VOLUME_OPTS,
+                                                              command=['true'], **limits)
+    # the warm helper started without limits isn't reused
+    docker_client_mock.containers.list.assert_called_with(
+        all=True, filters=dict(label=f'{HELPER_LABEL}={signature(HELPER_IMAGE, VOLUME_OPTS, limits)}'))
+    assert signature(HELPER_IMAGE, VOLUME_OPTS, limits) != signature(HELPER_IMAGE, VOLUME_OPTS)
+    docker_client_mock.containers.create.assert_called_once_with(
+        HELPER_IMAGE, command=IDLE_COMMAND, volumes=VOLUME_OPTS,
+        labels={ HELPER_LABEL: signature(HELPER_IMAGE, VOLUME_OPTS, limits) }, **limits)
+
+    sut.create(VOLUME_OPTS)
+    docker_client_mock.containers.create.assert_called_with(HELPER_IMAGE, volumes=VOLUME_OPTS)
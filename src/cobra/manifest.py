@@ -0,0 +1,185 @@
+from cobra.archive import add_bytes
+from cobra.stream import IterReader
+
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+from os.path import join, dirname, isdir, islink, lexists
+
+
+MANIFEST_FN = '...manifest'
+COPY_BUFSIZE = 1024*1024
+
+
+class _HashingReader:
+    def __init__(self, fileobj, digest):
+        self.__fileobj = fileobj
+        self.__digest = digest
+
+
+    def read(self, size=-1):
+        data = self.__fileobj.read(size)
+        self.__digest.update(data)
+        return data
+
+
+def _type(info):
+    if info.isreg():
+        return 'file'
+    if info.isdir():
+        return 'dir'
+    if info.issym():
+        return 'symlink'
+    if info.islnk():
+        return 'link'
+    return 'other'
+
+
+def _key(name, strip):
+    name = name.rstrip('/')
+    if not strip:
+        return name
+
+    _, _, key = name.partition('/')
+    return key
+
+
+def _rerooted(name, root):
+    _, sep, rest = name.partition('/')
+    return f'{root}{sep}{rest}'
+
+
+def entry(info, digest=None, strip=False):
+    '''
+    Returns manifest entry of the tar member. The hash is of the file content.
+    '''
+    rv = dict(type=_type(info), size=info.size, mtime=int(info.mtime), mode=info.mode)
+    if info.issym():
+        rv['linkname'] = info.linkname
+    elif info.islnk():
+        rv['linkname'] = _key(info.linkname, strip)
+
+    if digest is not None:
+        rv['hash'] = digest
+
+    return rv
+
+
+def unchanged(current, base):
+    if base is None:
+        return False
+
+    keys = ('type', 'size', 'mtime', 'mode', 'linkname')
+    return all(current.get(k) == base.get(k) for k in keys)
+
+
+def scan(chunks, fileobj, files, base=None, strip=False, manifest_name=None, offsets=None, root=None):
+    '''
+    Copies tar stream from chunks to fileobj recording every member into the files dict.
+    If base files dict is given regular files with the same type, size, mtime and mode are not copied,
+    the entries are carried over from the base instead. Directories are always copied.
+
+    @param chunks The tar stream byte chunks
+    @param fileobj The file-like object to write the resulting tar to
+    @param files The dict to put manifest entries to
+    @param base The base manifest files dict for incremental backup or None
+    @param strip Whether to strip the first path component to get the manifest key
+    @param manifest_name If given the manifest is appended as the last member with this name
+    @param offsets If given the [start, end) offsets of every member in the resulting tar are put into it
+    @param root If given the first path component of every member and hard link target is replaced by it
+    '''
+    base = base if base is not None else dict()
+    skipped = set()
+    with tarfile.open(fileobj=IterReader(chunks), mode='r|') as tin, \
+         tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.GNU_FORMAT, bufsize=COPY_BUFSIZE) as tout:
+        for info in tin:
+            if root:
+                info.name = _rerooted(info.name, root)
+                if info.islnk():
+                    info.linkname = _rerooted(info.linkname, root)
+
+            key = _key(info.name, strip)
+            current = entry(info, strip=strip)
+            base_entry = base.get(key)
+            if info.isreg() and unchanged(current, base_entry):
+                files[key] = base_entry
+                skipped.add(key)
+                continue
+
+            if info.islnk() and current['linkname'] in skipped:
+                # the link target isn't in the archive, the link is restored from the manifest
+                files[key] = current
+                continue
+
+            start = tout.offset
+            if info.isreg():
+                digest = hashlib.sha256()
+                tout.addfile(info, _HashingReader(tin.extractfile(info), digest))
+                current['hash'] = digest.hexdigest()
+            else:
+                tout.addfile(info)
+
+            if key:
+                files[key] = current
+                if offsets is not None:
+                    offsets[key] = [start, tout.offset]
+
+        if manifest_name:
+            add_bytes(tout, manifest_name, dumps(files, deleted(files, base)))
+
+
+def deleted(files, base):
+    return sorted(set(base) - set(files)) if base else list()
+
+
+def dumps(files, deleted=list()):
+    return json.dumps(dict(files=files, deleted=deleted)).encode('utf-8')
+
+
+def loads(data):
+    return json.loads(data)
+
+
+def load(fn):
+    with open(fn, 'rb') as f:
+        return loads(f.read())
+
+
+def save(fn, manifest):
+    os.makedirs(dirname(fn), exist_ok=True)
+    with open(fn, 'w') as f:
+        json.dump(manifest, f)
+
+
+def merge(delta_dir, base_dir, manifest):
+    '''
+    Applies the incremental backup extracted to delta_dir onto the full state in base_dir.
+    The files from delta_dir are moved, the deleted ones are removed,
+    the hard links to not archived files are recreated.
+    '''
+    for key in manifest.get('deleted', list()):
+        path = join(base_dir, key)
+        if isdir(path) and not islink(path):
+            shutil.rmtree(path)
+        elif lexists(path):
+            os.remove(path)
+
+    for dirpath, dirnames, filenames in os.walk(delta_dir):
+        rel = os.path.relpath(dirpath, delta_dir)
+        target_dir = os.path.normpath(join(base_dir, rel))
+        os.makedirs(target_dir, exist_ok=True)
+        for fn in filenames + [d for d in dirnames if islink(join(dirpath, d))]:
+            target = join(target_dir, fn)
+            if isdir(target) and not islink(target):
+                shutil.rmtree(target)
+            os.replace(join(dirpath, fn), target)
+
+    for key, e in manifest.get('files', dict()).items():
+        path = join(base_dir, key)
+        target = join(base_dir, e.get('linkname', ''))
+        # the target is missing if not selected on restore
+        if e['type'] == 'link' and not lexists(path) and lexists(target):
+            os.makedirs(dirname(path), exist_ok=True)
+            os.link(target, path)
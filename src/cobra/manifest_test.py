@@ -0,0 +1,94 @@
+from cobra.manifest import scan, merge, MANIFEST_FN
+
+import pytest
+
+import io
+import json
+import os
+import tarfile
+
+
+def make_tar(members):
+    f = io.BytesIO()
+    with tarfile.open(fileobj=f, mode='w', format=tarfile.GNU_FORMAT) as tar:
+        for info, data in members:
+            info.mtime = 1000000000
+            tar.addfile(info, io.BytesIO(data) if data is not None else None)
+
+    return f.getvalue()
+
+
+def file_info(name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    return info
+
+
+def link_info(name, target):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.LNKTYPE
+    info.linkname = target
+    return info
+
+
+def scan_to_tar(data, files, base=None, **kwargs):
+    out = io.BytesIO()
+    scan([data], out, files, base, **kwargs)
+    out.seek(0)
+    return tarfile.open(fileobj=out)
+
+
+def test_scan_must_strip_root_and_append_manifest():
+    data = make_tar([(file_info('root/volume1/file', 4), b'data')])
+    files = dict()
+    with scan_to_tar(data, files, strip=True, manifest_name=f'root/{MANIFEST_FN}') as tar:
+        assert tar.getnames() == ['root/volume1/file', f'root/{MANIFEST_FN}']
+        manifest = json.load(tar.extractfile(f'root/{MANIFEST_FN}'))
+
+    assert list(files) == ['volume1/file']
+    assert manifest == dict(files=files, deleted=[])
+
+
+def test_scan_must_replace_root_of_members_and_link_targets():
+    data = make_tar([(file_info('cobra/volume1/file', 4), b'data'), (link_info('cobra/volume1/link', 'cobra/volume1/file'), None)])
+    files = dict()
+    with scan_to_tar(data, files, strip=True, root='backup@1') as tar:
+        assert tar.getnames() == ['backup@1/volume1/file', 'backup@1/volume1/link']
+        assert tar.getmember('backup@1/volume1/link').linkname == 'backup@1/volume1/file'
+
+    assert files['volume1/link']['linkname'] == 'volume1/file'
+
+
+def test_scan_must_skip_unchanged_files_and_links_to_them():
+    data = make_tar([(file_info('volume1/same', 4), b'same'), (link_info('volume1/link', 'volume1/same'), None)])
+    base = dict()
+    scan_to_tar(data, base)
+
+    data = make_tar([(file_info('volume1/same', 4), b'same'), (link_info('volume1/link', 'volume1/same'), None),
+                     (file_info('volume1/new', 3), b'new')])
+    files = dict()
+    with scan_to_tar(data, files, base | { 'volume1/gone': base['volume1/same'] }, 
+                     manifest_name=MANIFEST_FN) as tar:
+        assert tar.getnames() == ['volume1/new', MANIFEST_FN]
+        manifest = json.load(tar.extractfile(MANIFEST_FN))
+
+    assert files['volume1/same'] == base['volume1/same']
+    assert files['volume1/link']['type'] == 'link'
+    assert manifest['deleted'] == ['volume1/gone']
+
+
+def test_merge_must_overlay_delta_delete_and_relink(tmp_path):
+    base_dir, delta_dir = tmp_path / 'base', tmp_path / 'delta'
+    (base_dir / 'volume1').mkdir(parents=True)
+    (delta_dir / 'volume1').mkdir(parents=True)
+    (base_dir / 'volume1' / 'same').write_text('same')
+    (base_dir / 'volume1' / 'changed').write_text('old')
+    (base_dir / 'volume1' / 'gone').write_text('gone')
+    (delta_dir / 'volume1' / 'changed').write_text('new')
+    manifest = dict(files={ 'volume1/link': dict(type='link', linkname='volume1/same') }, deleted=['volume1/gone'])
+
+    merge(str(delta_dir), str(base_dir), manifest)
+
+    assert sorted(os.listdir(base_dir / 'volume1')) == ['changed', 'link', 'same']
+    assert (base_dir / 'volume1' / 'changed').read_text() == 'new'
+    assert os.stat(base_dir / 'volume1' / 'link').st_ino == os.stat(base_dir / 'volume1' / 'same').st_ino
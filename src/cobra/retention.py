@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+import re
+
+
+# the backup file name is BASENAME@YYYYmmdd.HHMMSS followed by the extension
+_NAME_RE = re.compile(r'^(?P<series>.+)@(?P<time>\d{8}\.\d{6})')
+
+# the periods the backups are kept for by grandfather-father-son rotation
+_PERIODS = (
+    ('keep_daily', lambda t: t.date()),
+    ('keep_weekly', lambda t: t.isocalendar()[:2]),
+    ('keep_monthly', lambda t: (t.year, t.month)),
+)
+
+
+def parse_name(name):
+    '''
+    Returns the series (the basename) and the build time of the backup by its file name
+    or None if the file is not the backup.
+    '''
+    m = _NAME_RE.match(name)
+    if m is None:
+        return None
+
+    return m.group('series'), datetime.strptime(m.group('time'), '%Y%m%d.%H%M%S').replace(tzinfo=timezone.utc)
+
+
+class Policy:
+    '''
+    The retention policy. The backups of every series are kept by grandfather-father-son rotation:
+    the latest ones, the latest one of each of the last days, weeks and months having backups.
+    The base backups of the incremental ones kept are kept too. Then the oldest backups are removed
+    until all of them fit the total size but the latest one.
+    '''
+    def __init__(self, keep_last=None, keep_daily=None, keep_weekly=None, keep_monthly=None, max_total_size=None):
+        '''
+        @param max_total_size The size in bytes all the backups kept are to fit
+        '''
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.keep_weekly = keep_weekly
+        self.keep_monthly = keep_monthly
+        self.max_total_size = max_total_size
+
+
+    def __bool__(self):
+        return any(v is not None for v in (self.keep_last, self.keep_daily, self.keep_weekly, self.keep_monthly,
+                                           self.max_total_size))
+
+
+    def __rotated(self):
+        return any(v is not None for v in (self.keep_last, self.keep_daily, self.keep_weekly, self.keep_monthly))
+
+
+    def plan(self, backups, bases=None):
+        '''
+        Splits the backups into the ones to keep and the ones to remove. The files that are not the backups
+        are never removed. Both lists are ordered by the build time.
+
+        @param backups The list of dicts with name and size keys at least
+        @param bases The dict of the incremental backup names to their base backup names
+        '''
+        bases = bases if bases else dict()
+        series = dict()
+        times = dict()
+        for b in backups:
+            parsed = parse_name(b['name'])
+            if parsed is not None:
+                series.setdefault(parsed[0], list()).append(b)
+                times[b['name']] = parsed[1]
+
+        keep = { b['name'] for b in backups if b['name'] not in times }
+        for group in series.values():
+            group.sort(key=lambda b: times[b['name']], reverse=True)
+            if not self.__rotated():
+                keep.update(b['name'] for b in group)
+                continue
+
+            keep.update(b['name'] for b in group[:self.keep_last or 0])
+            for attr, period in _PERIODS:
+                count = getattr(self, attr)
+                seen = list()
+                for b in group:
+                    key = period(times[b['name']])
+                    if key in seen:
+                        continue
+                    if len(seen) >= (count or 0):
+                        break
+                    seen.append(key)
+                    keep.add(b['name'])
+
+        names = { b['name'] for b in backups }
+        pending = list(keep)
+        while pending:
+            base = bases.get(pending.pop())
+            if base in names and base not in keep:
+                keep.add(base)
+                pending.append(base)
+
+        if self.max_total_size is not None:
+            kept = sorted((b for b in backups if b['name'] in keep and b['name'] in times),
+                          key=lambda b: times[b['name']])
+            total = sum(int(b['size']) for b in backups if b['name'] in keep)
+            # the base is reconsidered once its last kept incremental backup is removed, the latest one is kept anyway
+            removed = True
+            while removed and total > self.max_total_size:
+                removed = False
+                for b in kept[:-1]:
+                    if total <= self.max_total_size:
+                        break
+                    if b['name'] not in keep or any(bases.get(name) == b['name'] for name in keep):
+                        continue
+                    keep.discard(b['name'])
+                    total -= int(b['size'])
+                    removed = True
+
+        def order(b):
+            return times.get(b['name'], datetime.min.replace(tzinfo=timezone.utc))
+
+        return (sorted((b for b in backups if b['name'] in keep), key=order),
+                sorted((b for b in backups if b['name'] not in keep), key=order))
@@ -0,0 +1,72 @@
+from cobra.retention import Policy, parse_name
+
+from datetime import datetime, timedelta, timezone
+
+
+def backups(*times, basename='backup', size=10):
+    return [dict(name=f'{basename}@{t:%Y%m%d.%H%M%S}.tar.gz', size=size) for t in times]
+
+
+def names(files):
+    return [f['name'] for f in files]
+
+
+def test_parse_name_must_tell_series_and_time():
+    assert parse_name('daily@20230204.211624.tar.zst') == ('daily', datetime(2023, 2, 4, 21, 16, 24, tzinfo=timezone.utc))
+    assert parse_name('notes.txt') is None
+
+
+def test_policy_must_keep_latest_backup_of_each_period():
+    start = datetime(2023, 1, 1, 3, tzinfo=timezone.utc)
+    # two backups a day for 60 days
+    files = backups(*(start + timedelta(hours=12*i) for i in range(120)))
+    keep, remove = Policy(keep_daily=3, keep_weekly=2, keep_monthly=3).plan(files)
+    assert names(keep) == names(backups(
+        datetime(2023, 1, 31, 15, tzinfo=timezone.utc),  # the latest of January
+        datetime(2023, 2, 26, 15, tzinfo=timezone.utc),  # the latest of the previous week
+        datetime(2023, 2, 27, 15, tzinfo=timezone.utc),
+        datetime(2023, 2, 28, 15, tzinfo=timezone.utc),
+        datetime(2023, 3, 1, 15, tzinfo=timezone.utc)))
+    assert len(keep) + len(remove) == len(files)
+
+
+def test_policy_must_apply_to_every_series_and_leave_other_files():
+    start = datetime(2023, 2, 1, tzinfo=timezone.utc)
+    files = backups(start, start + timedelta(days=1)) + backups(start, start + timedelta(days=1), basename='daily') + \
+        [dict(name='notes.txt', size=1)]
+    keep, remove = Policy(keep_last=1).plan(files)
+    assert names(keep) == ['notes.txt', 'backup@20230202.000000.tar.gz', 'daily@20230202.000000.tar.gz']
+    assert names(remove) == ['backup@20230201.000000.tar.gz', 'daily@20230201.000000.tar.gz']
+
+
+def test_policy_must_keep_bases_of_incremental_backups():
+    start = datetime(2023, 2, 1, tzinfo=timezone.utc)
+    full, inc1, inc2 = names(backups(start, start + timedelta(days=1), start + timedelta(days=2)))
+    files = backups(start, start + timedelta(days=1), start + timedelta(days=2))
+    keep, remove = Policy(keep_last=1).plan(files, bases={ inc2: inc1, inc1: full })
+    assert names(keep) == [full, inc1, inc2]
+    assert remove == list()
+
+
+def test_policy_must_remove_oldest_backups_beyond_total_size():
+    start = datetime(2023, 2, 1, tzinfo=timezone.utc)
+    files = backups(*(start + timedelta(days=i) for i in range(5)), size=100)
+    keep, remove = Policy(max_total_size=250).plan(files)
+    assert names(keep) == names(files[3:])
+    # the latest one is kept even if it doesn't fit
+    keep, _ = Policy(keep_last=3, max_total_size=50).plan(files)
+    assert names(keep) == names(files[4:])
+
+
+def test_policy_must_reconsider_base_once_its_incremental_is_removed():
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    full, inc, latest = backups(start, start + timedelta(days=1), start + timedelta(days=2), size=100)
+    inc['size'] = 10
+    keep, remove = Policy(max_total_size=150).plan([full, inc, latest], bases={ inc['name']: full['name'] })
+    assert names(keep) == [latest['name']]
+    assert names(remove) == [full['name'], inc['name']]
+
+
+def test_empty_policy_must_be_false():
+    assert not Policy()
+    assert Policy(max_total_size=0)
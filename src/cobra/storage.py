@@ -0,0 +1,744 @@
+from cobra.exc import CobraApiError, CobraCliError
+import cobra.google_drive
+from cobra.google_drive import cache_valid, saved_md5, save_checksum
+from cobra.stream import RangedFile, chunks_of, rechunk, hashing
+from cobra.aux_stuff import rand_str
+
+from os.path import join, abspath, realpath, dirname, basename, exists, isdir, isfile
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from itertools import chain
+import hashlib
+import os
+
+
+DRIVE = 'drive'
+# at most this many objects are deleted by a single S3 request
+S3_DELETE_BATCH = 1000
+# the object larger than this is copied by parts
+S3_MAX_COPY_SIZE = 5*1024**3
+
+
+def is_drive(storage):
+    return not storage or storage == DRIVE
+
+
+def open_storage(storage=None, creds=None, folder_id=None, endpoint_url=None):
+    '''
+    Returns the storage by the --storage option value. It's either drive, the directory path or file:// url,
+    or s3://bucket/prefix url. The folder id is the sub folder of the directory and the bucket prefix.
+
+    @param endpoint_url The url of the S3 compatible service e.g. MinIO
+    '''
+    if is_drive(storage):
+        return DriveStorage(creds, folder_id)
+
+    url = urlparse(storage)
+    if url.scheme == 's3':
+        if not url.netloc:
+            raise CobraCliError(f'Bucket must be specified [{storage}], expected s3://bucket/prefix')
+        return S3Storage(url.netloc, _joined(url.path.strip('/'), folder_id), endpoint_url)
+
+    if url.scheme in ('', 'file'):
+        return LocalStorage(url.path, folder_id)
+
+    raise CobraCliError(f'Unsupported storage [{storage}], expected drive, directory path, file:// or s3:// url')
+
+
+def destinations(storage=None, folder_id=None):
+    '''
+    Returns the (storage, folder id) pairs the backups are pushed to. The storages and the folder ids are either
+    single values or the lists given by the repeated options. The lists of the same length are paired in order,
+    the single storage is paired with every folder id and vice versa.
+    '''
+    storages = list(storage) if isinstance(storage, (list, tuple)) else [storage]
+    folders = list(folder_id) if isinstance(folder_id, (list, tuple)) else [folder_id]
+    if len(storages) == len(folders):
+        return list(zip(storages, folders))
+    if len(storages) == 1:
+        return [(storages[0], folder) for folder in folders]
+    if len(folders) == 1:
+        return [(storage, folders[0]) for storage in storages]
+
+    raise CobraCliError(f'Can\'t pair [{len(storages)}] storages with [{len(folders)}] folder ids, '
+                        'give either one of them or the same number of both')
+
+
+def _joined(folder, name):
+    return f'{folder}/{name}' if folder and name else folder or name or ''
+
+
+def _created_time(dt):
+    '''
+    Returns the time in the format Drive gives createdTime in.
+    '''
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def select(files, exclude=None, after=None, before=None, latest=False, name=None):
+    '''
+    Filters the listed files the way Drive filters them on the server side and orders them by creation time.
+    See cobra.google_drive.folder_query for the parameters.
+    '''
+    def created(f):
+        return datetime.fromisoformat(f['createdTime'].replace('Z', '+00:00'))
+
+    files = [f for f in files if (not exclude or exclude not in f['name']) and (not name or f['name'] == name)
+             and (after is None or created(f) > after.astimezone(timezone.utc))
+             and (before is None or created(f) < before.astimezone(timezone.utc))]
+    files.sort(key=lambda f: f['createdTime'])
+    return files[-1:] if latest else files
+
+
+class TransferStatus:
+    '''
+    The transfer progress reported the same way as the Drive media upload and download statuses do.
+    '''
+    def __init__(self, done, total=None):
+        self.resumable_progress = done
+        self.total_size = total
+
+
+    def progress(self):
+        return self.resumable_progress / self.total_size if self.total_size else 0.0
+
+
+class Storage:
+    '''
+    The storage the backups are pushed to and pulled from. The files and the folders are referred by the ids
+    the storage gives them, the folder attribute is the id of the folder the backups reside in.
+    The files are listed as dicts with id, name, size, createdTime and, if known, md5Checksum keys
+    the way Drive lists them, so the rest of the code doesn't tell one storage from another.
+    '''
+    name = None
+    # the size of the parts the files are transferred by and how many of them are transferred at a time
+    part_size = 8*1024*1024
+    concurrency = 4
+
+    def __init__(self, folder):
+        self.folder = folder
+
+
+    def __str__(self):
+        return f'{self.name}:{self.folder}'
+
+
+    def list(self, folder, exclude=None, after=None, before=None, latest=False, name=None):
+        '''
+        Returns the backup files in the folder ordered by creation time. See select for the filter parameters.
+        '''
+        raise NotImplementedError
+
+
+    def files(self, folder, catalog_dir):
+        '''
+        Returns all the backup files in the folder the fastest way the storage has.
+        The storage may keep its own catalog of the folder in catalog_dir.
+        '''
+        return self.list(folder)
+
+
+    def stat(self, file_id):
+        '''
+        Returns the listing fields of the file along with its parents.
+        '''
+        raise NotImplementedError
+
+
+    def parent(self, file_id):
+        return self.stat(file_id)['parents'][0]
+
+
+    def file_name(self, file_id):
+        return self.stat(file_id)['name']
+
+
+    def upload_file(self, filename, mimetype, name, folder, state_fn=None, md5=None):
+        '''
+        Uploads the file yielding the progress. See cobra.google_drive.upload_file.
+
+        @param md5 The md5 of the file if it's known e.g. saved by the build
+        '''
+        raise NotImplementedError
+
+
+    def upload_stream(self, chunks, mimetype, name, folder):
+        '''
+        Uploads the byte chunks as the file yielding the progress.
+        '''
+        raise NotImplementedError
+
+
+    def upload_bytes(self, data, name, folder, mimetype=None):
+        raise NotImplementedError
+
+
+    def download_file(self, file_id, local_dir=None, use_cache=True, connections=None, reserve=None):
+        '''
+        Downloads the file into local_dir by parts. Yields the file name first and then the download progress,
+        returns the full file name. See cobra.google_drive.download_file for the parameters.
+        '''
+        metadata = self.stat(file_id)
+        fn = metadata['name']
+        yield fn
+        if not local_dir:
+            return self.download_bytes(file_id), fn
+
+        local_dir = realpath(abspath(local_dir))
+        if not os.access(local_dir, os.W_OK):
+            raise FileNotFoundError(f'Target directory is not found or not accessible [{local_dir}]')
+
+        full_fn = join(local_dir, fn)
+        if use_cache and exists(full_fn) and cache_valid(full_fn, metadata):
+            return full_fn
+
+        if reserve:
+            reserve(fn, int(metadata['size']))
+
+        yield from self._download_parts(file_id, metadata, full_fn, connections)
+        return full_fn
+
+
+    def _download_parts(self, file_id, metadata, full_fn, connections=None):
+        '''
+        Fetches the file by the ranges of part size at most the given number of them at a time
+        and checks the result by md5 if the storage knows it.
+        '''
+        size = int(metadata['size'])
+        part_fn = join(dirname(full_fn), f'.{basename(full_fn)}.{rand_str()}.part')
+
+        def fetch(start):
+            data = self.read_range(file_id, start, min(start + self.part_size, size))
+            with open(part_fn, 'r+b') as f:
+                f.seek(start)
+                f.write(data)
+            return len(data)
+
+        with open(part_fn, 'wb') as f:
+            f.truncate(size)
+        try:
+            done = 0
+            with ThreadPoolExecutor(max_workers=connections if connections else self.concurrency) as executor:
+                futures = [executor.submit(fetch, start) for start in range(0, size, self.part_size)]
+                try:
+                    for future in as_completed(futures):
+                        done += future.result()
+                        yield TransferStatus(done, size)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+
+            md5 = metadata.get('md5Checksum')
+            if md5 and _md5(part_fn) != md5:
+                raise CobraApiError(f'Checksum mismatch of the downloaded file [{basename(full_fn)}]')
+        except BaseException:
+            os.remove(part_fn)
+            raise
+
+        os.replace(part_fn, full_fn)
+        if metadata.get('md5Checksum'):
+            save_checksum(full_fn, metadata['md5Checksum'])
+
+
+    def download_stream(self, file_id):
+        '''
+        Yields the file content by chunks.
+        '''
+        raise NotImplementedError
+
+
+    def download_bytes(self, file_id):
+        return b''.join(self.download_stream(file_id))
+
+
+    def read_range(self, file_id, start, end):
+        '''
+        Returns [start, end) bytes of the file.
+        '''
+        raise NotImplementedError
+
+
+    def open(self, file_id, block_cache_dir=None):
+        '''
+        Returns the seekable file object reading only the ranges of the file read.
+        '''
+        metadata = self.stat(file_id)
+        cache_dir = join(block_cache_dir, hashlib.sha1(f'{self.name}:{file_id}:{metadata.get("md5Checksum", "")}'
+                                                       .encode('utf-8')).hexdigest()) if block_cache_dir else None
+        return RangedFile(lambda start, end: self.read_range(file_id, start, end), metadata['name'],
+                          int(metadata['size']), cache_dir)
+
+
+    def ensure_folder(self, parent, name):
+        '''
+        Returns the id of the sub folder with the given name creating it if necessary.
+        '''
+        raise NotImplementedError
+
+
+    def find_file(self, folder, name):
+        '''
+        Returns the id of the file with the given name in the folder or None if there is no such one.
+        '''
+        return self.names_list(folder).get(name)
+
+
+    def names_list(self, folder):
+        '''
+        Returns the dict of all the file names in the folder to their ids.
+        '''
+        raise NotImplementedError
+
+
+    def delete(self, file_ids):
+        raise NotImplementedError
+
+
+def _md5(fn):
+    digest = hashlib.md5()
+    with open(fn, 'rb') as f:
+        for chunk in chunks_of(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DriveStorage(Storage):
+    '''
+    Google Drive folder shared to the service account. See cobra.google_drive.
+    '''
+    name = DRIVE
+    part_size = cobra.google_drive.DOWNLOAD_CHUNK_SIZE
+    concurrency = cobra.google_drive.DEFAULT_CONNECTIONS
+
+    def __init__(self, creds, folder_id):
+        super().__init__(folder_id)
+        self.__creds = creds
+
+
+    def list(self, folder, **filters):
+        return cobra.google_drive.folder_list(self.__creds, folder, **filters)
+
+
+    def files(self, folder, catalog_dir):
+        return cobra.google_drive.FolderCatalog(self.__creds, folder, join(catalog_dir, f'{folder}.json')).files()
+
+
+    def stat(self, file_id):
+        return cobra.google_drive.file_metadata(self.__creds, file_id)
+
+
+    def parent(self, file_id):
+        return cobra.google_drive.file_parents(self.__creds, file_id)[0]
+
+
+    def file_name(self, file_id):
+        return cobra.google_drive.file_name(self.__creds, file_id)
+
+
+    def upload_file(self, filename, mimetype, name, folder, state_fn=None, md5=None):
+        # Drive computes md5 itself
+        return cobra.google_drive.upload_file(self.__creds, filename, mimetype, name, folder, state_fn=state_fn)
+
+
+    def upload_stream(self, chunks, mimetype, name, folder):
+        return cobra.google_drive.upload_stream(self.__creds, chunks, mimetype, name, folder)
+
+
+    def upload_bytes(self, data, name, folder, mimetype=None):
+        if mimetype:
+            return cobra.google_drive.upload_bytes(self.__creds, data, name, folder, mimetype=mimetype)
+        return cobra.google_drive.upload_bytes(self.__creds, data, name, folder)
+
+
+    def download_file(self, file_id, local_dir=None, use_cache=True, connections=None, reserve=None):
+        return cobra.google_drive.download_file(self.__creds, file_id, local_dir, use_cache=use_cache,
+                                                connections=connections, reserve=reserve)
+
+
+    def download_stream(self, file_id):
+        return cobra.google_drive.download_stream(self.__creds, file_id)
+
+
+    def download_bytes(self, file_id):
+        return cobra.google_drive.download_bytes(self.__creds, file_id)
+
+
+    def read_range(self, file_id, start, end):
+        return cobra.google_drive.read_range(self.__creds, file_id, start, end)
+
+
+    def open(self, file_id, block_cache_dir=None):
+        return cobra.google_drive.RemoteFile(self.__creds, file_id, block_cache_dir)
+
+
+    def ensure_folder(self, parent, name):
+        return cobra.google_drive.ensure_folder(self.__creds, parent, name)
+
+
+    def find_file(self, folder, name):
+        return cobra.google_drive.find_file(self.__creds, folder, name)
+
+
+    def names_list(self, folder):
+        return cobra.google_drive.names_list(self.__creds, folder)
+
+
+    def delete(self, file_ids):
+        cobra.google_drive.delete_files(self.__creds, file_ids)
+
+
+class LocalStorage(Storage):
+    '''
+    The directory e.g. the NFS mount. The ids are the paths relative to the directory.
+    The md5 of the files is kept next to them, so listing doesn't read the files.
+    '''
+    name = 'local'
+    part_size = 8*1024*1024
+    concurrency = 1
+
+    def __init__(self, root, folder=None):
+        super().__init__(folder.strip('/') if folder else '')
+        self.__root = realpath(abspath(root))
+
+
+    def __str__(self):
+        return join(self.__root, self.folder) if self.folder else self.__root
+
+
+    def __path(self, file_id):
+        path = realpath(join(self.__root, file_id))
+        if path != self.__root and not path.startswith(self.__root + os.sep):
+            raise CobraApiError(f'The path is outside of the storage directory [{file_id}]')
+        return path
+
+
+    def __entry(self, file_id, md5=None):
+        path = self.__path(file_id)
+        st = os.stat(path)
+        rv = dict(id=file_id, name=basename(file_id), size=str(st.st_size),
+                  createdTime=_created_time(datetime.fromtimestamp(st.st_mtime, timezone.utc)))
+        md5 = md5 if md5 else saved_md5(path)
+        if md5:
+            rv['md5Checksum'] = md5
+        return rv
+
+
+    def list(self, folder, **filters):
+        return select([self.__entry(file_id) for file_id in self.names_list(folder).values()], **filters)
+
+
+    def stat(self, file_id):
+        path = self.__path(file_id)
+        md5 = saved_md5(path)
+        if md5 is None:
+            md5 = _md5(path)
+            save_checksum(path, md5)
+        return dict(self.__entry(file_id, md5), parents=[dirname(file_id)])
+
+
+    def __write(self, chunks, name, folder, total=None):
+        '''
+        Writes the chunks into the file replacing it once all is written. Yields the progress.
+        '''
+        file_id = _joined(folder, name)
+        path = self.__path(file_id)
+        # only the writes create the folders, reading the mistyped path finds nothing
+        os.makedirs(dirname(path), exist_ok=True)
+        temp_fn = join(dirname(path), f'.{name}.{rand_str()}.part')
+        digest = hashlib.md5()
+        done = 0
+        try:
+            with open(temp_fn, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    yield TransferStatus(done, total)
+        except BaseException:
+            # the file may have failed to open
+            if exists(temp_fn):
+                os.remove(temp_fn)
+            raise
+
+        os.replace(temp_fn, path)
+        save_checksum(path, digest.hexdigest())
+        return file_id
+
+
+    def upload_file(self, filename, mimetype, name, folder, state_fn=None, md5=None):
+        # the md5 is computed while writing anyway
+        with open(filename, 'rb') as f:
+            return (yield from self.__write(chunks_of(f, self.part_size), name, folder, os.stat(filename).st_size))
+
+
+    def upload_stream(self, chunks, mimetype, name, folder):
+        return self.__write(chunks, name, folder)
+
+
+    def upload_bytes(self, data, name, folder, mimetype=None):
+        for _ in self.__write([data], name, folder, len(data)):
+            pass
+        return dict(id=_joined(folder, name))
+
+
+    def download_stream(self, file_id):
+        with open(self.__path(file_id), 'rb') as f:
+            yield from chunks_of(f, self.part_size)
+
+
+    def read_range(self, file_id, start, end):
+        with open(self.__path(file_id), 'rb') as f:
+            return os.pread(f.fileno(), end - start, start)
+
+
+    def open(self, file_id, block_cache_dir=None):
+        # the file is at hand, there is nothing to cache
+        return super().open(file_id)
+
+
+    def ensure_folder(self, parent, name):
+        folder = _joined(parent, name)
+        os.makedirs(self.__path(folder), exist_ok=True)
+        return folder
+
+
+    def names_list(self, folder):
+        path = self.__path(folder)
+        if not isdir(path):
+            return dict()
+
+        return { fn: _joined(folder, fn) for fn in sorted(os.listdir(path))
+                 if not fn.startswith('.') and isfile(join(path, fn)) }
+
+
+    def delete(self, file_ids):
+        for file_id in file_ids:
+            path = self.__path(file_id)
+            os.remove(path)
+            checksum_fn = join(dirname(path), f'.{basename(path)}.md5')
+            if exists(checksum_fn):
+                os.remove(checksum_fn)
+
+
+class S3Storage(Storage):
+    '''
+    The bucket of S3 or of the compatible service e.g. MinIO. The ids are the object keys, the folders are
+    the key prefixes. It requires boto3, the credentials are found the way boto3 does it e.g. by AWS_ACCESS_KEY_ID
+    and AWS_SECRET_ACCESS_KEY environment variables. The md5 of the uploaded files is kept in the object metadata
+    as the multipart upload ETag is not the md5.
+    '''
+    name = 's3'
+    # the parts must be at least 5 MiB but the last one
+    part_size = 16*1024*1024
+    concurrency = 8
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None):
+        '''
+        @param client The boto3 S3 client or the compatible object. If not given it's created.
+        '''
+        super().__init__(prefix.strip('/') if prefix else '')
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise CobraCliError('S3 storage requires boto3 to be installed: pip install boto3')
+            client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.__client = client
+        self.__bucket = bucket
+
+
+    def __str__(self):
+        return f's3://{_joined(self.__bucket, self.folder)}'
+
+
+    def __objects(self, prefix, delimiter='/'):
+        kwargs = dict(Bucket=self.__bucket, Prefix=prefix, Delimiter=delimiter)
+        while True:
+            page = self.__client.list_objects_v2(**kwargs)
+            yield from page.get('Contents', [])
+            if not page.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+    def __entry(self, key, size, modified, etag, md5=None):
+        etag = etag.strip('"')
+        # the ETag of the object uploaded by single request is its md5
+        md5 = md5 if md5 else (etag if '-' not in etag else None)
+        rv = dict(id=key, name=basename(key), size=str(size), createdTime=_created_time(modified))
+        if md5:
+            rv['md5Checksum'] = md5
+        return rv
+
+
+    def list(self, folder, **filters):
+        files = [self.__entry(o['Key'], o['Size'], o['LastModified'], o['ETag'])
+                 for o in self.__objects(f'{folder}/' if folder else '')
+                 if not basename(o['Key']).startswith('.')]
+        return select(files, **filters)
+
+
+    def stat(self, file_id):
+        head = self.__client.head_object(Bucket=self.__bucket, Key=file_id)
+        return dict(self.__entry(file_id, head['ContentLength'], head['LastModified'], head['ETag'],
+                                 head.get('Metadata', dict()).get('md5')), parents=[dirname(file_id)])
+
+
+    def upload_file(self, filename, mimetype, name, folder, state_fn=None, md5=None):
+        key = _joined(folder, name)
+        size = os.stat(filename).st_size
+        md5 = md5 if md5 else saved_md5(filename)
+        if size <= self.part_size:
+            with open(filename, 'rb') as f:
+                data = f.read()
+            self.__client.put_object(Bucket=self.__bucket, Key=key, Body=data, ContentType=mimetype,
+                                     Metadata=dict(md5=md5 if md5 else hashlib.md5(data).hexdigest()))
+            yield TransferStatus(size, size)
+            return key
+
+        # not to read the file twice the md5 not known is computed while the parts are read in order
+        digest = None if md5 else hashlib.md5()
+        with open(filename, 'rb') as f:
+            def read(start):
+                data = os.pread(f.fileno(), self.part_size, start)
+                if digest is not None:
+                    digest.update(data)
+                return data
+
+            yield from self.__multipart((read(start) for start in range(0, size, self.part_size)), key, mimetype,
+                                        size, dict(md5=md5) if md5 else None)
+
+        if digest is not None:
+            self.__replace_metadata(key, mimetype, size, dict(md5=digest.hexdigest()))
+        return key
+
+
+    def upload_stream(self, chunks, mimetype, name, folder):
+        key = _joined(folder, name)
+        digest = hashlib.md5()
+        parts = rechunk(hashing(chunks, digest), self.part_size)
+        first = next(parts, b'')
+        second = next(parts, None)
+        if second is None:
+            self.__client.put_object(Bucket=self.__bucket, Key=key, Body=first, ContentType=mimetype,
+                                     Metadata=dict(md5=digest.hexdigest()))
+            yield TransferStatus(len(first))
+            return key
+
+        size = 0
+        for status in self.__multipart(chain((first, second), parts), key, mimetype):
+            size = status.resumable_progress
+            yield status
+        # the md5 is known once the whole stream is read
+        self.__replace_metadata(key, mimetype, size, dict(md5=digest.hexdigest()))
+        return key
+
+
+    def __replace_metadata(self, key, mimetype, size, metadata):
+        '''
+        Replaces the metadata of the object by copying it onto itself. The object larger than 
+        the single copy takes is copied by the multipart upload of the ranges.
+        '''
+        source = dict(Bucket=self.__bucket, Key=key)
+        if size <= S3_MAX_COPY_SIZE:
+            self.__client.copy_object(Bucket=self.__bucket, Key=key, CopySource=source, ContentType=mimetype,
+                                      Metadata=metadata, MetadataDirective='REPLACE')
+            return
+
+        upload_id = self.__client.create_multipart_upload(Bucket=self.__bucket, Key=key, ContentType=mimetype,
+                                                          Metadata=metadata)['UploadId']
+        try:
+            parts = list()
+            for number, start in enumerate(range(0, size, S3_MAX_COPY_SIZE), start=1):
+                end = min(start + S3_MAX_COPY_SIZE, size) - 1
+                rv = self.__client.upload_part_copy(Bucket=self.__bucket, Key=key, UploadId=upload_id, 
+                                                    PartNumber=number, CopySource=source,
+                                                    CopySourceRange=f'bytes={start}-{end}')
+                parts.append(dict(PartNumber=number, ETag=rv['CopyPartResult']['ETag']))
+            self.__client.complete_multipart_upload(Bucket=self.__bucket, Key=key, UploadId=upload_id,
+                                                    MultipartUpload=dict(Parts=parts))
+        except BaseException:
+            self.__client.abort_multipart_upload(Bucket=self.__bucket, Key=key, UploadId=upload_id)
+            raise
+
+
+    def __multipart(self, parts, key, mimetype, size=None, metadata=None):
+        '''
+        Uploads the parts by the multipart upload at most concurrency ones at a time, so only that many parts
+        are kept in memory. The upload is aborted on failure.
+        '''
+        kwargs = dict(Metadata=metadata) if metadata else dict()
+        upload_id = self.__client.create_multipart_upload(Bucket=self.__bucket, Key=key, ContentType=mimetype,
+                                                          **kwargs)['UploadId']
+
+        def send(number, data):
+            rv = self.__client.upload_part(Bucket=self.__bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                           Body=data)
+            return number, rv['ETag'], len(data)
+
+        etags = dict()
+        done = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                pending = set()
+                for number, data in enumerate(parts, start=1):
+                    pending.add(executor.submit(send, number, data))
+                    # the slow uploads hold the reading of the next parts back
+                    while len(pending) >= self.concurrency:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            number, etag, length = future.result()
+                            etags[number] = etag
+                            done += length
+                            yield TransferStatus(done, size)
+
+                for future in as_completed(pending):
+                    number, etag, length = future.result()
+                    etags[number] = etag
+                    done += length
+                    yield TransferStatus(done, size)
+
+            self.__client.complete_multipart_upload(
+                Bucket=self.__bucket, Key=key, UploadId=upload_id,
+                MultipartUpload=dict(Parts=[dict(PartNumber=n, ETag=etags[n]) for n in sorted(etags)]))
+        except BaseException:
+            self.__client.abort_multipart_upload(Bucket=self.__bucket, Key=key, UploadId=upload_id)
+            raise
+
+
+    def upload_bytes(self, data, name, folder, mimetype=None):
+        key = _joined(folder, name)
+        self.__client.put_object(Bucket=self.__bucket, Key=key, Body=data,
+                                 ContentType=mimetype if mimetype else 'application/octet-stream',
+                                 Metadata=dict(md5=hashlib.md5(data).hexdigest()))
+        return dict(id=key)
+
+
+    def download_stream(self, file_id):
+        body = self.__client.get_object(Bucket=self.__bucket, Key=file_id)['Body']
+        yield from chunks_of(body, self.part_size)
+
+
+    def read_range(self, file_id, start, end):
+        return self.__client.get_object(Bucket=self.__bucket, Key=file_id, Range=f'bytes={start}-{end - 1}')['Body'].read()
+
+
+    def ensure_folder(self, parent, name):
+        # the folders are just the key prefixes
+        return _joined(parent, name)
+
+
+    def names_list(self, folder):
+        return { basename(o['Key']): o['Key'] for o in self.__objects(f'{folder}/' if folder else '') }
+
+
+    def delete(self, file_ids):
+        file_ids = list(file_ids)
+        for i in range(0, len(file_ids), S3_DELETE_BATCH):
+            batch = file_ids[i:i + S3_DELETE_BATCH]
+            rv = self.__client.delete_objects(Bucket=self.__bucket,
+                                              Delete=dict(Objects=[dict(Key=k) for k in batch], Quiet=True))
+            if rv.get('Errors'):
+                raise CobraApiError(f'Failed to delete {[e["Key"] for e in rv["Errors"]]}', rv['Errors'])
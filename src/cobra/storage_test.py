@@ -0,0 +1,280 @@
+from cobra.storage import open_storage, select, destinations, DriveStorage, LocalStorage, S3Storage
+from cobra.exc import CobraApiError, CobraCliError
+
+import pytest
+import hashlib
+import io
+import os
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+
+class FakeS3:
+    '''
+    Keeps the objects in memory answering the calls the way boto3 S3 client does.
+    '''
+    def __init__(self, page_size=1000):
+        self.objects = dict()
+        self.uploads = dict()
+        self.aborted = list()
+        self.page_size = page_size
+        self.fail_part = None
+
+
+    def __put(self, key, data, metadata=None, etag=None):
+        self.objects[key] = dict(data=data, metadata=metadata if metadata else dict(),
+                                 etag=f'"{etag if etag else hashlib.md5(data).hexdigest()}"',
+                                 modified=datetime(2023, 2, 1, len(self.objects) % 24, tzinfo=timezone.utc))
+
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None):
+        self.__put(Key, Body, Metadata)
+
+
+    def head_object(self, Bucket, Key):
+        o = self.objects[Key]
+        return dict(ContentLength=len(o['data']), LastModified=o['modified'], ETag=o['etag'], Metadata=o['metadata'])
+
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]['data']
+        if Range:
+            start, end = Range[len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1]
+        return dict(Body=io.BytesIO(data))
+
+
+    def list_objects_v2(self, Bucket, Prefix, Delimiter, ContinuationToken=None):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix) and Delimiter not in k[len(Prefix):])
+        start = int(ContinuationToken) if ContinuationToken else 0
+        page = keys[start:start + self.page_size]
+        rv = dict(Contents=[dict(Key=k, Size=len(self.objects[k]['data']), LastModified=self.objects[k]['modified'],
+                                 ETag=self.objects[k]['etag']) for k in page],
+                  IsTruncated=start + self.page_size < len(keys))
+        if rv['IsTruncated']:
+            rv['NextContinuationToken'] = str(start + self.page_size)
+        return rv
+
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None):
+        upload_id = f'upload{len(self.uploads)}'
+        self.uploads[upload_id] = dict(parts=dict(), metadata=Metadata)
+        return dict(UploadId=upload_id)
+
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise IOError('Connection reset')
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        return dict(ETag=f'"etag{PartNumber}"')
+
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        parts = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        assert parts == sorted(upload['parts'])
+        self.__put(Key, b''.join(upload['parts'][n] for n in parts), upload['metadata'], etag=f'multipart-{len(parts)}')
+
+
+    def upload_part_copy(self, Bucket, Key, UploadId, PartNumber, CopySource, CopySourceRange):
+        start, end = CopySourceRange[len('bytes='):].split('-')
+        data = self.objects[CopySource['Key']]['data'][int(start):int(end) + 1]
+        self.uploads[UploadId]['parts'][PartNumber] = data
+        return dict(CopyPartResult=dict(ETag=f'"etag{PartNumber}"'))
+
+
+    def copy_object(self, Bucket, Key, CopySource, MetadataDirective, ContentType=None, Metadata=None):
+        assert MetadataDirective == 'REPLACE'
+        source = self.objects[CopySource['Key']]
+        self.__put(Key, source['data'], Metadata, etag=source['etag'].strip('"'))
+
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(UploadId)
+
+
+    def delete_objects(self, Bucket, Delete):
+        assert len(Delete['Objects']) <= 1000
+        for o in Delete['Objects']:
+            del self.objects[o['Key']]
+        return dict()
+
+
+@pytest.fixture
+def s3():
+    return FakeS3()
+
+
+@pytest.fixture
+def s3_storage(s3):
+    storage = S3Storage('bucket', 'host1', client=s3)
+    storage.part_size = 1024
+    return storage
+
+
+def drain(gen):
+    try:
+        while True:
+            next(gen)
+    except StopIteration as e:
+        return e.value
+
+
+def test_open_storage_must_tell_storage_by_url(tmp_path):
+    assert isinstance(open_storage(None, 'creds.json', 'folder-id'), DriveStorage)
+    assert open_storage('drive', 'creds.json', 'folder-id').folder == 'folder-id'
+    local = open_storage(f'file://{tmp_path}', folder_id='host1')
+    assert isinstance(local, LocalStorage) and local.folder == 'host1'
+    assert not (tmp_path / 'host1').exists()
+    assert local.list(local.folder) == list()
+    assert not (tmp_path / 'host1').exists()
+    assert isinstance(open_storage(str(tmp_path)), LocalStorage)
+    with patch('cobra.storage.S3Storage') as s3_mock:
+        open_storage('s3://bucket/backups/', folder_id='host1', endpoint_url='http://minio:9000')
+    s3_mock.assert_called_once_with('bucket', 'backups/host1', 'http://minio:9000')
+    with pytest.raises(CobraCliError):
+        open_storage('ftp://host/dir')
+
+
+
+def test_destinations_must_pair_storages_with_folders():
+    assert destinations() == [(None, None)]
+    assert destinations('drive', 'folder-id') == [('drive', 'folder-id')]
+    assert destinations(None, ['id1', 'id2']) == [(None, 'id1'), (None, 'id2')]
+    assert destinations(['/mnt/nfs', 's3://bucket'], ['host1']) == [('/mnt/nfs', 'host1'), ('s3://bucket', 'host1')]
+    assert destinations(['drive', '/mnt/nfs'], ['id1', 'host1']) == [('drive', 'id1'), ('/mnt/nfs', 'host1')]
+    with pytest.raises(CobraCliError):
+        destinations(['drive', '/mnt/nfs'], ['id1', 'id2', 'id3'])
+
+def test_select_must_filter_and_order_by_creation_time():
+    files = [dict(id='2', name='backup@2.tar.gz', createdTime='2023-02-02T00:00:00.000Z'),
+             dict(id='1', name='backup@1.tar.gz', createdTime='2023-02-01T00:00:00.000Z'),
+             dict(id='3', name='daily@3.tar.gz', createdTime='2023-02-03T00:00:00.000Z')]
+    assert [f['id'] for f in select(files)] == ['1', '2', '3']
+    assert [f['id'] for f in select(files, exclude='daily', latest=True)] == ['2']
+    assert [f['id'] for f in select(files, after=datetime(2023, 2, 1, 12, tzinfo=timezone.utc))] == ['2', '3']
+    assert [f['id'] for f in select(files, name='backup@1.tar.gz')] == ['1']
+
+
+def test_drive_storage_must_delegate_to_drive():
+    storage = DriveStorage('creds.json', 'folder-id')
+    with patch('cobra.google_drive.folder_list') as folder_list_mock, \
+         patch('cobra.google_drive.download_file') as download_file_mock:
+        storage.list(storage.folder, name='backup.tar.gz')
+        storage.download_file('file-id', '/cache', use_cache=False)
+    folder_list_mock.assert_called_once_with('creds.json', 'folder-id', name='backup.tar.gz')
+    download_file_mock.assert_called_once_with('creds.json', 'file-id', '/cache', use_cache=False, connections=None,
+                                               reserve=None)
+
+
+def test_local_storage_must_upload_list_and_download(tmp_path):
+    storage = LocalStorage(str(tmp_path / 'storage'), 'host1')
+    data = os.urandom(100000)
+    (tmp_path / 'backup@1.tar.gz').write_bytes(data)
+    file_id = drain(storage.upload_file(str(tmp_path / 'backup@1.tar.gz'), 'application/gzip', 'backup@1.tar.gz',
+                                        storage.folder))
+    assert file_id == 'host1/backup@1.tar.gz'
+    storage.upload_bytes(b'{}', 'backup@1.tar.gz.manifest.json', storage.ensure_folder(storage.folder, 'manifests'))
+
+    files = storage.list(storage.folder)
+    assert [(f['id'], f['size'], f['md5Checksum']) for f in files] == \
+        [(file_id, str(len(data)), hashlib.md5(data).hexdigest())]
+    assert storage.names_list('host1/manifests') == { 'backup@1.tar.gz.manifest.json': 'host1/manifests/backup@1.tar.gz.manifest.json' }
+    assert storage.parent(file_id) == 'host1'
+
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    gen = storage.download_file(file_id, str(cache_dir))
+    assert next(gen) == 'backup@1.tar.gz'
+    assert drain(gen) == str(cache_dir / 'backup@1.tar.gz')
+    assert (cache_dir / 'backup@1.tar.gz').read_bytes() == data
+    assert storage.open(file_id).read() == data
+
+    storage.delete([file_id])
+    assert storage.list(storage.folder) == list()
+    assert os.listdir(tmp_path / 'storage' / 'host1') == ['manifests']
+
+
+def test_local_storage_must_report_write_error(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with patch('builtins.open', side_effect=PermissionError('Permission denied')), \
+         pytest.raises(PermissionError, match='Permission denied'):
+        storage.upload_bytes(b'data', 'backup@1.tar.gz', '')
+
+
+def test_local_storage_must_not_escape_root(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with pytest.raises(CobraApiError):
+        storage.stat('../etc/passwd')
+
+
+def test_s3_storage_must_upload_by_parts_and_download_by_ranges(tmp_path, s3, s3_storage):
+    data = os.urandom(10000)
+    (tmp_path / 'backup@1.tar.gz').write_bytes(data)
+    drain(s3_storage.upload_file(str(tmp_path / 'backup@1.tar.gz'), 'application/gzip', 'backup@1.tar.gz',
+                                 s3_storage.folder))
+    assert s3.objects['host1/backup@1.tar.gz']['data'] == data
+    # the multipart ETag is not md5, it's kept in the metadata
+    assert 'md5Checksum' not in s3_storage.list(s3_storage.folder)[0]
+    assert s3_storage.stat('host1/backup@1.tar.gz')['md5Checksum'] == hashlib.md5(data).hexdigest()
+
+    (tmp_path / 'cache').mkdir()
+    gen = s3_storage.download_file('host1/backup@1.tar.gz', str(tmp_path / 'cache'))
+    assert next(gen) == 'backup@1.tar.gz'
+    assert len([status for status in gen]) == 10
+    assert (tmp_path / 'cache' / 'backup@1.tar.gz').read_bytes() == data
+
+
+@pytest.mark.parametrize('size, max_copy_size', [(500, None), (10000, None), (10000, 3000)])
+def test_s3_storage_must_keep_md5_of_stream(s3, s3_storage, size, max_copy_size):
+    data = os.urandom(size)
+    with patch('cobra.storage.S3_MAX_COPY_SIZE', max_copy_size or 5*1024**3):
+        drain(s3_storage.upload_stream(iter([data[i:i + 700] for i in range(0, size, 700)]), 'application/gzip',
+                                       'backup@1.tar.gz', s3_storage.folder))
+    assert s3.objects['host1/backup@1.tar.gz']['data'] == data
+    assert s3_storage.stat('host1/backup@1.tar.gz')['md5Checksum'] == hashlib.md5(data).hexdigest()
+    assert s3.uploads == dict()
+
+
+def test_s3_storage_must_read_file_once_and_take_md5_known(tmp_path, s3, s3_storage):
+    data = os.urandom(10000)
+    (tmp_path / 'backup@1.tar.gz').write_bytes(data)
+    md5 = hashlib.md5(data).hexdigest()
+    with patch('builtins.open', wraps=open) as open_mock, patch.object(s3, 'copy_object', wraps=s3.copy_object) as copy_mock:
+        drain(s3_storage.upload_file(str(tmp_path / 'backup@1.tar.gz'), 'application/gzip', 'backup@1.tar.gz',
+                                     s3_storage.folder))
+    open_mock.assert_called_once()
+    # the md5 computed while uploading is put once the upload is done
+    copy_mock.assert_called_once()
+    assert s3_storage.stat('host1/backup@1.tar.gz')['md5Checksum'] == md5
+
+    with patch.object(s3, 'copy_object') as copy_mock:
+        drain(s3_storage.upload_file(str(tmp_path / 'backup@1.tar.gz'), 'application/gzip', 'backup@2.tar.gz',
+                                     s3_storage.folder, md5='known'))
+    copy_mock.assert_not_called()
+    assert s3_storage.stat('host1/backup@2.tar.gz')['md5Checksum'] == 'known'
+
+
+def test_s3_storage_must_abort_failed_multipart_upload(s3, s3_storage):
+    s3.fail_part = 3
+    with pytest.raises(IOError):
+        drain(s3_storage.upload_stream(iter([os.urandom(700) for _ in range(10)]), 'application/gzip',
+                                       'backup@1.tar.gz', s3_storage.folder))
+    assert s3.aborted == ['upload0']
+    assert s3.objects == dict()
+
+
+def test_s3_storage_must_list_by_pages_and_delete_by_batches(s3, s3_storage):
+    s3.page_size = 2
+    for i in range(5):
+        s3_storage.upload_bytes(b'data', f'backup@{i}.tar.gz', s3_storage.folder)
+    s3_storage.upload_bytes(b'{}', 'backup@0.tar.gz.manifest.json', s3_storage.ensure_folder(s3_storage.folder, 'manifests'))
+
+    files = s3_storage.list(s3_storage.folder)
+    assert [f['name'] for f in files] == [f'backup@{i}.tar.gz' for i in range(5)]
+    assert all(f['md5Checksum'] == hashlib.md5(b'data').hexdigest() for f in files)
+    assert s3_storage.find_file('host1/manifests', 'backup@0.tar.gz.manifest.json') == 'host1/manifests/backup@0.tar.gz.manifest.json'
+
+    s3_storage.delete(f['id'] for f in files)
+    assert list(s3.objects) == ['host1/manifests/backup@0.tar.gz.manifest.json']
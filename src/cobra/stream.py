@@ -0,0 +1,382 @@
+from cobra.aux_stuff import rand_str
+
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+from collections import OrderedDict
+from os.path import join, exists
+import io
+import os
+import time
+
+
+QUEUE_SIZE = 8
+BLOCK_SIZE = 1024*1024
+MEMORY_BLOCKS = 8
+_EOF = object()
+_ABORT = object()
+
+
+class _QueueWriter(io.RawIOBase):
+    def __init__(self, queue, stop):
+        self.__queue = queue
+        self.__stop = stop
+
+
+    def writable(self):
+        return True
+
+
+    def write(self, b):
+        if self.__stop.is_set():
+            raise BrokenPipeError('The consumer has gone')
+
+        self.__queue.put(bytes(b))
+        return len(b)
+
+
+def produce(write, maxsize=QUEUE_SIZE):
+    '''
+    Turns the writer into the reader. Runs write(fileobj) in a separate thread 
+    and yields what has been written to fileobj. At most maxsize writes are kept in memory.
+    The exception raised by write is propagated to the consumer.
+    '''
+    queue = Queue(maxsize)
+    stop = Event()
+    errors = list()
+
+    def run():
+        try:
+            write(_QueueWriter(queue, stop))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if not stop.is_set():
+                queue.put(_EOF)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = queue.get()
+            if chunk is _EOF:
+                break
+            yield chunk
+    finally:
+        stop.set()
+        # unblock the writer if the consumer leaves early
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+
+def fan_out(chunks, consumers, maxsize=QUEUE_SIZE):
+    '''
+    Reads the chunks once and feeds them to all the consumers, each is run in its own thread 
+    and called with the chunks iterator. At most maxsize chunks are kept for every consumer, 
+    so the slowest one holds the reading back. The failed consumer is dropped while the rest carry on.
+    Returns the list of (result, exception) pairs in the order of the consumers.
+    If reading the chunks fails the consumers get BrokenPipeError and the exception is propagated.
+    '''
+    queues = [Queue(maxsize) for _ in consumers]
+    gone = [Event() for _ in consumers]
+    results = [(None, None)] * len(consumers)
+
+    def read(queue):
+        while True:
+            chunk = queue.get()
+            if chunk is _EOF:
+                return
+            if chunk is _ABORT:
+                raise BrokenPipeError('The source has failed')
+            yield chunk
+
+    def run(i, consumer):
+        try:
+            results[i] = consumer(read(queues[i])), None
+        except BaseException as e:
+            results[i] = None, e
+        finally:
+            gone[i].set()
+
+    def put(item):
+        for queue, done in zip(queues, gone):
+            # the consumer gone doesn't take anything anymore
+            while not done.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    break
+                except Full:
+                    pass
+
+    threads = [Thread(target=run, args=(i, consumer), daemon=True) for i, consumer in enumerate(consumers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for chunk in chunks:
+            if all(done.is_set() for done in gone):
+                break
+            put(chunk)
+    except BaseException:
+        put(_ABORT)
+        for thread in threads:
+            thread.join()
+        raise
+
+    put(_EOF)
+    for thread in threads:
+        thread.join()
+
+    return results
+
+
+class IterReader(io.RawIOBase):
+    '''
+    File-like object reading from the byte chunks iterable.
+    '''
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__chunk = memoryview(b'')
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, b):
+        while not self.__chunk:
+            try:
+                self.__chunk = memoryview(next(self.__chunks))
+            except StopIteration:
+                return 0
+
+        n = min(len(b), len(self.__chunk))
+        b[:n] = self.__chunk[:n]
+        self.__chunk = self.__chunk[n:]
+        return n
+
+
+def chunks_of(fileobj, chunk_size=1024*1024):
+    return iter(lambda: fileobj.read(chunk_size), b'')
+
+
+def tee(chunks, fileobj):
+    '''
+    Writes every chunk to fileobj while passing it through.
+    '''
+    for chunk in chunks:
+        fileobj.write(chunk)
+        yield chunk
+
+
+def hashing(chunks, digest):
+    '''
+    Updates the digest with every chunk while passing it through.
+    '''
+    for chunk in chunks:
+        digest.update(chunk)
+        yield chunk
+
+
+class RateLimit:
+    '''
+    Paces the bytes passed to rate bytes per second on average since the first ones.
+    Shared by several threads it limits all of them together.
+    '''
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__start = None
+        self.__passed = 0
+        self.__lock = Lock()
+
+
+    def consume(self, size):
+        '''
+        Counts size bytes as passed and sleeps while they are ahead of the rate. Returns the time slept.
+        '''
+        with self.__lock:
+            now = self.__clock()
+            if self.__start is None:
+                self.__start = now
+            self.__passed += size
+            ahead = self.__passed / self.rate - (now - self.__start)
+
+        if ahead > 0:
+            self.__sleep(ahead)
+            return ahead
+        return 0
+
+
+def throttle(chunks, limit):
+    '''
+    Passes the chunks through at the rate of the limit. The chunks pass as is if the limit is None.
+    '''
+    if limit is None:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        limit.consume(len(chunk))
+        yield chunk
+
+
+def rechunk(chunks, size):
+    '''
+    Regroups the byte chunks into the ones of the given size, the last one may be shorter.
+    '''
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+
+    if buffer:
+        yield bytes(buffer)
+
+
+def read_exactly(fileobj, size, chunk_size=1024*1024):
+    '''
+    Yields the chunks of the next size bytes of fileobj.
+    '''
+    while size > 0:
+        data = fileobj.read(min(size, chunk_size))
+        if not data:
+            raise EOFError(f'Unexpected end of file, [{size}] more bytes expected')
+        size -= len(data)
+        yield data
+
+
+def skip(chunks, start, size):
+    '''
+    Yields size bytes of the stream starting from start.
+    '''
+    for chunk in chunks:
+        if start >= len(chunk):
+            start -= len(chunk)
+            continue
+
+        chunk = chunk[start:start + size]
+        start = 0
+        size -= len(chunk)
+        yield chunk
+        if size <= 0:
+            return
+
+
+class RangedFile(io.RawIOBase):
+    '''
+    Seekable read only file object fetching only the byte ranges read by read_range(start, end).
+    The data is fetched by blocks, the adjacent missing ones by a single request. 
+    The blocks are cached in cache_dir if given and the few recent ones are kept in memory.
+    '''
+    def __init__(self, read_range, name, size, cache_dir=None, block_size=BLOCK_SIZE):
+        self.__read_range = read_range
+        self.name = name
+        self.__size = size
+        self.__block_size = block_size
+        self.__cache_dir = cache_dir
+        self.__memory = OrderedDict()
+        self.__pos = 0
+        self.fetched = 0
+
+
+    def readable(self):
+        return True
+
+
+    def seekable(self):
+        return True
+
+
+    def tell(self):
+        return self.__pos
+
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.__pos
+        elif whence == io.SEEK_END:
+            offset += self.__size
+
+        if offset < 0:
+            raise ValueError(f'Negative seek position [{offset}]')
+
+        self.__pos = offset
+        return self.__pos
+
+
+    def readinto(self, b):
+        n = min(len(b), self.__size - self.__pos)
+        if n <= 0:
+            return 0
+
+        first = self.__pos // self.__block_size
+        last = (self.__pos + n - 1) // self.__block_size
+        data = self.__blocks(first, last)
+        offset = self.__pos - first * self.__block_size
+        b[:n] = data[offset:offset + n]
+        self.__pos += n
+        return n
+
+
+    def __blocks(self, first, last):
+        blocks = { i: self.__cached(i) for i in range(first, last + 1) }
+        missing = [i for i, block in blocks.items() if block is None]
+        while missing:
+            run = 1
+            while run < len(missing) and missing[run] == missing[0] + run:
+                run += 1
+
+            start = missing[0] * self.__block_size
+            end = min((missing[0] + run) * self.__block_size, self.__size)
+            data = self.__read_range(start, end)
+            self.fetched += len(data)
+            for k in range(run):
+                blocks[missing[k]] = block = data[k * self.__block_size:(k + 1) * self.__block_size]
+                self.__store(missing[k], block)
+            missing = missing[run:]
+
+        return b''.join(blocks[i] for i in range(first, last + 1))
+
+
+    def __cached(self, i):
+        if i in self.__memory:
+            self.__memory.move_to_end(i)
+            return self.__memory[i]
+
+        if self.__cache_dir is None or not exists(join(self.__cache_dir, str(i))):
+            return None
+
+        with open(join(self.__cache_dir, str(i)), 'rb') as f:
+            block = f.read()
+        self.__remember(i, block)
+        return block
+
+
+    def __store(self, i, block):
+        self.__remember(i, block)
+        if self.__cache_dir is None:
+            return
+
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        temp_fn = join(self.__cache_dir, f'{i}.{rand_str()}')
+        with open(temp_fn, 'wb') as f:
+            f.write(block)
+        os.replace(temp_fn, join(self.__cache_dir, str(i)))
+
+
+    def __remember(self, i, block):
+        self.__memory[i] = block
+        self.__memory.move_to_end(i)
+        while len(self.__memory) > MEMORY_BLOCKS:
+            self.__memory.popitem(last=False)
@@ -0,0 +1,138 @@
+from cobra.stream import produce, tee, IterReader, chunks_of, fan_out, RateLimit, throttle
+
+import pytest
+
+import io
+import tarfile
+import threading
+
+
+def test_produce_must_yield_written_data():
+    def write(f):
+        f.write(b'asdf')
+        f.write(b'qwer')
+
+    assert list(produce(write)) == [b'asdf', b'qwer']
+
+
+def test_produce_must_propagate_writer_errors():
+    def write(f):
+        f.write(b'asdf')
+        raise ValueError('writer failed')
+
+    gen = produce(write)
+    assert next(gen) == b'asdf'
+    with pytest.raises(ValueError):
+        next(gen)
+
+
+def test_produce_must_stop_writer_if_consumer_leaves():
+    written = list()
+
+    def write(f):
+        for i in range(100):
+            f.write(b'x')
+            written.append(i)
+
+    gen = produce(write, maxsize=1)
+    next(gen)
+    gen.close()
+    assert len(written) < 100
+
+
+def test_produce_must_stream_tar():
+    def write(f):
+        with tarfile.open(fileobj=f, mode='w|') as tar:
+            info = tarfile.TarInfo('file')
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b'asdf'))
+
+    with tarfile.open(fileobj=io.BytesIO(b''.join(produce(write)))) as tar:
+        assert tar.extractfile('file').read() == b'asdf'
+
+
+def test_tee_must_copy_chunks():
+    f = io.BytesIO()
+    assert list(tee([b'asdf', b'qwer'], f)) == [b'asdf', b'qwer']
+    assert f.getvalue() == b'asdfqwer'
+
+
+def test_iter_reader_must_read_across_chunks():
+    reader = IterReader([b'as', b'', b'dfqw', b'er'])
+    assert b''.join(iter(lambda: reader.read(3), b'')) == b'asdfqwer'
+    assert reader.read() == b''
+
+
+def test_chunks_of_must_split_file():
+    assert list(chunks_of(io.BytesIO(b'asdfqwer'), 3)) == [b'asd', b'fqw', b'er']
+
+
+def test_fan_out_must_feed_all_consumers_and_drop_failed_one():
+    def fail(chunks):
+        next(chunks)
+        raise IOError('Connection reset')
+
+    results = fan_out(iter([b'a', b'b', b'c']), [lambda chunks: b''.join(chunks), fail, lambda chunks: len(list(chunks))])
+    assert results[0] == (b'abc', None)
+    assert isinstance(results[1][1], IOError)
+    assert results[2] == (3, None)
+
+
+def test_fan_out_must_hold_reading_back_by_slowest_consumer():
+    read = list()
+    release = threading.Event()
+
+    def chunks():
+        for i in range(100):
+            read.append(i)
+            yield b'x'
+
+    def slow(chunks):
+        release.wait(timeout=5)
+        return len(list(chunks))
+
+    thread = threading.Thread(target=lambda: read.append(fan_out(chunks(), [slow, lambda c: len(list(c))], maxsize=2)))
+    thread.start()
+    thread.join(timeout=0.5)
+    assert len(read) < 10
+    release.set()
+    thread.join()
+    assert read[-1] == [(100, None), (100, None)]
+
+
+def test_fan_out_must_break_consumers_if_source_fails():
+    def chunks():
+        yield b'a'
+        raise ValueError('source failed')
+
+    errors = list()
+
+    def consume(chunks):
+        try:
+            list(chunks)
+        except BrokenPipeError as e:
+            errors.append(e)
+            raise
+
+    with pytest.raises(ValueError):
+        fan_out(chunks(), [consume, consume])
+    assert len(errors) == 2
+
+
+def test_rate_limit_must_sleep_while_ahead_of_rate():
+    now = [0.0]
+    sleeps = list()
+    sut = RateLimit(100, clock=lambda: now[0], sleep=sleeps.append)
+    assert sut.consume(50) == pytest.approx(0.5)
+    now[0] = 0.5
+    assert sut.consume(50) == pytest.approx(0.5)
+    # behind the rate, nothing to wait for
+    now[0] = 5.0
+    assert sut.consume(100) == 0
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_throttle_must_pass_chunks_through():
+    sut = RateLimit(1000, sleep=lambda s: None)
+    assert list(throttle([b'abc', b'de'], sut)) == [b'abc', b'de']
+    assert list(throttle([b'abc'], None)) == [b'abc']